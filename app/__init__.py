@@ -20,22 +20,46 @@ def get_locale():
     # 其次使用浏览器语言偏好
     return request.accept_languages.best_match(['zh', 'en']) or 'en'
 
-def create_app():
+def create_app(config_class=Config):
     app = Flask(__name__)
-    app.config.from_object(Config)
+    app.config.from_object(config_class)
     
+    from app.db_profiles import configure_engine_options, install_sqlite_pragmas
+    configure_engine_options(app)
     db.init_app(app)
+    install_sqlite_pragmas(app)
     migrate.init_app(app, db)
     login_manager.init_app(app)
     babel.init_app(app, locale_selector=get_locale)
     csrf.init_app(app)
     
+    from app.play_counts import play_counter
+    play_counter.init_app(app)
+    
+    from app.cache import cache
+    cache.init_app(app)
+    
+    from app.http_clients import provider_clients
+    provider_clients.init_app(app)
+    
+    from app.jobs import job_queue
+    job_queue.init_app(app)
+    
+    from app.upload_manifest import upload_manifest
+    upload_manifest.init_app(app)
+    
+    from app.static_assets import static_assets
+    static_assets.init_app(app)
+    
     from app.auth import bp as auth_bp
     app.register_blueprint(auth_bp, url_prefix='/auth')
     
     from app.routes import bp as main_bp
     app.register_blueprint(main_bp)
     
+    from app.commands import register_commands
+    register_commands(app)
+    
     @app.context_processor
     def inject_locale():
         # 提供一个带 language 属性的对象给模板使用
@@ -50,4 +74,20 @@ def create_app():
         from flask_wtf.csrf import generate_csrf
         return dict(csrf_token=generate_csrf)
     
+    from app.audio_metadata import format_duration
+    app.add_template_filter(format_duration, 'duration')
+    
+    @app.context_processor
+    def inject_player_songs():
+        from app.routes import song_player_dict
+        # 首页缓存的是 song_to_dict 生成的字典，已包含播放信息
+        return dict(player_songs=lambda songs: [
+            song if isinstance(song, dict) else song_player_dict(song) for song in songs
+        ])
+    
+    @app.context_processor
+    def inject_image_variants():
+        from app.image_variants import image_variants
+        return dict(image_variants=image_variants)
+    
     return app
\ No newline at end of file
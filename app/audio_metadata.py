@@ -0,0 +1,117 @@
+import os
+
+import mutagen
+from flask import current_app
+
+from app import db
+from app.jobs import enqueue, job_handler
+from app.models import Song
+
+# 可从标签填充的歌曲字段：(mutagen easy 接口的键, ID3 帧名)，WAV 的 ID3 标签没有 easy 接口
+TAG_KEYS = {
+    'title': ('title', 'TIT2'),
+    'artist': ('artist', 'TPE1'),
+    'album': ('album', 'TALB'),
+    'genre': ('genre', 'TCON'),
+}
+TAG_FIELDS = tuple(TAG_KEYS)
+
+
+def _tag(tags, keys):
+    for key in keys:
+        try:
+            value = tags[key]
+        except (KeyError, ValueError):
+            continue
+        value = getattr(value, 'text', value)
+        if isinstance(value, (list, tuple)):
+            value = value[0] if value else ''
+        value = str(value).strip()
+        if value:
+            return value
+    return None
+
+
+def read_metadata(path):
+    """
+    读取音频的时长（秒）和标签，无法识别时返回 None
+
+    mutagen 只按需读取文件头和标签块，不会解码或读完整个文件。
+    """
+    try:
+        audio = mutagen.File(path, easy=True)
+    except (mutagen.MutagenError, OSError) as e:
+        print(f"Error reading metadata of {path}: {e}")
+        return None
+    if audio is None:
+        return None
+
+    metadata = {'duration': None}
+    length = getattr(audio.info, 'length', None)
+    if length:
+        metadata['duration'] = int(round(length))
+    if audio.tags is not None:
+        for field, keys in TAG_KEYS.items():
+            metadata[field] = _tag(audio.tags, keys)
+    return metadata
+
+
+def apply_metadata(song, metadata, fill=()):
+    """写入时长；fill 中的字段（上传时留空的）用标签填充。返回是否有改动"""
+    changed = False
+    if metadata.get('duration') and song.duration != metadata['duration']:
+        song.duration = metadata['duration']
+        changed = True
+    for field in fill:
+        value = metadata.get(field)
+        if value:
+            setattr(song, field, value[:getattr(Song, field).type.length])
+            changed = True
+    return changed
+
+
+def audio_path(file_path):
+    return os.path.join(current_app.root_path, 'static', file_path)
+
+
+def empty_fields(song):
+    return [field for field in TAG_FIELDS if not (getattr(song, field) or '').strip()]
+
+
+def enqueue_metadata(song, fill=(), fetch_cover=False):
+    """
+    在调用方的会话中加入提取元数据的任务（歌曲须已 flush），随调用方的事务提交
+
+    fetch_cover 为真时在标签填好后再搜索封面，搜索用到的标题和艺术家可能来自标签。
+    """
+    enqueue('extract_metadata', {'song_id': song.id, 'fill': list(fill), 'fetch_cover': fetch_cover},
+            dedup_key=f'metadata:{song.id}')
+
+
+@job_handler('extract_metadata')
+def extract_metadata_job(payload):
+    song = db.session.get(Song, payload['song_id'])
+    if song is None:
+        return
+
+    # 无法识别的文件重试也不会成功，只记录日志
+    metadata = read_metadata(audio_path(song.file_path))
+    changed = metadata is not None and apply_metadata(song, metadata, payload.get('fill', ()))
+    if payload.get('fetch_cover'):
+        from app.covers import cover_job_key
+        enqueue('fetch_cover', {'song_id': song.id}, dedup_key=cover_job_key(song.id))
+    db.session.commit()
+    if changed and song.visibility == 'public':
+        from app.routes import invalidate_home_sections
+        invalidate_home_sections()
+
+
+def format_duration(seconds):
+    """模板过滤器：秒数显示为 m:ss，超过一小时显示为 h:mm:ss"""
+    if not seconds:
+        return '--:--'
+    hours, rest = divmod(int(seconds), 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f'{hours}:{minutes:02d}:{seconds:02d}'
+    return f'{minutes}:{seconds:02d}'
@@ -0,0 +1,168 @@
+import hashlib
+import mimetypes
+import os
+import posixpath
+import tempfile
+import time
+
+from flask import current_app, request, abort
+from werkzeug.utils import send_file
+
+from app import db
+from app.blob_store import place_blob, release_blob
+from app.models import Song
+from app.upload_manifest import upload_manifest
+from app.waveform import remove_waveform
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def audio_dir():
+    return os.path.join(current_app.root_path, 'static', 'uploads', 'audio')
+
+
+def stored_audio_path(filename):
+    # 数据库中的相对路径（统一用 / 分隔符以支持跨平台）
+    return f'uploads/audio/{filename}'
+
+
+def store_audio_stream(stream, ext, save_dir=None):
+    """
+    把上传的音频分块写入临时文件，边写边计算 SHA-256，完成后按内容哈希命名
+
+    相同内容的文件只保存一份，重复上传时直接丢弃临时文件。返回文件名。
+    """
+    save_dir = save_dir or audio_dir()
+    os.makedirs(save_dir, exist_ok=True)
+    digest = hashlib.sha256()
+    fd, temp_path = tempfile.mkstemp(dir=save_dir, prefix='.upload-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                f.write(chunk)
+        return commit_blob(temp_path, save_dir, f"{digest.hexdigest()}.{ext.lower()}")
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def commit_blob(temp_path, save_dir, filename):
+    """把已写完的临时文件放到内容哈希对应的文件名；已存在相同内容时在当前事务提交后丢弃临时文件"""
+    place_blob(db.session, temp_path, os.path.join(save_dir, filename))
+    return filename
+
+
+def release_audio(file_path):
+    """
+    歌曲不再使用该音频后调用（须在提交之后）；没有其他歌曲引用时删除文件
+
+    返回是否删除了文件。
+    """
+    if not file_path:
+        return False
+    audio_path = os.path.join(current_app.root_path, 'static', file_path)
+    released = release_blob(
+        audio_path, lambda: db.session.query(Song.id).filter(Song.file_path == file_path).first() is not None
+    )
+    if released or not os.path.exists(audio_path):
+        remove_waveform(file_path)
+    return released
+
+
+def purge_orphaned_audio(min_age, dry_run=False):
+    """
+    删除音频目录中没有歌曲引用的文件（及其波形），返回文件名列表
+
+    刚写入、歌曲记录尚未提交的文件同样没有引用，只处理修改时间早于 min_age 秒的文件。
+    """
+    directory = audio_dir()
+    if not os.path.isdir(directory):
+        return []
+    referenced = {path for (path,) in db.session.query(Song.file_path).distinct()}
+    cutoff = time.time() - min_age
+    orphans = []
+    with os.scandir(directory) as it:
+        for entry in it:
+            if entry.name.startswith('.') or not entry.is_file():
+                continue
+            if stored_audio_path(entry.name) in referenced or entry.stat().st_mtime > cutoff:
+                continue
+            orphans.append(entry.name)
+    if not dry_run:
+        for filename in orphans:
+            remove_waveform(stored_audio_path(filename))
+            path = os.path.join(directory, filename)
+            os.remove(path)
+            upload_manifest.record(path)
+    return sorted(orphans)
+
+
+def is_audio_static_path(filename):
+    """static 路由的文件名是否指向音频目录；音频只能通过 send_audio 按歌曲可见性访问"""
+    return posixpath.normpath(filename or '').lower().startswith('uploads/audio/')
+
+
+def send_audio(file_path):
+    """
+    返回歌曲音频的响应，支持 Range（206）、强 ETag 和 Last-Modified
+
+    文件按内容哈希命名，ETag 直接使用哈希。
+    AUDIO_SEND_MODE：
+      sendfile   由本进程发送，WSGI 服务器提供 wsgi.file_wrapper 时零拷贝
+      x-accel    只返回 X-Accel-Redirect，由 nginx 的 internal location 发送文件并处理 Range
+      x-sendfile 只返回 X-Sendfile，由 Apache/lighttpd 发送文件
+    """
+    filename = os.path.basename(file_path)
+    path = os.path.join(audio_dir(), filename)
+    if not upload_manifest.exists(stored_audio_path(filename)):
+        abort(404)
+
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    mode = current_app.config['AUDIO_SEND_MODE']
+    if mode == 'x-accel':
+        response = current_app.response_class(mimetype=mimetype)
+        response.headers['X-Accel-Redirect'] = current_app.config['AUDIO_ACCEL_PREFIX'].rstrip('/') + '/' + filename
+    else:
+        try:
+            response = send_file(
+                path, request.environ,
+                mimetype=mimetype,
+                etag=filename.rsplit('.', 1)[0],
+                use_x_sendfile=(mode == 'x-sendfile'),
+                response_class=current_app.response_class,
+            )
+        except FileNotFoundError:
+            # 其他进程已删除，清单尚未刷新
+            upload_manifest.record(path)
+            abort(404)
+        # werkzeug 只在收到 Range 请求时才声明，播放器据此判断能否拖动进度
+        response.accept_ranges = 'bytes'
+
+    return set_audio_cache_headers(response, audio_version(file_path))
+
+
+def audio_version(file_path):
+    """音频按内容哈希命名，文件名（不含扩展名）即内容版本；波形由音频生成，使用同一版本"""
+    return os.path.splitext(os.path.basename(file_path or ''))[0]
+
+
+def set_audio_cache_headers(response, version):
+    """
+    音频及其波形的 URL 带 ?v=<内容哈希>（见 song_player_dict）
+
+    v 与当前内容一致时，这个 URL 的内容不会再变，允许浏览器长期缓存（private：私有歌曲不进共享缓存）；
+    缺少 v 或 v 已过期时只允许按 ETag 确认后复用。可见性在每次请求时检查。
+    """
+    response.cache_control.private = True
+    if version and request.args.get('v') == version:
+        response.cache_control.no_cache = None
+        response.cache_control.max_age = current_app.config['AUDIO_CACHE_MAX_AGE']
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
\ No newline at end of file
@@ -0,0 +1,68 @@
+import os
+import uuid
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.upload_manifest import upload_manifest
+
+# session.info 中等待提交后确认的 [(临时文件, 目标文件)]
+PENDING_KEY = 'pending_blobs'
+
+
+def place_blob(session, temp_path, save_path):
+    """
+    把写完的临时文件放到按内容哈希命名的位置
+
+    目标已存在时暂时保留临时文件，等 session 提交（引用它的记录已可见）后再确认一次：
+    期间目标被 release_blob 删除的话，用临时文件放回；回滚或关闭 session 时丢弃临时文件。
+    """
+    if os.path.exists(save_path):
+        # 确保 session 已开始事务，提交、回滚或关闭时一定会触发下面的事件
+        session.connection()
+        session.info.setdefault(PENDING_KEY, []).append((temp_path, save_path))
+    else:
+        os.replace(temp_path, save_path)
+        upload_manifest.record(save_path)
+
+
+@event.listens_for(Session, 'after_commit')
+def _confirm_pending_blobs(session):
+    for temp_path, save_path in session.info.pop(PENDING_KEY, []):
+        if os.path.exists(save_path):
+            os.remove(temp_path)
+        else:
+            os.replace(temp_path, save_path)
+            upload_manifest.record(save_path)
+
+
+@event.listens_for(Session, 'after_transaction_end')
+def _discard_pending_blobs(session, transaction):
+    # 提交时已在 after_commit 中处理；回滚或直接关闭 session 时丢弃
+    if transaction.parent is not None:
+        return
+    for temp_path, _ in session.info.pop(PENDING_KEY, []):
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def release_blob(path, is_referenced):
+    """
+    is_referenced() 为假时删除内容寻址的文件，返回是否删除
+
+    先改名移开再复查引用：复查前提交的重复上传让文件恢复原位，
+    复查后才提交的由 place_blob 在提交后放回，两种顺序都不会留下指向已删除文件的记录。
+    """
+    if is_referenced():
+        return False
+    trash = os.path.join(os.path.dirname(path), f'.release-{uuid.uuid4().hex}')
+    try:
+        os.rename(path, trash)
+    except FileNotFoundError:
+        return False
+    if is_referenced():
+        os.replace(trash, path)
+        return False
+    os.remove(trash)
+    upload_manifest.record(path)
+    return True
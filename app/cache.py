@@ -0,0 +1,147 @@
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+from werkzeug.utils import import_string
+
+
+class LRUCache:
+    """进程内 LRU 缓存，带过期时间；每个 worker 各自一份"""
+
+    def __init__(self, app):
+        self.max_entries = app.config['CACHE_MAX_ENTRIES']
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteCache:
+    """
+    多进程共享的本地 SQLite 缓存，失效操作对所有 worker 立即可见；值需可 JSON 序列化
+
+    过期的行读取时忽略，每个进程每写入 CACHE_PURGE_EVERY 次顺带批量删除一次。
+    """
+
+    def __init__(self, app):
+        self.path = app.config['CACHE_SQLITE_PATH']
+        self.purge_every = app.config['CACHE_PURGE_EVERY']
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._local = threading.local()
+        self._sets = itertools.count(1)
+        connection = self._connect()
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS cache_entries '
+            '(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)'
+        )
+        connection.execute('CREATE INDEX IF NOT EXISTS ix_cache_entries_expires ON cache_entries (expires)')
+
+    def _connect(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def get(self, key):
+        row = self._connect().execute(
+            'SELECT value FROM cache_entries WHERE key = ? AND expires > ?', (key, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key, value, ttl):
+        self._connect().execute(
+            'INSERT OR REPLACE INTO cache_entries (key, value, expires) VALUES (?, ?, ?)',
+            (key, json.dumps(value), time.time() + ttl)
+        )
+        if next(self._sets) % self.purge_every == 0:
+            self.purge_expired()
+
+    def purge_expired(self):
+        """删除已过期的行，返回删除的行数"""
+        return self._connect().execute('DELETE FROM cache_entries WHERE expires <= ?', (time.time(),)).rowcount
+
+    def delete(self, key):
+        self._connect().execute('DELETE FROM cache_entries WHERE key = ?', (key,))
+
+    def clear(self):
+        self._connect().execute('DELETE FROM cache_entries')
+
+
+CACHE_BACKENDS = {
+    'memory': LRUCache,
+    'sqlite': SQLiteCache,
+}
+
+
+class Cache:
+    """页面数据缓存扩展；CACHE_BACKEND 可以是内置名称，也可以是 "模块:类" 形式的自定义后端"""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        name = app.config['CACHE_BACKEND']
+        backend_class = CACHE_BACKENDS.get(name) or import_string(name)
+        app.extensions['cache'] = backend_class(app)
+
+    @property
+    def backend(self):
+        return current_app.extensions['cache']
+
+    def get(self, key):
+        return self.backend.get(key)
+
+    def set(self, key, value, ttl=None):
+        self.backend.set(key, value, current_app.config['CACHE_DEFAULT_TTL'] if ttl is None else ttl)
+
+    def delete(self, key):
+        self.backend.delete(key)
+
+    def clear(self):
+        self.backend.clear()
+
+    def get_or_set(self, key, factory, ttl=None):
+        """命中时直接返回缓存值，否则调用 factory 生成并写入缓存"""
+        value = self.get(key)
+        if value is None:
+            value = factory()
+            self.set(key, value, ttl)
+        return value
+
+
+cache = Cache()
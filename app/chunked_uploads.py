@@ -0,0 +1,215 @@
+import hashlib
+import os
+import shutil
+import uuid
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import update, or_
+
+from app import db
+from app.audio_store import audio_dir, commit_blob
+from app.models import UploadSession
+
+READ_SIZE = 64 * 1024
+# 处理分块时视为“正在写入”的最长时间，超过后允许重新上传该分块
+CHUNK_LOCK_TIMEOUT = 120
+
+
+class UploadError(Exception):
+    """分块上传请求不合法；status 为对应的 HTTP 状态码"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def sniff_audio(head, ext):
+    """按文件头检查音频格式与扩展名是否一致"""
+    if ext == 'mp3':
+        return head[:3] == b'ID3' or (len(head) > 1 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0)
+    if ext == 'wav':
+        return head[:4] == b'RIFF' and head[8:12] == b'WAVE'
+    if ext == 'ogg':
+        return head[:4] == b'OggS'
+    if ext == 'flac':
+        return head[:4] == b'fLaC' or head[:3] == b'ID3'
+    if ext == 'm4a':
+        return head[4:8] == b'ftyp'
+    return False
+
+
+def partial_path(upload):
+    return os.path.join(current_app.config['UPLOAD_PARTIAL_DIR'], f'{upload.id}.part')
+
+
+def _hash_partial(upload):
+    """
+    按顺序读取一遍部分文件计算整体哈希
+
+    只在完成时读取一次：写分块时不维护整体哈希，任何进程处理任何分块的开销都只与分块大小有关。
+    """
+    hasher = hashlib.sha256()
+    remaining = upload.received_bytes
+    with open(partial_path(upload), 'rb') as f:
+        while remaining:
+            chunk = f.read(min(READ_SIZE * 16, remaining))
+            if not chunk:
+                raise UploadError('Partial upload is missing data, please restart the upload', 409)
+            hasher.update(chunk)
+            remaining -= len(chunk)
+    return hasher.hexdigest()
+
+
+def start_upload(user_id, filename, total_size, sha256=None):
+    """创建上传会话；total_size 为整个文件的字节数，sha256 可选，完成时校验"""
+    ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+    if ext not in current_app.config['ALLOWED_AUDIO_EXTENSIONS']:
+        raise UploadError('Please select a valid audio file (MP3, WAV, OGG, FLAC, M4A).')
+    max_bytes = current_app.config['UPLOAD_MAX_AUDIO_BYTES']
+    if not isinstance(total_size, int) or total_size <= 0 or total_size > max_bytes:
+        raise UploadError(f'File size must be between 1 byte and {max_bytes} bytes', 413)
+    if sha256 is not None and (len(sha256) != 64 or any(c not in '0123456789abcdef' for c in sha256.lower())):
+        raise UploadError('Invalid sha256')
+
+    upload = UploadSession(
+        id=uuid.uuid4().hex,
+        user_id=user_id,
+        filename=filename[:200],
+        ext=ext,
+        total_size=total_size,
+        chunk_size=current_app.config['UPLOAD_CHUNK_SIZE'],
+        sha256=sha256.lower() if sha256 else None,
+    )
+    os.makedirs(current_app.config['UPLOAD_PARTIAL_DIR'], exist_ok=True)
+    open(partial_path(upload), 'wb').close()
+    db.session.add(upload)
+    db.session.commit()
+    return upload
+
+
+def chunk_length(upload, index):
+    return min(upload.chunk_size, upload.total_size - index * upload.chunk_size)
+
+
+def write_chunk(upload, index, stream, content_length, chunk_sha256=None):
+    """
+    把第 index 个分块追加到部分文件，返回是否写入了新数据
+
+    分块必须按顺序上传；重复上传已接收的分块直接忽略（客户端没收到响应后重试）。
+    同一上传的同一分块同时只允许一个请求写入。每次按 READ_SIZE 读取请求体，内存占用与分块大小无关。
+    """
+    if index < upload.next_chunk:
+        return False
+    if index > upload.next_chunk:
+        raise UploadError(f'Expected chunk {upload.next_chunk}', 409)
+
+    expected = chunk_length(upload, index)
+    if content_length != expected:
+        raise UploadError(f'Chunk {index} must be {expected} bytes')
+
+    # 占用该分块：只有 next_chunk 未变且没有其他请求在写时才成功
+    now = datetime.utcnow()
+    claimed = db.session.execute(
+        update(UploadSession).where(
+            UploadSession.id == upload.id,
+            UploadSession.next_chunk == index,
+            or_(UploadSession.locked_at.is_(None),
+                UploadSession.locked_at < now - timedelta(seconds=CHUNK_LOCK_TIMEOUT)),
+        ).values(locked_at=now)
+    )
+    db.session.commit()
+    if claimed.rowcount != 1:
+        raise UploadError(f'Chunk {index} is already being uploaded', 409)
+
+    offset = upload.received_bytes
+    try:
+        chunk_hasher = hashlib.sha256()
+        head = b''
+        written = 0
+        with open(partial_path(upload), 'r+b') as f:
+            if f.seek(0, os.SEEK_END) < offset:
+                raise UploadError('Partial upload is missing data, please restart the upload', 409)
+            # 丢弃上次中断时写了一半的数据
+            f.seek(offset)
+            f.truncate()
+            while written < expected:
+                data = stream.read(min(READ_SIZE, expected - written))
+                if not data:
+                    break
+                if offset == 0 and len(head) < 16:
+                    head += data[:16 - len(head)]
+                chunk_hasher.update(data)
+                f.write(data)
+                written += len(data)
+
+            if written != expected:
+                f.truncate(offset)
+                raise UploadError(f'Chunk {index} is incomplete')
+            if offset == 0 and not sniff_audio(head, upload.ext):
+                f.truncate(offset)
+                raise UploadError(f'File content does not look like {upload.ext.upper()} audio')
+            if chunk_sha256 and chunk_sha256.lower() != chunk_hasher.hexdigest():
+                f.truncate(offset)
+                raise UploadError(f'Chunk {index} checksum mismatch')
+    except BaseException:
+        db.session.execute(update(UploadSession).where(UploadSession.id == upload.id).values(locked_at=None))
+        db.session.commit()
+        raise
+
+    upload.received_bytes = offset + expected
+    upload.next_chunk = index + 1
+    upload.locked_at = None
+    upload.updated_at = datetime.utcnow()
+    db.session.commit()
+    return True
+
+
+def finish_upload(upload):
+    """
+    所有分块到齐后校验整体哈希，并把文件放入按内容寻址的音频存储，返回文件名
+
+    上传会话随调用方的事务删除。部分文件保留到调用方提交后由 discard_partial 删除：
+    创建歌曲失败回滚时会话仍在，客户端可以重新完成。
+    """
+    if upload.received_bytes != upload.total_size:
+        raise UploadError(f'Upload is incomplete, next chunk is {upload.next_chunk}', 409)
+    digest = _hash_partial(upload)
+    if upload.sha256 and upload.sha256 != digest:
+        raise UploadError('File checksum mismatch, please restart the upload', 422)
+
+    save_dir = audio_dir()
+    os.makedirs(save_dir, exist_ok=True)
+    # 硬链接到音频目录再原子改名；部分文件不在同一文件系统上时复制
+    temp_path = os.path.join(save_dir, f'.upload-{upload.id}')
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+    try:
+        os.link(partial_path(upload), temp_path)
+    except OSError:
+        shutil.copyfile(partial_path(upload), temp_path)
+    filename = commit_blob(temp_path, save_dir, f'{digest}.{upload.ext}')
+
+    db.session.delete(upload)
+    return filename
+
+
+def discard_partial(upload_id):
+    """完成上传的事务提交后调用，删除部分文件"""
+    path = os.path.join(current_app.config['UPLOAD_PARTIAL_DIR'], f'{upload_id}.part')
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def purge_stale_uploads(max_age=None):
+    """删除长时间没有进展的上传会话及其部分文件，返回删除数量"""
+    max_age = max_age if max_age is not None else current_app.config['UPLOAD_SESSION_TTL']
+    cutoff = datetime.utcnow() - timedelta(seconds=max_age)
+    stale = UploadSession.query.filter(UploadSession.updated_at < cutoff).all()
+    for upload in stale:
+        path = partial_path(upload)
+        if os.path.exists(path):
+            os.remove(path)
+        db.session.delete(upload)
+    db.session.commit()
+    return len(stale)
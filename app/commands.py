@@ -0,0 +1,364 @@
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from app import db
+from app.models import Song, User, Comment, Follow
+
+counters_cli = AppGroup('counters', help='冗余计数字段维护')
+search_cli = AppGroup('search', help='全文搜索索引维护')
+play_counts_cli = AppGroup('play-counts', help='播放次数缓冲维护')
+recommendations_cli = AppGroup('recommendations', help='相似歌曲推荐维护')
+covers_cli = AppGroup('covers', help='封面搜索缓存维护')
+jobs_cli = AppGroup('jobs', help='后台任务队列')
+images_cli = AppGroup('images', help='封面和头像缩略图维护')
+uploads_cli = AppGroup('uploads', help='上传文件维护')
+metadata_cli = AppGroup('metadata', help='音频时长和标签维护')
+waveforms_cli = AppGroup('waveforms', help='播放器波形维护')
+assets_cli = AppGroup('assets', help='静态资源构建')
+
+
+def _grouped_counts(column, ids, *filters):
+    """对一批 id 做一次 GROUP BY 计数，返回 {id: count}"""
+    query = db.session.query(column, db.func.count()).filter(column.in_(ids), *filters)
+    return dict(query.group_by(column).all())
+
+
+def _iter_batches(model, batch_size):
+    """按主键分批遍历，避免一次性加载整张表"""
+    last_id = 0
+    while True:
+        batch = model.query.filter(model.id > last_id).order_by(model.id).limit(batch_size).all()
+        if not batch:
+            break
+        yield batch
+        last_id = batch[-1].id
+
+
+def reconcile_counters(batch_size=500, dry_run=False):
+    """重新计算冗余计数并修正偏差，返回 [(表名, id, 字段, 旧值, 新值)]"""
+    drift = []
+
+    for songs in _iter_batches(Song, batch_size):
+        ids = [song.id for song in songs]
+        comments = _grouped_counts(Comment.song_id, ids)
+        for song in songs:
+            expected = comments.get(song.id, 0)
+            if song.comments_count != expected:
+                drift.append(('song', song.id, 'comments_count', song.comments_count, expected))
+                song.comments_count = expected
+        if dry_run:
+            db.session.rollback()
+        else:
+            db.session.commit()
+
+    for users in _iter_batches(User, batch_size):
+        ids = [user.id for user in users]
+        expected_counts = {
+            'followers_count': _grouped_counts(Follow.followed_id, ids),
+            'following_count': _grouped_counts(Follow.follower_id, ids),
+            'public_songs_count': _grouped_counts(Song.user_id, ids, Song.visibility == 'public'),
+        }
+        for user in users:
+            for field, counts in expected_counts.items():
+                expected = counts.get(user.id, 0)
+                current = getattr(user, field)
+                if current != expected:
+                    drift.append(('user', user.id, field, current, expected))
+                    setattr(user, field, expected)
+        if dry_run:
+            db.session.rollback()
+        else:
+            db.session.commit()
+
+    return drift
+
+
+@counters_cli.command('reconcile')
+@click.option('--batch-size', default=500, show_default=True, help='每批处理的行数')
+@click.option('--dry-run', is_flag=True, help='只报告偏差，不写回数据库')
+def reconcile_command(batch_size, dry_run):
+    """重新计算评论数、粉丝数、关注数和公开歌曲数"""
+    drift = reconcile_counters(batch_size=batch_size, dry_run=dry_run)
+    for table, row_id, field, old, new in drift:
+        click.echo(f"{table}#{row_id} {field}: {old} -> {new}")
+    action = '发现' if dry_run else '已修正'
+    click.echo(f"✅ {action} {len(drift)} 处计数偏差")
+
+
+@search_cli.command('rebuild')
+@click.option('--batch-size', default=1000, show_default=True, help='每批写入的歌曲数')
+def rebuild_search_command(batch_size):
+    """重建歌曲全文搜索索引（仅 SQLite FTS5）"""
+    from app.search import rebuild_index
+    indexed = rebuild_index(batch_size=batch_size)
+    if indexed is None:
+        click.echo('当前数据库不是 SQLite，搜索使用 ILIKE 回退，无需重建索引')
+    else:
+        click.echo(f"✅ 已为 {indexed} 首公开歌曲重建搜索索引")
+
+
+@play_counts_cli.command('flush')
+def flush_play_counts_command():
+    """立即把旁路表中的播放次数写入数据库（仅 PLAY_COUNT_MODE=sqlite 有效）"""
+    from app.play_counts import play_counter
+    if not play_counter.shared:
+        # memory 模式的增量在各 worker 进程内存中，命令所在的新进程取不到
+        click.echo(f"❌ PLAY_COUNT_MODE={current_app.config['PLAY_COUNT_MODE']} 的增量不在共享旁路表中，"
+                   f"此命令只适用于 sqlite 模式", err=True)
+        raise SystemExit(1)
+    flushed = play_counter.flush()
+    click.echo(f"✅ 已写入 {flushed} 首歌曲的播放次数")
+
+
+@recommendations_cli.command('refresh')
+@click.option('--full', is_flag=True, help='全量重建，默认只刷新收藏有变化的歌曲')
+@click.option('--neighbors', type=int, default=None, help='每首歌保留的相似歌曲数，默认读取配置')
+def refresh_recommendations_command(full, neighbors):
+    """根据共同收藏重算相似歌曲（需要 numpy 和 scipy）"""
+    from app.recommendations import refresh_neighbors
+    stats = refresh_neighbors(full=full, limit=neighbors)
+    mode = '全量' if stats['full'] else '增量'
+    click.echo(f"✅ {mode}刷新 {stats['songs']} 首歌曲，写入 {stats['neighbors']} 条相似关系"
+               f"（{stats['favorites']} 条收藏，计算 {stats['build_seconds']:.2f}s，"
+               f"总计 {stats['total_seconds']:.2f}s）")
+
+
+@covers_cli.command('stats')
+def cover_cache_stats_command():
+    """显示封面搜索缓存的条目数和命中率"""
+    from app.cover_cache import stats
+    result = stats()
+    if not result:
+        click.echo('封面搜索缓存为空')
+    for kind, item in sorted(result.items()):
+        click.echo(f"{kind}: {item['entries']} 条（未找到 {item['negative']}，已过期 {item['expired']}），"
+                   f"命中 {item['hits']} / 未命中 {item['misses']}，命中率 {item['hit_rate']:.1%}")
+
+
+@covers_cli.command('purge')
+def purge_cover_cache_command():
+    """删除已过期的封面搜索缓存"""
+    from app.cover_cache import purge_expired
+    click.echo(f"✅ 已删除 {purge_expired()} 条过期缓存")
+
+
+@jobs_cli.command('work')
+@click.option('--threads', default=2, show_default=True, help='worker 线程数')
+@click.option('--once', is_flag=True, help='处理完当前到期的任务后退出')
+def work_jobs_command(threads, once):
+    """运行独立的后台任务 worker"""
+    import time
+    from flask import current_app
+    from app.jobs import JobWorker, run_pending
+    if once:
+        click.echo(f"✅ 已处理 {run_pending()} 个任务")
+        return
+
+    worker = JobWorker(current_app._get_current_object(), threads)
+    worker.start()
+    click.echo(f"Job worker started with {threads} threads, press Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        worker.stop(timeout=30)
+
+
+@jobs_cli.command('enqueue-missing-covers')
+@click.option('--batch-size', default=500, show_default=True, help='每批处理的歌曲数')
+def enqueue_missing_covers_command(batch_size):
+    """为所有没有封面的歌曲加入封面搜索任务"""
+    from app.covers import cover_job_key
+    from app.jobs import enqueue
+    last_id = 0
+    enqueued = 0
+    while True:
+        ids = [row.id for row in db.session.query(Song.id).filter(
+            Song.cover_image.is_(None), Song.id > last_id
+        ).order_by(Song.id).limit(batch_size)]
+        if not ids:
+            break
+        for song_id in ids:
+            enqueue('fetch_cover', {'song_id': song_id}, dedup_key=cover_job_key(song_id))
+        db.session.commit()
+        enqueued += len(ids)
+        last_id = ids[-1]
+    click.echo(f"✅ 已为 {enqueued} 首没有封面的歌曲加入封面搜索任务")
+
+
+@jobs_cli.command('status')
+def jobs_status_command():
+    """按任务类型显示各状态的任务数"""
+    from app.jobs import queue_stats
+    result = queue_stats()
+    if not result:
+        click.echo('任务队列为空')
+    for kind, counts in sorted(result.items()):
+        click.echo(f"{kind}: " + '，'.join(f"{status} {count}" for status, count in sorted(counts.items())))
+
+
+@images_cli.command('backfill')
+@click.option('--force', is_flag=True, help='重新生成已有的缩略图')
+def backfill_images_command(force):
+    """为 static/uploads/covers 和 avatars 下已有的图片生成缩略图变体"""
+    import os
+    from flask import current_app
+    from app.image_variants import generate_variants
+    processed = failed = 0
+    for folder in ('covers', 'avatars'):
+        directory = os.path.join(current_app.root_path, 'static', 'uploads', folder)
+        if not os.path.isdir(directory):
+            continue
+        for filename in sorted(os.listdir(directory)):
+            if filename.startswith('.') or not os.path.isfile(os.path.join(directory, filename)):
+                continue
+            try:
+                generate_variants(f'uploads/{folder}/{filename}', force=force)
+                processed += 1
+            except Exception as e:
+                failed += 1
+                click.echo(f"uploads/{folder}/{filename}: {e}")
+    click.echo(f"✅ 已处理 {processed} 张图片，失败 {failed} 张")
+
+
+@uploads_cli.command('purge')
+@click.option('--max-age', type=int, default=None, help='清理超过该秒数没有进展的上传，默认 UPLOAD_SESSION_TTL')
+def purge_uploads_command(max_age):
+    """删除长时间未完成的分块上传及其部分文件"""
+    from app.chunked_uploads import purge_stale_uploads
+    click.echo(f"✅ 已清理 {purge_stale_uploads(max_age)} 个未完成的上传")
+
+
+@uploads_cli.command('purge-orphans')
+@click.option('--min-age', type=int, default=3600, show_default=True,
+              help='只删除修改时间早于该秒数的文件，避免删除刚上传、歌曲尚未提交的文件')
+@click.option('--dry-run', is_flag=True, help='只列出，不删除')
+def purge_orphaned_audio_command(min_age, dry_run):
+    """删除没有歌曲引用的音频文件，如内容寻址迁移留下的旧文件"""
+    from app.audio_store import purge_orphaned_audio
+    orphans = purge_orphaned_audio(min_age, dry_run=dry_run)
+    for filename in orphans:
+        click.echo(filename)
+    click.echo(f"✅ {'找到' if dry_run else '已删除'} {len(orphans)} 个无引用的音频文件")
+
+
+@uploads_cli.command('missing')
+def missing_uploads_command():
+    """列出音频或封面文件不存在的歌曲；按启动时的上传文件清单判断，不逐个访问文件"""
+    from app.upload_manifest import upload_manifest
+    checked = missing = 0
+    for song_id, title, file_path, cover_image in db.session.query(
+            Song.id, Song.title, Song.file_path, Song.cover_image).order_by(Song.id).yield_per(1000):
+        checked += 1
+        problems = []
+        if not upload_manifest.exists(file_path):
+            problems.append(f"音频 {file_path}")
+        # 只检查本地封面，外部链接不在上传目录中
+        if cover_image and cover_image.startswith('uploads/') and not upload_manifest.exists(cover_image):
+            problems.append(f"封面 {cover_image}")
+        if problems:
+            missing += 1
+            click.echo(f"#{song_id} {title}: 缺少" + '，'.join(problems))
+    click.echo(f"✅ 已检查 {checked} 首歌曲，{missing} 首缺少文件")
+
+
+@metadata_cli.command('backfill')
+@click.option('--batch-size', default=200, show_default=True, help='每批处理的歌曲数')
+@click.option('--workers', default=4, show_default=True, help='并行读取文件的线程数')
+@click.option('--all', 'all_songs', is_flag=True, help='重新读取所有歌曲，默认只处理没有时长的')
+def backfill_metadata_command(batch_size, workers, all_songs):
+    """按批并行读取已有歌曲的时长和标签；只填充为空的专辑、风格等字段"""
+    from concurrent.futures import ThreadPoolExecutor
+    from app.audio_metadata import read_metadata, apply_metadata, audio_path, empty_fields
+    last_id = 0
+    processed = updated = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            query = Song.query.filter(Song.id > last_id)
+            if not all_songs:
+                query = query.filter(Song.duration.is_(None))
+            songs = query.order_by(Song.id).limit(batch_size).all()
+            if not songs:
+                break
+            # 读文件在线程池中并行，写数据库留在当前线程
+            paths = [audio_path(song.file_path) for song in songs]
+            for song, metadata in zip(songs, pool.map(read_metadata, paths)):
+                if metadata is not None and apply_metadata(song, metadata, empty_fields(song)):
+                    updated += 1
+            db.session.commit()
+            processed += len(songs)
+            last_id = songs[-1].id
+            click.echo(f"已处理 {processed} 首")
+    if updated:
+        from app.routes import invalidate_home_sections
+        invalidate_home_sections()
+    click.echo(f"✅ 已检查 {processed} 首歌曲，更新 {updated} 首")
+
+
+@waveforms_cli.command('backfill')
+@click.option('--workers', default=4, show_default=True, help='并行解码的线程数')
+@click.option('--force', is_flag=True, help='重新生成已有的波形')
+def backfill_waveforms_command(workers, force):
+    """为已有歌曲的音频生成波形；相同内容的音频只处理一次"""
+    import os
+    from concurrent.futures import ThreadPoolExecutor
+    from flask import current_app
+    from app.upload_manifest import upload_manifest
+    from app.waveform import build_waveform, waveform_path, UnsupportedAudio
+    static_dir = os.path.join(current_app.root_path, 'static')
+    bins = current_app.config['WAVEFORM_PEAKS']
+    tasks = []
+    for (file_path,) in db.session.query(Song.file_path).distinct().order_by(Song.file_path):
+        source = os.path.join(static_dir, file_path)
+        target = os.path.join(static_dir, waveform_path(file_path))
+        if os.path.exists(source) and (force or not os.path.exists(target)):
+            tasks.append((file_path, source, target))
+
+    def build(task):
+        file_path, source, target = task
+        try:
+            build_waveform(source, target, bins)
+            return None
+        except (UnsupportedAudio, OSError) as e:
+            return f"{file_path}: {e}"
+
+    # 解码在线程池中并行，NumPy 归约时会释放 GIL；写出的文件在主线程记入上传清单
+    failed = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for (_, _, target), error in zip(tasks, pool.map(build, tasks)):
+            if error:
+                failed += 1
+                click.echo(error)
+            else:
+                upload_manifest.record(target)
+    click.echo(f"✅ 已处理 {len(tasks) - failed} 个音频，失败 {failed} 个")
+
+
+@assets_cli.command('build')
+def build_assets_command():
+    """按内容哈希构建 static 下的 CSS、JS 并预压缩；部署时运行后可由前端服务器直接提供 ASSET_BUILD_DIR"""
+    from flask import current_app
+    from app.static_assets import static_assets, brotli
+    if not current_app.config['ASSET_FINGERPRINT']:
+        click.echo("ASSET_FINGERPRINT 已关闭，跳过构建")
+        return
+    manifest = static_assets.build()
+    for path, entry in sorted(manifest.items()):
+        click.echo(f"{path} -> {entry['name']} {' '.join(entry['encodings'])}".rstrip())
+    if brotli is None:
+        click.echo("未安装 brotli，只生成了 gzip 版本")
+    click.echo(f"✅ 已构建 {len(manifest)} 个静态文件")
+
+
+def register_commands(app):
+    app.cli.add_command(counters_cli)
+    app.cli.add_command(search_cli)
+    app.cli.add_command(play_counts_cli)
+    app.cli.add_command(recommendations_cli)
+    app.cli.add_command(covers_cli)
+    app.cli.add_command(jobs_cli)
+    app.cli.add_command(images_cli)
+    app.cli.add_command(uploads_cli)
+    app.cli.add_command(metadata_cli)
+    app.cli.add_command(waveforms_cli)
+    app.cli.add_command(assets_cli)
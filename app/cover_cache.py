@@ -0,0 +1,143 @@
+import json
+import re
+import threading
+import unicodedata
+from collections import Counter
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import select, update, func, case, bindparam
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models import CoverLookup
+
+_SPACES_RE = re.compile(r'\s+')
+
+# 命中次数只用于统计，先在进程内累积，攒够这么多次再合并写库；进程退出时未写入的少量命中不再补记
+HIT_FLUSH_THRESHOLD = 100
+_hits_lock = threading.Lock()
+
+
+def _pending_hits():
+    # 按应用保存，测试中每个应用各用一个数据库
+    return current_app.extensions.setdefault('cover_cache_hits', Counter())
+
+
+def normalize(value):
+    """全角转半角、忽略大小写并合并空白，让同一首歌的不同写法命中同一条缓存"""
+    value = unicodedata.normalize('NFKC', value or '').casefold()
+    return _SPACES_RE.sub(' ', value).strip()
+
+
+def cover_key(artist, title):
+    return f"{normalize(artist)}\x1f{normalize(title)}"
+
+
+def artist_key(artist):
+    return normalize(artist)
+
+
+def lookup(kind, key):
+    """
+    读取未过期的缓存，返回 (是否命中, 值)；命中“未找到”记录时值为 None
+
+    使用独立连接读取，不影响调用方会话中的事务；命中次数进入缓冲，读路径上不写库。
+    """
+    table = CoverLookup.__table__
+    with db.engine.connect() as connection:
+        row = connection.execute(
+            select(table.c.id, table.c.payload).where(
+                table.c.kind == kind,
+                table.c.lookup_key == key,
+                table.c.expires_at > datetime.utcnow()
+            )
+        ).first()
+    if row is None:
+        return False, None
+    pending = _pending_hits()
+    with _hits_lock:
+        pending[row.id] += 1
+        flush = sum(pending.values()) >= HIT_FLUSH_THRESHOLD
+    if flush:
+        flush_hits()
+    return True, json.loads(row.payload) if row.payload is not None else None
+
+
+def flush_hits():
+    """把缓冲的命中次数合并为每条记录一次 UPDATE，返回更新的记录数"""
+    buffer = _pending_hits()
+    with _hits_lock:
+        pending = Counter(buffer)
+        buffer.clear()
+    if not pending:
+        return 0
+    table = CoverLookup.__table__
+    stmt = update(table).where(table.c.id == bindparam('row_id')).values(hits=table.c.hits + bindparam('n'))
+    try:
+        with db.engine.begin() as connection:
+            connection.execute(stmt, [{'row_id': row_id, 'n': n} for row_id, n in sorted(pending.items())])
+    except Exception:
+        # 写库失败时放回缓冲，下次再试
+        with _hits_lock:
+            buffer.update(pending)
+        raise
+    return len(pending)
+
+
+def store(kind, key, value, ttl):
+    """写入（或覆盖）缓存并记一次未命中；value 为 None 时记录“未找到”"""
+    table = CoverLookup.__table__
+    values = {
+        'payload': json.dumps(value) if value is not None else None,
+        'expires_at': datetime.utcnow() + timedelta(seconds=ttl),
+        'updated_at': datetime.utcnow(),
+    }
+    where = (table.c.kind == kind) & (table.c.lookup_key == key)
+    with db.engine.begin() as connection:
+        updated = connection.execute(update(table).where(where).values(misses=table.c.misses + 1, **values))
+        if updated.rowcount:
+            return
+    try:
+        with db.engine.begin() as connection:
+            connection.execute(table.insert().values(kind=kind, lookup_key=key, hits=0, misses=1, **values))
+    except IntegrityError:
+        # 并发请求已插入同一条记录，改为更新
+        with db.engine.begin() as connection:
+            connection.execute(update(table).where(where).values(misses=table.c.misses + 1, **values))
+
+
+def purge_expired():
+    """删除已过期的缓存，返回删除条数"""
+    with db.engine.begin() as connection:
+        result = connection.execute(
+            CoverLookup.__table__.delete().where(CoverLookup.expires_at <= datetime.utcnow())
+        )
+    return result.rowcount
+
+
+def stats():
+    """按类型统计条目数、“未找到”条目数、过期条目数以及命中率（其他进程尚未写库的命中不计入）"""
+    flush_hits()
+    now = datetime.utcnow()
+    rows = db.session.query(
+        CoverLookup.kind,
+        func.count(),
+        func.sum(case((CoverLookup.payload.is_(None), 1), else_=0)),
+        func.sum(case((CoverLookup.expires_at <= now, 1), else_=0)),
+        func.sum(CoverLookup.hits),
+        func.sum(CoverLookup.misses),
+    ).group_by(CoverLookup.kind).all()
+
+    result = {}
+    for kind, entries, negative, expired, hits, misses in rows:
+        hits, misses = hits or 0, misses or 0
+        result[kind] = {
+            'entries': entries,
+            'negative': negative or 0,
+            'expired': expired or 0,
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / (hits + misses) if hits + misses else 0.0,
+        }
+    return result
@@ -0,0 +1,117 @@
+import hashlib
+import os
+import tempfile
+
+from flask import current_app
+
+from app import db
+from app.blob_store import place_blob, release_blob
+from app.http_clients import provider_clients
+from app.image_variants import remove_variants
+from app.models import Song
+
+CHUNK_SIZE = 64 * 1024
+
+# 允许的图片类型（响应头）及对应扩展名
+COVER_CONTENT_TYPES = {
+    'image/jpeg': 'jpg',
+    'image/jpg': 'jpg',
+    'image/png': 'png',
+    'image/gif': 'gif',
+    'image/webp': 'webp',
+}
+
+
+class InvalidCover(Exception):
+    """下载内容不是可用的封面图片（类型不符或超过大小限制）"""
+
+
+def sniff_image_type(head):
+    """按文件头识别图片格式，返回扩展名，无法识别时返回 None"""
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'jpg'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return 'gif'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+def store_cover_stream(chunks, save_dir, max_bytes):
+    """
+    把图片数据分块写入临时文件，边写边计算 SHA-256，完成后按内容哈希命名
+
+    相同内容的封面共用一个文件；超过 max_bytes 或文件头不是图片时抛出 InvalidCover。
+    返回保存的文件名。
+    """
+    digest = hashlib.sha256()
+    size = 0
+    head = b''
+    fd, temp_path = tempfile.mkstemp(dir=save_dir, prefix='.download-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in chunks:
+                if not chunk:
+                    continue
+                size += len(chunk)
+                if size > max_bytes:
+                    raise InvalidCover(f'Cover exceeds {max_bytes} bytes')
+                if len(head) < 16:
+                    head += chunk[:16 - len(head)]
+                digest.update(chunk)
+                f.write(chunk)
+
+        ext = sniff_image_type(head)
+        if ext is None:
+            raise InvalidCover('Downloaded content is not an image')
+
+        filename = f"{digest.hexdigest()}.{ext}"
+        # 已有相同内容的封面时直接复用，临时文件在引用它的事务提交后丢弃
+        place_blob(db.session, temp_path, os.path.join(save_dir, filename))
+        return filename
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def download_cover_image(cover_url, save_dir):
+    """流式下载封面图片并按内容哈希保存到本地，失败时返回 None"""
+    max_bytes = current_app.config['COVER_MAX_BYTES']
+    try:
+        response = provider_clients.get('cover_download').get(cover_url, timeout=30, stream=True)
+        with response:
+            if response.status_code != 200:
+                return None
+
+            content_type = response.headers.get('Content-Type', '').split(';')[0].strip().lower()
+            if content_type not in COVER_CONTENT_TYPES:
+                raise InvalidCover(f'Unexpected content type {content_type or "(none)"}')
+            # 声明的长度已超限时不必开始下载
+            content_length = response.headers.get('Content-Length')
+            if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+                raise InvalidCover(f'Cover exceeds {max_bytes} bytes')
+
+            return store_cover_stream(response.iter_content(CHUNK_SIZE), save_dir, max_bytes)
+    except Exception as e:
+        print(f"Error downloading cover: {e}")
+    return None
+
+
+def release_cover(cover_image):
+    """
+    某首歌不再使用该封面后调用（须在提交之后）；没有其他歌曲引用时删除文件及其尺寸变体
+
+    返回是否删除了文件。
+    """
+    if not cover_image:
+        return False
+    cover_path = os.path.join(current_app.root_path, 'static', cover_image)
+    released = release_blob(
+        cover_path, lambda: db.session.query(Song.id).filter(Song.cover_image == cover_image).first() is not None
+    )
+    if released or not os.path.exists(cover_path):
+        remove_variants(cover_image)
+    return released
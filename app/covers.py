@@ -0,0 +1,377 @@
+import os
+import random
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from flask import current_app
+from flask_babel import lazy_gettext as _l
+from sqlalchemy import update
+
+from app import db, cover_cache
+from app.cover_store import download_cover_image, release_cover
+from app.image_variants import enqueue_variants
+from app.http_clients import provider_clients
+from app.jobs import job_handler
+from app.models import Song
+
+# 精确匹配（标题包含歌名）的得分，达到即视为高置信结果
+EXACT_MATCH_SCORE = 100
+PARTIAL_MATCH_SCORE = 50
+
+
+def _match_score(title, candidate_title):
+    return EXACT_MATCH_SCORE if title.lower() in (candidate_title or '').lower() else PARTIAL_MATCH_SCORE
+
+
+def _artist_matches(artist, names):
+    artist = artist.lower()
+    return any(artist in name.lower() or name.lower() in artist for name in names)
+
+
+def netease_candidates(client, url, artist, title, timeout, exclude_albums=()):
+    """网易云音乐：按歌手过滤歌曲，返回专辑封面候选"""
+    params = {
+        'csrf_token': '',
+        's': f"{artist} {title}",
+        'type': 1,
+        'offset': 0,
+        'total': True,
+        'limit': 20
+    }
+    response = client.get(url, params=params, timeout=timeout)
+    response.raise_for_status()
+
+    covers = []
+    for song in response.json().get('result', {}).get('songs', []):
+        if not _artist_matches(artist, [ar.get('name', '') for ar in song.get('artists', [])]):
+            continue
+        album = song.get('album', {})
+        pic_url = album.get('picUrl', '')
+        if pic_url and album.get('name', '') not in exclude_albums:
+            covers.append({
+                'url': pic_url + '?param=600y600',
+                'album': album.get('name', ''),
+                'title': song.get('name', ''),
+                'match_score': _match_score(title, song.get('name', ''))
+            })
+    return covers
+
+
+def qq_music_candidates(client, url, artist, title, timeout, exclude_albums=()):
+    """QQ 音乐：按歌手过滤歌曲，用专辑 mid 拼出封面地址"""
+    params = {
+        'ct': 24,
+        'qqmusic_ver': 1298,
+        'new_json': 1,
+        'remoteplace': 'txt.yqq.song',
+        'searchid': random.randint(100000000, 999999999),
+        't': 0,
+        'aggr': 1,
+        'cr': 1,
+        'catZhida': 1,
+        'lossless': 0,
+        'flag_qc': 0,
+        'p': 1,
+        'n': 20,
+        'w': f"{artist} {title}",
+        'g_tk': 5381,
+        'loginUin': 0,
+        'hostUin': 0,
+        'format': 'json',
+        'inCharset': 'utf8',
+        'outCharset': 'utf-8',
+        'notice': 0,
+        'platform': 'yqq.json',
+        'needNewCode': 0
+    }
+    response = client.get(url, params=params, timeout=timeout)
+    response.raise_for_status()
+
+    covers = []
+    for song in response.json().get('data', {}).get('song', {}).get('list', []):
+        if not _artist_matches(artist, [singer.get('name', '') for singer in song.get('singer', [])]):
+            continue
+        album = song.get('album', {})
+        album_mid = album.get('mid', '')
+        if album_mid and album.get('name', '') not in exclude_albums:
+            covers.append({
+                'url': f"https://y.gtimg.cn/music/photo_new/T002R600x600M000{album_mid}.jpg",
+                'album': album.get('name', ''),
+                'title': song.get('name', ''),
+                'match_score': _match_score(title, song.get('name', ''))
+            })
+    return covers
+
+
+def itunes_candidates(client, url, artist, title, timeout, exclude_albums=()):
+    """iTunes：取搜索结果的 100x100 封面并换成 600x600"""
+    params = {'term': f"{artist} {title}", 'media': 'music', 'limit': 5}
+    response = client.get(url, params=params, timeout=timeout)
+    response.raise_for_status()
+
+    covers = []
+    for result in response.json().get('results', []):
+        artwork = result.get('artworkUrl100', '')
+        if artwork and result.get('collectionName', '') not in exclude_albums:
+            covers.append({
+                'url': artwork.replace('100x100', '600x600'),
+                'album': result.get('collectionName', ''),
+                'title': result.get('trackName', ''),
+                'match_score': _match_score(title, result.get('trackName', ''))
+            })
+    return covers
+
+
+def itunes_artist_candidates(client, url, artist, timeout):
+    """iTunes：按歌手搜索，收集不同专辑的封面"""
+    params = {'term': artist, 'media': 'music', 'limit': 20}
+    response = client.get(url, params=params, timeout=timeout)
+    response.raise_for_status()
+
+    covers = []
+    for result in response.json().get('results', []):
+        if not _artist_matches(artist, [result.get('artistName', '')]):
+            continue
+        candidate = result.get('artworkUrl100', '').replace('100x100', '600x600')
+        if candidate and candidate not in covers:
+            covers.append(candidate)
+    return covers
+
+
+def lastfm_artist_candidates(client, url, api_key, artist, timeout):
+    """Last.fm：歌手热门专辑的大尺寸封面"""
+    params = {'method': 'artist.gettopalbums', 'artist': artist, 'api_key': api_key,
+              'format': 'json', 'limit': 10}
+    response = client.get(url, params=params, timeout=timeout)
+    response.raise_for_status()
+
+    covers = []
+    for album in response.json().get('topalbums', {}).get('album', []):
+        for img in album.get('image', []):
+            if img.get('size') == 'extralarge' and img.get('#text'):
+                covers.append(img.get('#text'))
+    return covers
+
+
+class CoverProvider:
+    def __init__(self, name, label, search):
+        self.name = name
+        self.label = label
+        self.search = search
+
+
+# 顺序即同分时的优先级
+PROVIDERS = [
+    CoverProvider('netease', _l('NetEase Cloud Music'), netease_candidates),
+    CoverProvider('qq', _l('QQ Music'), qq_music_candidates),
+    CoverProvider('itunes', _l('Apple Music'), itunes_candidates),
+]
+
+
+class CoverMatch:
+    """解析结果：封面地址、来源以及匹配得分"""
+
+    def __init__(self, url, provider, album='', title='', match_score=0):
+        self.url = url
+        self.provider = provider
+        self.album = album
+        self.title = title
+        self.match_score = match_score
+
+    @property
+    def source(self):
+        # 在请求上下文中按当前语言取来源名称
+        return str(self.provider.label)
+
+    def to_dict(self):
+        return {'url': self.url, 'provider': self.provider.name, 'album': self.album,
+                'title': self.title, 'match_score': self.match_score}
+
+    @classmethod
+    def from_dict(cls, data):
+        providers = {provider.name: provider for provider in PROVIDERS}
+        return cls(**dict(data, provider=providers[data['provider']]))
+
+    def __repr__(self):
+        return f'<CoverMatch {self.provider.name} {self.match_score} {self.url}>'
+
+
+_executor_lock = threading.Lock()
+
+
+def _get_executor(provider_name, workers):
+    """每个来源一个线程池，挂起的来源只会占满自己的线程，不影响其他来源的查询"""
+    with _executor_lock:
+        executors = current_app.extensions.setdefault('cover_search', {})
+        if provider_name not in executors:
+            executors[provider_name] = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix=f'cover-search-{provider_name}')
+        return executors[provider_name]
+
+
+def _best(matches):
+    priority = {provider.name: i for i, provider in enumerate(PROVIDERS)}
+    return max(matches, key=lambda m: (m.match_score, -priority.get(m.provider.name, len(priority))),
+               default=None)
+
+
+def _resolve(artist, title, exclude_albums, providers):
+    """并发查询，返回 (最佳结果, 是否所有来源都正常返回)"""
+    config = current_app.config
+    urls = config['COVER_PROVIDER_URLS']
+    deadline = time.monotonic() + config['COVER_SEARCH_DEADLINE']
+    timeout = config['COVER_PROVIDER_TIMEOUT']
+    # 返回后置位：被放弃的查询不再重试，排队中的查询不再发出；
+    # 每次请求的超时不超过剩余时间，进行中的查询最迟在截止时间退出
+    cancel = threading.Event()
+
+    # 熔断器打开的来源直接跳过，不占用线程也不等待超时
+    clients = {provider.name: provider_clients.get(provider.name) for provider in providers}
+    available = [provider for provider in providers if clients[provider.name].available()]
+    failed = len(available) < len(providers)
+
+    futures = {
+        _get_executor(provider.name, config['COVER_SEARCH_WORKERS']).submit(
+            provider.search, clients[provider.name].bound(deadline, cancel), urls[provider.name],
+            artist, title, timeout, exclude_albums): provider
+        for provider in available
+    }
+
+    matches = []
+    pending = set(futures)
+    try:
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                provider = futures[future]
+                try:
+                    candidates = future.result()
+                except Exception as e:
+                    failed = True
+                    print(f"{provider.name} cover search error: {e}")
+                    continue
+                matches.extend(CoverMatch(provider=provider, **candidate) for candidate in candidates)
+            if any(match.match_score >= EXACT_MATCH_SCORE for match in matches):
+                break
+    finally:
+        cancel.set()
+        for future in pending:
+            future.cancel()
+
+    return _best(matches), not failed and not pending
+
+
+class CoverSearchIncomplete(Exception):
+    """没有找到封面，且有来源失败或超时，结果不可信"""
+
+
+def resolve_cover(artist, title, exclude_albums=None, providers=None, strict=False):
+    """
+    并发查询所有封面来源，返回得分最高的 CoverMatch，找不到时返回 None
+
+    任一来源返回精确匹配即立即返回；总耗时不超过 COVER_SEARCH_DEADLINE 秒，
+    尚未开始的查询会被取消，仍在进行的查询不再重试、最迟在截止时间退出，结果直接丢弃。
+    结果按歌手+歌名缓存；只有所有来源都正常返回且确实没有封面时才缓存“未找到”。
+    strict 为 True 时，找不到且有来源失败会抛出 CoverSearchIncomplete，便于后台任务重试。
+    """
+    use_cache = not exclude_albums and providers is None
+    key = cover_cache.cover_key(artist, title)
+    if use_cache:
+        found, cached = cover_cache.lookup('cover', key)
+        if found:
+            return CoverMatch.from_dict(cached) if cached else None
+
+    match, complete = _resolve(artist, title, exclude_albums or set(), providers or PROVIDERS)
+
+    if use_cache:
+        config = current_app.config
+        if match:
+            cover_cache.store('cover', key, match.to_dict(), config['COVER_CACHE_TTL'])
+        elif complete:
+            cover_cache.store('cover', key, None, config['COVER_CACHE_NEGATIVE_TTL'])
+    if strict and match is None and not complete:
+        raise CoverSearchIncomplete(f'{artist} - {title}')
+    return match
+
+
+def artist_cover_candidates(artist):
+    """
+    歌手的候选封面列表（iTunes，失败或为空时用 Last.fm），用于“换一张封面”
+
+    列表按歌手缓存，换封面时从中随机挑选而无需再次请求外部接口。
+    """
+    key = cover_cache.artist_key(artist)
+    found, cached = cover_cache.lookup('artist', key)
+    if found:
+        return cached or []
+
+    config = current_app.config
+    urls = config['COVER_PROVIDER_URLS']
+    timeout = config['COVER_PROVIDER_TIMEOUT']
+    covers = []
+    failed = False
+    try:
+        covers = itunes_artist_candidates(provider_clients.get('itunes'), urls['itunes'], artist, timeout)
+    except Exception as e:
+        failed = True
+        print(f"iTunes search error: {e}")
+    if not covers:
+        try:
+            covers = lastfm_artist_candidates(provider_clients.get('lastfm'), urls['lastfm'],
+                                              config['LASTFM_API_KEY'], artist, timeout)
+        except Exception as e:
+            failed = True
+            print(f"Last.fm search error: {e}")
+
+    if covers:
+        cover_cache.store('artist', key, covers, config['COVER_ARTIST_CACHE_TTL'])
+    elif not failed:
+        cover_cache.store('artist', key, None, config['COVER_CACHE_NEGATIVE_TTL'])
+    return covers
+
+
+def cover_job_key(song_id):
+    return f'cover:{song_id}'
+
+
+@job_handler('fetch_cover')
+def fetch_cover_job(payload):
+    """
+    后台为歌曲搜索并下载封面；可重复执行
+
+    歌曲已删除或已有封面时直接结束；只在封面仍为空时写入，避免覆盖用户期间手动设置的封面。
+    """
+    song = db.session.get(Song, payload['song_id'])
+    if song is None or song.cover_image:
+        return
+
+    match = resolve_cover(song.artist, song.title, strict=True)
+    if match is None:
+        return
+
+    cover_upload_dir = os.path.join(current_app.root_path, 'static', 'uploads', 'covers')
+    os.makedirs(cover_upload_dir, exist_ok=True)
+    unique_cover_filename = download_cover_image(match.url, cover_upload_dir)
+    if unique_cover_filename is None:
+        raise RuntimeError(f'Cover download failed: {match.url}')
+
+    cover_db_path = os.path.join('uploads', 'covers', unique_cover_filename).replace('\\', '/')
+    updated = db.session.execute(
+        update(Song).where(Song.id == song.id, Song.cover_image.is_(None)).values(cover_image=cover_db_path)
+    )
+    db.session.commit()
+    if not updated.rowcount:
+        # 封面文件按内容共享，只在没有其他歌曲引用时删除
+        release_cover(cover_db_path)
+        return
+
+    print(f"Cover for song {song.id} found on {match.provider.name}")
+    enqueue_variants(cover_db_path)
+    db.session.commit()
+    if song.visibility == 'public':
+        from app.routes import invalidate_home_sections
+        invalidate_home_sections()
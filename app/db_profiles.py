@@ -0,0 +1,54 @@
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+from app import db
+
+
+def get_engine_profile(app):
+    """DATABASE_ENGINE_PROFILE 未指定时按连接串推断：SQLite 文件库用 sqlite，其余用 server"""
+    profile = app.config.get('DATABASE_ENGINE_PROFILE')
+    if profile:
+        return profile
+    url = make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+    return 'sqlite' if url.get_backend_name() == 'sqlite' else 'server'
+
+
+def configure_engine_options(app):
+    """在 db.init_app 之前根据引擎配置生成 SQLALCHEMY_ENGINE_OPTIONS"""
+    options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    profile = get_engine_profile(app)
+
+    if profile == 'sqlite':
+        # 驱动层的等待时间与 busy_timeout 保持一致（秒）
+        connect_args = dict(options.get('connect_args') or {})
+        connect_args.setdefault('timeout', app.config['SQLITE_PRAGMAS']['busy_timeout'] / 1000)
+        options['connect_args'] = connect_args
+    elif profile == 'server':
+        options.setdefault('pool_size', app.config['DB_POOL_SIZE'])
+        options.setdefault('max_overflow', app.config['DB_MAX_OVERFLOW'])
+        options.setdefault('pool_timeout', app.config['DB_POOL_TIMEOUT'])
+        options.setdefault('pool_recycle', app.config['DB_POOL_RECYCLE'])
+        options.setdefault('pool_pre_ping', app.config['DB_POOL_PRE_PING'])
+    else:
+        raise ValueError(f'Unknown database engine profile: {profile}')
+
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+
+def install_sqlite_pragmas(app):
+    """在 db.init_app 之后为 SQLite 连接注册 PRAGMA 设置"""
+    if get_engine_profile(app) != 'sqlite':
+        return
+
+    pragmas = app.config['SQLITE_PRAGMAS']
+    with app.app_context():
+        engine = db.engine
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f'PRAGMA {name}={value}')
+        finally:
+            cursor.close()
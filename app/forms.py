@@ -8,7 +8,7 @@ from wtforms import (
     FileField,
     SelectField,
 )
-from wtforms.validators import DataRequired, EqualTo, Length, ValidationError
+from wtforms.validators import DataRequired, EqualTo, Length, Optional, ValidationError
 from flask_babel import lazy_gettext as _l
 from app.models import User
 
@@ -49,8 +49,9 @@ class RegistrationForm(FlaskForm):
 
 
 class SongUploadForm(FlaskForm):
-    title = StringField(_l('Song Title'), validators=[DataRequired(), Length(max=100)])
-    artist = StringField(_l('Artist'), validators=[DataRequired(), Length(max=100)])
+    # 标题和艺术家可留空，上传后从音频标签读取
+    title = StringField(_l('Song Title'), validators=[Optional(), Length(max=100)])
+    artist = StringField(_l('Artist'), validators=[Optional(), Length(max=100)])
     album = StringField(_l('Album'), validators=[Length(max=100)])
     genre = StringField(_l('Genre'), validators=[Length(max=50)])
     visibility = SelectField(_l('Visibility'), choices=[
@@ -68,6 +69,11 @@ class SongUploadForm(FlaskForm):
                 raise ValidationError(_l('Please select a valid audio file (MP3, WAV, OGG, FLAC, M4A).'))
 
 
+class SongMetadataForm(SongUploadForm):
+    """分块上传完成时提交的歌曲信息，音频已通过分块接口上传"""
+    audio_file = None
+
+
 class PlaylistForm(FlaskForm):
     name = StringField(_l('Playlist Name'), validators=[DataRequired()])
     description = TextAreaField(_l('Description'))
@@ -0,0 +1,244 @@
+import random
+import threading
+import time
+from collections import deque
+
+import requests
+from flask import current_app
+from requests.adapters import HTTPAdapter
+
+BROWSER_USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+
+# 各外部来源的默认请求头；cover_download 用于下载任意 CDN 上的封面图片
+PROVIDER_HEADERS = {
+    'netease': {'User-Agent': BROWSER_USER_AGENT, 'Referer': 'https://music.163.com/'},
+    'qq': {'User-Agent': BROWSER_USER_AGENT, 'Referer': 'https://y.qq.com/'},
+    'itunes': {},
+    'lastfm': {},
+    'cover_download': {'User-Agent': BROWSER_USER_AGENT, 'Referer': 'https://music.163.com/'},
+}
+
+# 视为来源故障、值得重试的状态码；其余 4xx 属于请求本身的问题
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class ProviderUnavailable(Exception):
+    """熔断器打开，本次请求被直接跳过"""
+
+
+class ProviderCancelled(Exception):
+    """调用方已放弃（取消或超过截止时间），请求不再发出"""
+
+
+class CircuitBreaker:
+    """连续失败达到阈值后打开，冷却后放行一次试探请求（半开），成功即关闭"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, threshold, reset_timeout):
+        self.name = name
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        """已打开且仍在冷却期内"""
+        return self.state == self.OPEN and time.monotonic() - self.opened_at < self.reset_timeout
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                print(f"Circuit breaker {self.name} closed")
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+                if self.state != self.OPEN:
+                    print(f"Circuit breaker {self.name} opened after {self.failures} failures")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self._probing = False
+
+
+class ProviderClient:
+    """单个外部来源的客户端：共享连接池的 Session、带抖动退避的重试、熔断器和延迟统计"""
+
+    def __init__(self, name, config):
+        self.name = name
+        self.retries = config['PROVIDER_RETRIES']
+        self.backoff = config['PROVIDER_BACKOFF']
+        self.backoff_max = config['PROVIDER_BACKOFF_MAX']
+        self.breaker = CircuitBreaker(name, config['PROVIDER_BREAKER_THRESHOLD'],
+                                      config['PROVIDER_BREAKER_RESET'])
+
+        self.session = requests.Session()
+        self.session.headers.update(PROVIDER_HEADERS.get(name, {}))
+        adapter = HTTPAdapter(pool_connections=config['PROVIDER_POOL_CONNECTIONS'],
+                              pool_maxsize=config['PROVIDER_POOL_MAXSIZE'])
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._latencies = deque(maxlen=200)
+        self._stats_lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.skipped = 0
+
+    def available(self):
+        """熔断器未处于冷却期；用于在发起查询前快速跳过故障来源"""
+        return not self.breaker.is_open
+
+    def bound(self, deadline, cancel):
+        """绑定截止时间（time.monotonic）和取消事件的客户端，用于并发搜索中可放弃的查询"""
+        return BoundClient(self, deadline, cancel)
+
+    def get(self, url, deadline=None, cancel=None, **kwargs):
+        """
+        GET 请求；连接错误和 429/5xx 按指数退避加全抖动重试，最多 PROVIDER_RETRIES 次
+
+        熔断器打开时抛出 ProviderUnavailable；超时和其他请求异常不重试，直接计为一次失败。
+        给出 deadline 或 cancel 时，每次尝试的超时不超过剩余时间，已取消或已到截止时间则
+        抛出 ProviderCancelled，不再发出请求或重试，也不计入熔断器。
+        """
+        timeout = kwargs.get('timeout')
+        remaining = self._check_cancelled(deadline, cancel)
+        if not self.breaker.allow():
+            with self._stats_lock:
+                self.skipped += 1
+            raise ProviderUnavailable(f'{self.name} circuit open')
+
+        attempt = 0
+        while True:
+            if remaining is not None:
+                kwargs['timeout'] = remaining if timeout is None else min(timeout, remaining)
+            started = time.perf_counter()
+            try:
+                response = self.session.get(url, **kwargs)
+            except requests.Timeout:
+                self._record(started, failed=True)
+                raise
+            except requests.ConnectionError:
+                self._record(started, failed=True)
+                if attempt >= self.retries:
+                    raise
+            except requests.RequestException:
+                # 其他请求异常（重定向过多、响应体截断等）同样计为失败，不重试；
+                # 半开状态下的试探请求也因此结束，熔断器不会卡在试探中
+                self._record(started, failed=True)
+                raise
+            else:
+                failed = response.status_code in RETRY_STATUSES
+                self._record(started, failed=failed)
+                if not failed or attempt >= self.retries:
+                    return response
+                response.close()
+
+            delay = random.uniform(0, min(self.backoff_max, self.backoff * 2 ** attempt))
+            if cancel is not None:
+                cancel.wait(delay)
+            else:
+                time.sleep(delay)
+            attempt += 1
+            remaining = self._check_cancelled(deadline, cancel)
+            # 重试前再次确认熔断器状态，避免在来源已判定故障后继续请求
+            if not self.breaker.allow():
+                raise ProviderUnavailable(f'{self.name} circuit open')
+
+    def _check_cancelled(self, deadline, cancel):
+        """返回距截止时间的剩余秒数；已取消或已到截止时间时抛出 ProviderCancelled"""
+        if cancel is not None and cancel.is_set():
+            raise ProviderCancelled(f'{self.name} request cancelled')
+        if deadline is None:
+            return None
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise ProviderCancelled(f'{self.name} request past deadline')
+        return remaining
+
+    def _record(self, started, failed):
+        elapsed = time.perf_counter() - started
+        with self._stats_lock:
+            self.requests += 1
+            self._latencies.append(elapsed)
+            if failed:
+                self.errors += 1
+        if failed:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+    def stats(self):
+        with self._stats_lock:
+            latencies = sorted(self._latencies)
+            requests_count, errors, skipped = self.requests, self.errors, self.skipped
+
+        def percentile(p):
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 1)
+
+        return {
+            'state': self.breaker.state,
+            'consecutive_failures': self.breaker.failures,
+            'requests': requests_count,
+            'errors': errors,
+            'skipped': skipped,
+            'latency_ms': {'p50': percentile(0.5), 'p95': percentile(0.95), 'samples': len(latencies)},
+        }
+
+
+class BoundClient:
+    """带截止时间和取消事件的 ProviderClient 视图，接口与 ProviderClient.get 相同"""
+
+    def __init__(self, client, deadline, cancel):
+        self.client = client
+        self.deadline = deadline
+        self.cancel = cancel
+
+    def get(self, url, **kwargs):
+        return self.client.get(url, deadline=self.deadline, cancel=self.cancel, **kwargs)
+
+
+class ProviderClients:
+    """外部来源客户端扩展，每个进程为每个来源维护一个客户端"""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['provider_clients'] = {
+            name: ProviderClient(name, app.config) for name in PROVIDER_HEADERS
+        }
+
+    def get(self, name):
+        return current_app.extensions['provider_clients'][name]
+
+    def stats(self):
+        return {name: client.stats() for name, client in current_app.extensions['provider_clients'].items()}
+
+
+provider_clients = ProviderClients()
@@ -0,0 +1,153 @@
+import json
+import os
+import threading
+
+from flask import current_app, url_for
+from PIL import Image, ImageOps
+
+from app.jobs import enqueue, job_handler
+from app.upload_manifest import upload_manifest
+
+# 变体格式：扩展名 -> (Pillow 格式, 保存参数对应的配置项)
+VARIANT_FORMATS = {
+    'webp': ('WEBP', 'IMAGE_WEBP_QUALITY'),
+    'jpg': ('JPEG', 'IMAGE_JPEG_QUALITY'),
+}
+
+# 进程内记住已生成变体的图片，渲染列表时不必每次读清单文件
+_ready = {}
+_ready_lock = threading.Lock()
+_READY_MAX = 10000
+
+
+def _static_path(path):
+    return os.path.join(current_app.root_path, 'static', path)
+
+
+def variant_path(path, size, ext):
+    """uploads/covers/<名称>.png -> uploads/covers/variants/<名称>-200.webp"""
+    directory, filename = os.path.split(path)
+    stem = os.path.splitext(filename)[0]
+    return f"{directory}/variants/{stem}-{size}.{ext}"
+
+
+def manifest_path(path):
+    directory, filename = os.path.split(path)
+    stem = os.path.splitext(filename)[0]
+    return f"{directory}/variants/{stem}.json"
+
+
+def _save_atomic(image, target, fmt, **params):
+    temp = f"{target}.tmp"
+    image.save(temp, fmt, **params)
+    os.replace(temp, target)
+    upload_manifest.record(target)
+
+
+def generate_variants(path, force=False):
+    """
+    为 static 下的图片生成正方形裁剪的多尺寸 WebP 和 JPEG 变体，返回生成的尺寸列表
+
+    不放大：只生成不超过原图短边的尺寸（原图过小时只生成最小尺寸）。
+    清单文件最后写入，作为变体已就绪的标记；已有清单时跳过，除非 force。
+    源文件不存在时返回 None。
+    """
+    source = _static_path(path)
+    manifest = _static_path(manifest_path(path))
+    if not os.path.exists(source):
+        return None
+    if os.path.exists(manifest) and not force:
+        with open(manifest) as f:
+            return json.load(f)['sizes']
+
+    config = current_app.config
+    with Image.open(source) as img:
+        img = ImageOps.exif_transpose(img)
+        if img.mode in ('RGBA', 'LA', 'P'):
+            # 透明背景铺白后再转 RGB，避免 JPEG 中出现黑底
+            img = img.convert('RGBA')
+            background = Image.new('RGB', img.size, (255, 255, 255))
+            background.paste(img, mask=img.getchannel('A'))
+            img = background
+        else:
+            img = img.convert('RGB')
+
+        all_sizes = sorted(config['IMAGE_VARIANT_SIZES'])
+        sizes = [size for size in all_sizes if size <= min(img.size)] or all_sizes[:1]
+
+        os.makedirs(os.path.dirname(manifest), exist_ok=True)
+        for size in sizes:
+            fitted = ImageOps.fit(img, (size, size), Image.LANCZOS)
+            for ext, (fmt, quality_key) in VARIANT_FORMATS.items():
+                params = {'quality': config[quality_key]}
+                if fmt == 'JPEG':
+                    params.update(optimize=True, progressive=True)
+                else:
+                    params['method'] = 4
+                _save_atomic(fitted, _static_path(variant_path(path, size, ext)), fmt, **params)
+
+    with open(f"{manifest}.tmp", 'w') as f:
+        json.dump({'sizes': sizes}, f)
+    os.replace(f"{manifest}.tmp", manifest)
+    upload_manifest.record(manifest)
+    with _ready_lock:
+        _ready.pop(path, None)
+    return sizes
+
+
+def remove_variants(path):
+    """删除图片的全部变体和清单"""
+    manifest = _static_path(manifest_path(path))
+    sizes = set(current_app.config['IMAGE_VARIANT_SIZES'])
+    if os.path.exists(manifest):
+        with open(manifest) as f:
+            sizes.update(json.load(f)['sizes'])
+    for size in sizes:
+        for ext in VARIANT_FORMATS:
+            target = _static_path(variant_path(path, size, ext))
+            if os.path.exists(target):
+                os.remove(target)
+                upload_manifest.record(target)
+    if os.path.exists(manifest):
+        os.remove(manifest)
+        upload_manifest.record(manifest)
+    with _ready_lock:
+        _ready.pop(path, None)
+
+
+def image_variants(path):
+    """
+    模板用：返回 {'webp': srcset, 'jpg': srcset}，变体尚未生成时返回 None
+
+    只缓存已就绪的结果；未就绪的图片每次渲染读一次清单是否存在。
+    """
+    if not path:
+        return None
+    variants = _ready.get(path)
+    if variants is not None:
+        return variants
+
+    if not upload_manifest.exists(manifest_path(path)):
+        return None
+    with open(_static_path(manifest_path(path))) as f:
+        sizes = json.load(f)['sizes']
+    variants = {
+        ext: ', '.join(f"{url_for('static', filename=variant_path(path, size, ext))} {size}w" for size in sizes)
+        for ext in VARIANT_FORMATS
+    }
+    with _ready_lock:
+        if len(_ready) >= _READY_MAX:
+            _ready.clear()
+        _ready[path] = variants
+    return variants
+
+
+def enqueue_variants(path):
+    """在调用方的会话中加入生成变体的任务，随调用方的事务提交"""
+    if path:
+        enqueue('image_variants', {'path': path}, dedup_key=f'variants:{path}')
+
+
+@job_handler('image_variants')
+def image_variants_job(payload):
+    generate_variants(payload['path'])
@@ -0,0 +1,252 @@
+import json
+import os
+import socket
+import threading
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import select, update, or_, and_, func
+
+from app import db
+from app.models import Job
+
+# 任务类型 -> 处理函数，处理函数接收 payload 字典，抛出异常即视为失败并按退避重试
+JOB_HANDLERS = {}
+
+
+def job_handler(kind):
+    def decorator(func):
+        JOB_HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+def enqueue(kind, payload, dedup_key=None, max_attempts=None):
+    """
+    在调用方的会话中加入任务，随调用方的事务一起提交
+
+    dedup_key 相同的任务已在排队或执行时不重复加入；已完成或失败的任务会被重新排队。
+    """
+    max_attempts = max_attempts or current_app.config['JOB_MAX_ATTEMPTS']
+    if dedup_key is None:
+        job = Job(kind=kind, payload=json.dumps(payload), max_attempts=max_attempts)
+        db.session.add(job)
+        return job
+
+    job = Job.query.filter_by(dedup_key=dedup_key).first()
+    if job is None:
+        # 并发请求可能同时加入相同的任务（如内容相同的两次上传）：冲突时不插入，
+        # 不会让调用方的整个事务在提交时因唯一约束失败
+        db.session.execute(_insert_ignoring_conflict(
+            kind=kind, dedup_key=dedup_key, payload=json.dumps(payload), status='pending',
+            attempts=0, max_attempts=max_attempts, run_at=datetime.utcnow(),
+            created_at=datetime.utcnow(), updated_at=datetime.utcnow(),
+        ))
+        return Job.query.filter_by(dedup_key=dedup_key).first()
+    if job.status in ('pending', 'running'):
+        return job
+    job.payload = json.dumps(payload)
+    job.status = 'pending'
+    job.attempts = 0
+    job.max_attempts = max_attempts
+    job.run_at = datetime.utcnow()
+    job.last_error = None
+    job.updated_at = datetime.utcnow()
+    return job
+
+
+def _insert_ignoring_conflict(**values):
+    """dedup_key 已存在时什么也不做的 INSERT，语句在调用方的事务中执行"""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+        return insert(Job).values(**values).on_conflict_do_nothing(index_elements=['dedup_key'])
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+        return insert(Job).values(**values).on_conflict_do_nothing(index_elements=['dedup_key'])
+    # MySQL
+    return Job.__table__.insert().values(**values).prefix_with('IGNORE')
+
+
+def _claimable(now, lock_timeout):
+    # 超过锁定时间仍未完成的任务视为 worker 已退出，可以重新领取
+    return or_(
+        and_(Job.status == 'pending', Job.run_at <= now),
+        and_(Job.status == 'running', Job.locked_at <= now - timedelta(seconds=lock_timeout)),
+    )
+
+
+def claim(worker_id):
+    """
+    领取一个到期任务，返回 Job 或 None
+
+    先查候选再用带条件的 UPDATE 抢占，多个 worker 并发领取时只有一个成功，SQLite 和服务端数据库通用。
+    """
+    lock_timeout = current_app.config['JOB_LOCK_TIMEOUT']
+    for _ in range(5):
+        now = datetime.utcnow()
+        candidate = db.session.execute(
+            select(Job.id, Job.status, Job.locked_at).where(_claimable(now, lock_timeout))
+            .order_by(Job.run_at, Job.id).limit(1)
+        ).first()
+        if candidate is None:
+            db.session.rollback()
+            return None
+        claimed = db.session.execute(
+            update(Job).where(
+                Job.id == candidate.id,
+                Job.status == candidate.status,
+                Job.locked_at.is_(None) if candidate.locked_at is None else Job.locked_at == candidate.locked_at,
+            ).values(status='running', locked_by=worker_id, locked_at=now, updated_at=now,
+                     attempts=Job.attempts + 1)
+        )
+        db.session.commit()
+        if claimed.rowcount == 1:
+            return db.session.get(Job, candidate.id)
+    return None
+
+
+def run_job(job):
+    """执行一个已领取的任务并记录结果；失败时按指数退避重新排队，超过次数标记为 failed"""
+    handler = JOB_HANDLERS.get(job.kind)
+    try:
+        if handler is None:
+            raise LookupError(f'No handler for job kind {job.kind}')
+        handler(json.loads(job.payload))
+    except Exception as e:
+        db.session.rollback()
+        job = db.session.get(Job, job.id)
+        job.last_error = f'{type(e).__name__}: {e}'
+        if job.attempts >= job.max_attempts:
+            job.status = 'failed'
+        else:
+            delay = current_app.config['JOB_RETRY_BACKOFF'] * 2 ** (job.attempts - 1)
+            job.status = 'pending'
+            job.run_at = datetime.utcnow() + timedelta(seconds=delay)
+        current_app.logger.warning('Job %s (%s) attempt %s failed: %s', job.id, job.kind, job.attempts, e)
+    else:
+        job = db.session.get(Job, job.id)
+        job.status = 'done'
+        job.last_error = None
+    job.locked_by = None
+    job.locked_at = None
+    job.updated_at = datetime.utcnow()
+    db.session.commit()
+    return job.status
+
+
+def run_pending(worker_id=None, limit=None):
+    """同步处理到期任务直到队列为空（或达到 limit），返回处理数量"""
+    worker_id = worker_id or _worker_id()
+    processed = 0
+    while limit is None or processed < limit:
+        job = claim(worker_id)
+        if job is None:
+            break
+        run_job(job)
+        processed += 1
+    return processed
+
+
+def queue_stats():
+    """按任务类型和状态统计数量"""
+    rows = db.session.query(Job.kind, Job.status, func.count()).group_by(Job.kind, Job.status).all()
+    stats = {}
+    for kind, status, count in rows:
+        stats.setdefault(kind, {})[status] = count
+    return stats
+
+
+def _worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+
+
+class JobWorker:
+    """轮询任务表的 worker 线程池，可在 Web 进程内运行，也可由 `flask jobs work` 单独运行"""
+
+    def __init__(self, app, threads):
+        self.app = app
+        self.threads = threads
+        self.poll_interval = app.config['JOB_POLL_INTERVAL']
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._workers = []
+
+    def start(self):
+        for i in range(self.threads):
+            thread = threading.Thread(target=self._run, name=f'job-worker-{i}', daemon=True)
+            thread.start()
+            self._workers.append(thread)
+
+    def wake(self):
+        self._wake.set()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wake.set()
+        for thread in self._workers:
+            thread.join(timeout)
+
+    def _run(self):
+        worker_id = _worker_id()
+        while not self._stop.is_set():
+            try:
+                with self.app.app_context():
+                    processed = run_pending(worker_id)
+                    db.session.remove()
+            except Exception:
+                processed = 0
+                self.app.logger.exception('Job worker error')
+            if not processed:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+
+class InProcessWorkers:
+    """一个应用在本进程内的 worker 线程池，首个请求时按进程启动"""
+
+    def __init__(self, app):
+        self.app = app
+        self._worker = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def ensure_worker(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._worker = JobWorker(self.app, self.app.config['JOB_INPROCESS_WORKERS'])
+            self._worker.start()
+
+    def notify(self):
+        if self._worker is not None and self._pid == os.getpid():
+            self._worker.wake()
+
+
+class JobQueue:
+    """
+    任务队列扩展；JOB_INPROCESS_WORKERS 大于 0 时在每个 Web 进程内启动 worker 线程
+
+    worker 状态按应用保存在 app.extensions['job_queue']。
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        workers = InProcessWorkers(app)
+        app.extensions['job_queue'] = workers
+        if app.config['JOB_INPROCESS_WORKERS'] > 0:
+            # 首个请求时按进程启动，预派生的 worker 在 fork 之后各自启动
+            app.before_request(workers.ensure_worker)
+
+    def notify(self):
+        """提交了新任务后唤醒进程内 worker，不必等到下一次轮询"""
+        current_app.extensions['job_queue'].notify()
+
+
+job_queue = JobQueue()
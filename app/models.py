@@ -21,6 +21,11 @@ class User(UserMixin, db.Model):
     location = db.Column(db.String(100))  # 所在地
     website = db.Column(db.String(200))  # 个人网站
     
+    # 冗余计数，随关注/取关/上传在同一事务内更新，避免渲染时 COUNT(*)
+    followers_count = db.Column(db.Integer, default=0)
+    following_count = db.Column(db.Integer, default=0)
+    public_songs_count = db.Column(db.Integer, default=0)
+    
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # 关系
@@ -53,11 +58,16 @@ class User(UserMixin, db.Model):
         if not self.is_following(user):
             follow = Follow(follower_id=self.id, followed_id=user.id)
             db.session.add(follow)
+            # 使用 SQL 表达式自增，避免并发下的读-改-写丢失
+            self.following_count = User.following_count + 1
+            user.followers_count = User.followers_count + 1
     
     def unfollow(self, user):
         follow = self.following.filter_by(followed_id=user.id).first()
         if follow:
             db.session.delete(follow)
+            self.following_count = User.following_count - 1
+            user.followers_count = User.followers_count - 1
     
     def is_following(self, user):
         return self.following.filter_by(followed_id=user.id).first() is not None
@@ -67,7 +77,7 @@ class User(UserMixin, db.Model):
     
     # 获取用户的公开音乐数量
     def get_public_songs_count(self):
-        return Song.query.filter_by(user_id=self.id, visibility='public').count()
+        return self.public_songs_count or 0
     
     # 获取用户的公开播放列表数量
     def get_public_playlists_count(self):
@@ -75,11 +85,11 @@ class User(UserMixin, db.Model):
     
     # 获取粉丝数量
     def get_followers_count(self):
-        return self.followers.count()
+        return self.followers_count or 0
     
     # 获取关注数量
     def get_following_count(self):
-        return self.following.count()
+        return self.following_count or 0
     
     def __repr__(self):
         return f'<User {self.username}>'
@@ -100,6 +110,18 @@ class Song(db.Model):
     visibility = db.Column(db.String(20), default='public')  # public, private
     play_count = db.Column(db.Integer, default=0)
     likes_count = db.Column(db.Integer, default=0)
+    comments_count = db.Column(db.Integer, default=0)
+    
+    # 首页、音乐库和我的音乐的过滤+排序组合索引
+    __table_args__ = (
+        db.Index('ix_song_visibility_play_count', 'visibility', 'play_count'),
+        db.Index('ix_song_visibility_upload_date', 'visibility', 'upload_date'),
+        db.Index('ix_song_user_id_upload_date', 'user_id', 'upload_date'),
+        # 封面按内容共享，删除前统计引用
+        db.Index('ix_song_cover_image', 'cover_image'),
+        # 音频按内容共享，删除前统计引用
+        db.Index('ix_song_file_path', 'file_path'),
+    )
     
     # 关系
     playlist_items = db.relationship('PlaylistItem', backref='song', lazy='dynamic')
@@ -115,7 +137,7 @@ class Playlist(db.Model):
     description = db.Column(db.Text)
     visibility = db.Column(db.String(20), default='public')  # public, private
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), index=True)
     
     # 关系
     items = db.relationship('PlaylistItem', backref='playlist', lazy='dynamic', cascade='all, delete-orphan')
@@ -130,6 +152,10 @@ class PlaylistItem(db.Model):
     added_at = db.Column(db.DateTime, default=datetime.utcnow)
     order = db.Column(db.Integer)
     
+    __table_args__ = (
+        db.Index('ix_playlist_item_playlist_id_order', 'playlist_id', 'order'),
+    )
+    
     def __repr__(self):
         return f'<PlaylistItem {self.id}>'
 
@@ -139,9 +165,97 @@ class Favorite(db.Model):
     song_id = db.Column(db.Integer, db.ForeignKey('song.id'))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # 同一用户对同一首歌只能收藏一次，同时作为收藏查询的索引
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'song_id', name='uq_favorite_user_id_song_id'),
+    )
+    
     def __repr__(self):
         return f'<Favorite user:{self.user_id} song:{self.song_id}>'
 
+class SongNeighbor(db.Model):
+    """离线计算的相似歌曲（共同收藏的余弦相似度），每首歌保留前 N 个"""
+    song_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    neighbor_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    score = db.Column(db.Float, nullable=False)
+
+    # 增量刷新时反查“谁把这首歌列为相似歌曲”
+    __table_args__ = (
+        db.Index('ix_song_neighbor_neighbor_id', 'neighbor_id'),
+    )
+
+    def __repr__(self):
+        return f'<SongNeighbor {self.song_id}->{self.neighbor_id} {self.score:.3f}>'
+
+class SongNeighborStale(db.Model):
+    """收藏变化的歌曲，等待增量刷新相似歌曲（只追加，刷新时去重清空）"""
+    id = db.Column(db.Integer, primary_key=True)
+    song_id = db.Column(db.Integer, nullable=False)
+
+    def __repr__(self):
+        return f'<SongNeighborStale {self.song_id}>'
+
+class CoverLookup(db.Model):
+    """封面搜索结果的持久缓存；payload 为空表示“未找到”"""
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)  # cover: 歌手+歌名的最佳封面，artist: 歌手的候选封面列表
+    lookup_key = db.Column(db.String(400), nullable=False)
+    payload = db.Column(db.Text)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    hits = db.Column(db.Integer, default=0, nullable=False)
+    misses = db.Column(db.Integer, default=0, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('kind', 'lookup_key', name='uq_cover_lookup_kind_lookup_key'),
+    )
+
+    def __repr__(self):
+        return f'<CoverLookup {self.kind}:{self.lookup_key}>'
+
+class Job(db.Model):
+    """数据库后台任务队列；dedup_key 保证同一任务同时只排队一次"""
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')
+    dedup_key = db.Column(db.String(200))
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, running, done, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_by = db.Column(db.String(100))
+    locked_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # worker 按状态和可执行时间取任务
+    __table_args__ = (
+        db.UniqueConstraint('dedup_key', name='uq_job_dedup_key'),
+        db.Index('ix_job_status_run_at', 'status', 'run_at'),
+    )
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.kind} {self.status}>'
+
+class UploadSession(db.Model):
+    """分块上传的进度；已接收的数据追加在 UPLOAD_PARTIAL_DIR 下的部分文件中"""
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    filename = db.Column(db.String(200), nullable=False)
+    ext = db.Column(db.String(10), nullable=False)
+    total_size = db.Column(db.BigInteger, nullable=False)
+    chunk_size = db.Column(db.Integer, nullable=False)
+    received_bytes = db.Column(db.BigInteger, nullable=False, default=0)
+    next_chunk = db.Column(db.Integer, nullable=False, default=0)
+    sha256 = db.Column(db.String(64))  # 客户端声明的整体哈希，完成时校验
+    locked_at = db.Column(db.DateTime)  # 正在写入分块
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f'<UploadSession {self.id} {self.received_bytes}/{self.total_size}>'
+
 class Comment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.Text, nullable=False)
@@ -149,6 +263,10 @@ class Comment(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     song_id = db.Column(db.Integer, db.ForeignKey('song.id'))
     
+    __table_args__ = (
+        db.Index('ix_comment_song_id_created_at', 'song_id', 'created_at'),
+    )
+    
     @property
     def local_created_at(self):
         """Return created_at converted from UTC to Asia/Shanghai (UTC+8) for display."""
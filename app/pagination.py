@@ -0,0 +1,129 @@
+import json
+from datetime import datetime
+
+from flask import current_app
+from itsdangerous import URLSafeSerializer, BadSignature
+from sqlalchemy import and_, or_, tuple_
+
+from app.cache import cache
+
+
+class KeysetPage:
+    """游标分页结果，属性命名与 Flask-SQLAlchemy 的 Pagination 保持一致，方便模板复用"""
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None, total=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+
+def _serializer():
+    return URLSafeSerializer(current_app.config['SECRET_KEY'], salt='keyset-cursor')
+
+
+def _dump_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    return value
+
+
+def _load_value(value):
+    if isinstance(value, dict) and 'dt' in value:
+        return datetime.fromisoformat(value['dt'])
+    return value
+
+
+def encode_cursor(direction, values):
+    """把排序键编码为带签名的不透明游标"""
+    return _serializer().dumps([direction, [_dump_value(v) for v in values]])
+
+
+def decode_cursor(token):
+    """解析游标，非法或被篡改的游标返回 None（即回到第一页）"""
+    try:
+        direction, values = _serializer().loads(token)
+    except (BadSignature, ValueError, TypeError):
+        return None
+    if direction not in ('next', 'prev') or not isinstance(values, list):
+        return None
+    return direction, [_load_value(v) for v in values]
+
+
+def _after(keys, values):
+    """构造排序键严格位于 values 之后的条件"""
+    directions = {descending for _, descending in keys}
+    if len(directions) == 1:
+        # 方向一致时用行值比较，数据库可以直接做索引范围扫描
+        columns = tuple_(*[column for column, _ in keys])
+        return columns < tuple_(*values) if directions.pop() else columns > tuple_(*values)
+
+    # 方向混合时展开为 (a > x) OR (a = x AND b > y) ...
+    clauses = []
+    for i, ((column, descending), value) in enumerate(zip(keys, values)):
+        equal_prefix = [keys[j][0] == values[j] for j in range(i)]
+        step = column < value if descending else column > value
+        clauses.append(and_(*equal_prefix, step))
+    return or_(*clauses)
+
+
+def _count_cache_key(key):
+    return 'count:' + json.dumps(list(key), ensure_ascii=False)
+
+
+def cached_count(key, query):
+    """
+    返回查询的总数，在 KEYSET_COUNT_TTL 秒内复用缓存结果，避免每次翻页都执行 COUNT(*)
+
+    总数存放在共享的页面缓存中，forget_count 对所有 worker 生效（CACHE_BACKEND 为 memory 时只在本进程）。
+    """
+    return cache.get_or_set(_count_cache_key(key), lambda: query.order_by(None).count(),
+                            ttl=current_app.config['KEYSET_COUNT_TTL'])
+
+
+def forget_count(key):
+    """数据变化后丢弃缓存的总数"""
+    cache.delete(_count_cache_key(key))
+
+
+def keyset_paginate(query, keys, cursor=None, per_page=20, count_key=None):
+    """
+    基于排序键的游标分页，深页和第一页一样只需一次索引范围扫描
+
+    keys 为 [(列或表达式, 是否降序)]，最后一列必须唯一（通常是 id）以保证顺序稳定。
+    count_key 不为空时附带缓存的总数。
+    """
+    decoded = decode_cursor(cursor) if cursor else None
+    direction, values = decoded if decoded and len(decoded[1]) == len(keys) else ('next', None)
+    backwards = direction == 'prev'
+
+    # 向前翻页时反转排序方向，取完再倒序
+    effective_keys = [(column, descending != backwards) for column, descending in keys]
+    page_query = query.order_by(None)
+    if values is not None:
+        page_query = page_query.filter(_after(effective_keys, values))
+    page_query = page_query.order_by(
+        *[column.desc() if descending else column.asc() for column, descending in effective_keys]
+    ).add_columns(*[column.label(f'_sort_key_{i}') for i, (column, _) in enumerate(keys)])
+
+    rows = page_query.limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    has_next = has_more if not backwards else True
+    has_prev = values is not None if not backwards else has_more
+    next_cursor = encode_cursor('next', rows[-1][1:]) if rows and has_next else None
+    prev_cursor = encode_cursor('prev', rows[0][1:]) if rows and has_prev else None
+
+    total = cached_count(count_key, query) if count_key is not None else None
+    return KeysetPage([row[0] for row in rows], next_cursor, prev_cursor, total)
@@ -0,0 +1,198 @@
+import abc
+import atexit
+import os
+import sqlite3
+import threading
+from collections import Counter
+
+from flask import current_app
+from sqlalchemy import bindparam, update
+
+from app import db
+from app.models import Song
+
+
+class _PlayCountBuffer(abc.ABC):
+    """播放次数缓冲的基类：累积增量，定期合并为每首歌一条 UPDATE"""
+
+    # 增量是否保存在进程之外，能被其他进程（如 `flask play-counts flush`）取出
+    shared = False
+
+    def __init__(self, app):
+        self.app = app
+        self.interval = app.config['PLAY_COUNT_FLUSH_INTERVAL']
+        self._pid = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+    def increment(self, song_id, n=1):
+        self._add({song_id: n})
+        self._ensure_flusher()
+
+    def flush(self):
+        """把缓冲的增量写入数据库，返回写入的歌曲数量"""
+        pending = self._drain()
+        if not pending:
+            return 0
+        try:
+            self._apply(pending)
+        except Exception:
+            # 写库失败时放回缓冲，下次再试，避免丢失播放次数
+            self._add(pending)
+            raise
+        return len(pending)
+
+    def close(self):
+        self._stop.set()
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"Play count flush error on shutdown: {e}")
+
+    def _apply(self, pending):
+        stmt = update(Song).where(Song.id == bindparam('song_id')).values(
+            play_count=db.func.coalesce(Song.play_count, 0) + bindparam('n')
+        )
+        with self.app.app_context():
+            with db.engine.begin() as connection:
+                connection.execute(stmt, [{'song_id': song_id, 'n': n}
+                                          for song_id, n in sorted(pending.items())])
+
+    def _ensure_flusher(self):
+        # 按进程启动后台线程；预派生的 worker 在 fork 之后各自启动
+        if self._pid == os.getpid():
+            return
+        with self._thread_lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._run, name='play-count-flusher', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Play count flush error: {e}")
+
+    @abc.abstractmethod
+    def _add(self, counts):
+        """把 {song_id: n} 累加进缓冲"""
+
+    @abc.abstractmethod
+    def _drain(self):
+        """取出并清空缓冲，返回 {song_id: n}"""
+
+
+class MemoryPlayCountBuffer(_PlayCountBuffer):
+    """单进程内存缓冲，每个 worker 各自累积、各自落库"""
+
+    def __init__(self, app):
+        super().__init__(app)
+        self._counts = Counter()
+        self._lock = threading.Lock()
+
+    def _add(self, counts):
+        with self._lock:
+            self._counts.update(counts)
+
+    def _drain(self):
+        with self._lock:
+            pending, self._counts = self._counts, Counter()
+        return dict(pending)
+
+
+class SpoolPlayCountBuffer(_PlayCountBuffer):
+    """多进程部署使用的本地 SQLite 旁路表，所有 worker 共享同一份增量"""
+
+    shared = True
+
+    def __init__(self, app):
+        super().__init__(app)
+        self.path = app.config['PLAY_COUNT_SPOOL_PATH']
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._local = threading.local()
+        with self._connect() as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS pending_plays '
+                '(song_id INTEGER PRIMARY KEY, n INTEGER NOT NULL)'
+            )
+
+    def _connect(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def _add(self, counts):
+        self._connect().executemany(
+            'INSERT INTO pending_plays (song_id, n) VALUES (?, ?) '
+            'ON CONFLICT(song_id) DO UPDATE SET n = n + excluded.n',
+            list(counts.items())
+        )
+
+    def _drain(self):
+        connection = self._connect()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            pending = dict(connection.execute('SELECT song_id, n FROM pending_plays').fetchall())
+            connection.execute('DELETE FROM pending_plays')
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        return pending
+
+
+class DirectPlayCountBuffer(_PlayCountBuffer):
+    """不缓冲，每次播放立即写库（旧行为，用于对比和调试）"""
+
+    def increment(self, song_id, n=1):
+        self._add({song_id: n})
+
+    def _add(self, counts):
+        self._apply(counts)
+
+    def _drain(self):
+        return {}
+
+
+PLAY_COUNT_BUFFERS = {
+    'memory': MemoryPlayCountBuffer,
+    'sqlite': SpoolPlayCountBuffer,
+    'direct': DirectPlayCountBuffer,
+}
+
+
+class PlayCounter:
+    """播放次数聚合扩展，按 PLAY_COUNT_MODE 选择缓冲实现"""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        buffer = PLAY_COUNT_BUFFERS[app.config['PLAY_COUNT_MODE']](app)
+        app.extensions['play_counter'] = buffer
+        # 进程退出时把剩余增量写回数据库
+        atexit.register(buffer.close)
+
+    def increment(self, song_id, n=1):
+        current_app.extensions['play_counter'].increment(song_id, n)
+
+    def flush(self):
+        return current_app.extensions['play_counter'].flush()
+
+    @property
+    def shared(self):
+        return current_app.extensions['play_counter'].shared
+
+
+play_counter = PlayCounter()
@@ -0,0 +1,203 @@
+import time
+from itertools import chain
+
+from flask import current_app
+from sqlalchemy import event, func, select
+
+from app import db
+from app.models import Song, Favorite, SongNeighbor, SongNeighborStale
+
+# 单条 IN 查询和批量写入的大小，兼顾 SQLite 的变量数量限制
+ID_BATCH = 500
+INSERT_BATCH = 10000
+LOAD_BATCH = 50000
+# 每次相乘的歌曲行数，限制共同收藏矩阵的峰值内存
+ROW_BLOCK = 1024
+
+
+def _load_favorites():
+    """读取全部 (user_id, song_id) 收藏对，忽略已删除歌曲的残留收藏"""
+    import numpy as np
+
+    stmt = select(Favorite.user_id, Favorite.song_id).join(
+        Song, Song.id == Favorite.song_id
+    ).where(Favorite.user_id.isnot(None))
+    # 直接在连接上分批读取（ORM 结果会先缓冲全部行），每批展开进 numpy 数组
+    result = db.session.connection().execute(stmt)
+    parts = [np.zeros((0, 2), dtype=np.int64)]
+    while True:
+        rows = result.fetchmany(LOAD_BATCH)
+        if not rows:
+            break
+        parts.append(np.fromiter(chain.from_iterable(rows), dtype=np.int64,
+                                 count=2 * len(rows)).reshape(-1, 2))
+    pairs = np.concatenate(parts)
+    return pairs[:, 0], pairs[:, 1]
+
+
+def _favorite_matrix(user_ids, song_ids):
+    """用户 × 歌曲的 0/1 稀疏矩阵（CSC，按列切片取歌曲），返回矩阵和列对应的歌曲 id"""
+    import numpy as np
+    from scipy import sparse
+
+    users, user_index = np.unique(user_ids, return_inverse=True)
+    songs, song_index = np.unique(song_ids, return_inverse=True)
+    matrix = sparse.csc_matrix(
+        (np.ones(len(song_index), dtype=np.float32), (user_index, song_index)),
+        shape=(len(users), len(songs))
+    )
+    matrix.data[:] = 1  # 合并重复收藏
+    return matrix, songs
+
+
+def _top_neighbors(matrix, rows, norms, limit):
+    """
+    计算 rows 这些歌曲与所有歌曲的余弦相似度并保留每行前 limit 个
+
+    共同收藏数 C = Xᵀ·X，相似度 = C[i, j] / sqrt(n_i · n_j)；全程向量化，没有逐行的 Python 循环。
+    返回 (song_index, neighbor_index, score) 三个数组。
+    """
+    import numpy as np
+
+    co_counts = (matrix[:, rows].T @ matrix).tocoo()
+    row_songs = rows[co_counts.row]
+    keep = row_songs != co_counts.col
+    row_songs, cols, counts = row_songs[keep], co_counts.col[keep], co_counts.data[keep]
+    scores = counts / (norms[row_songs] * norms[cols])
+
+    # 按 (歌曲, 相似度降序) 排序后，用每行起点计算名次，只保留前 limit 名
+    order = np.lexsort((-scores, row_songs))
+    row_songs, cols, scores = row_songs[order], cols[order], scores[order]
+    ranks = np.arange(len(row_songs)) - np.searchsorted(row_songs, row_songs, side='left')
+    top = ranks < limit
+    return row_songs[top], cols[top], scores[top]
+
+
+def _chunks(values, size):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def _insert_neighbors(song_ids, neighbor_ids, scores):
+    table = SongNeighbor.__table__
+    for start in range(0, len(scores), INSERT_BATCH):
+        end = start + INSERT_BATCH
+        db.session.execute(table.insert(), [
+            {'song_id': song_id, 'neighbor_id': neighbor_id, 'score': score}
+            for song_id, neighbor_id, score in zip(song_ids[start:end].tolist(),
+                                                   neighbor_ids[start:end].tolist(),
+                                                   scores[start:end].tolist())
+        ])
+
+
+def _previous_neighbors_of(song_ids):
+    """此前把这些歌曲列为相似歌曲的歌曲；取消收藏后它们的相似度也需要重算"""
+    affected = set()
+    for chunk in _chunks(song_ids, ID_BATCH):
+        affected.update(song_id for (song_id,) in db.session.query(SongNeighbor.song_id).filter(
+            SongNeighbor.neighbor_id.in_(chunk)
+        ).distinct())
+    return affected
+
+
+def refresh_neighbors(full=False, limit=None):
+    """
+    重建相似歌曲表
+
+    full 为 False 时只刷新收藏发生变化的歌曲及与它们有共同收藏的歌曲；
+    相似表为空时自动全量构建。返回统计信息字典。
+    """
+    import numpy as np
+
+    started = time.perf_counter()
+    limit = limit or current_app.config['RECOMMENDATION_NEIGHBORS']
+    stale_upto = db.session.query(func.max(SongNeighborStale.id)).scalar() or 0
+    if not full and db.session.query(SongNeighbor.song_id).first() is None:
+        full = True
+
+    user_ids, song_ids = _load_favorites()
+    matrix, songs = _favorite_matrix(user_ids, song_ids)
+    norms = np.sqrt(np.asarray(matrix.sum(axis=0)).ravel())
+    loaded = time.perf_counter() - started
+
+    if full:
+        rows = np.arange(len(songs))
+        refreshed = None
+    else:
+        stale = {song_id for (song_id,) in db.session.query(SongNeighborStale.song_id).filter(
+            SongNeighborStale.id <= stale_upto
+        ).distinct()}
+        refreshed = stale | _previous_neighbors_of(stale)
+        stale_rows = np.flatnonzero(np.isin(songs, list(stale)))
+        if len(stale_rows):
+            # 与变化歌曲有共同收藏的歌曲，相似度分母或分子都可能变化
+            co_favorited = (matrix[:, stale_rows].T @ matrix).tocsr().indices
+            refreshed.update(songs[np.unique(co_favorited)].tolist())
+        rows = np.flatnonzero(np.isin(songs, list(refreshed)))
+
+    if refreshed is None:
+        db.session.query(SongNeighbor).delete(synchronize_session=False)
+    else:
+        for chunk in _chunks(refreshed, ID_BATCH):
+            db.session.query(SongNeighbor).filter(
+                SongNeighbor.song_id.in_(chunk)
+            ).delete(synchronize_session=False)
+
+    # 按块计算并立即写入，峰值内存只与块大小有关
+    computing = 0.0
+    written = 0
+    for start in range(0, len(rows), ROW_BLOCK):
+        block_started = time.perf_counter()
+        song_index, neighbor_index, scores = _top_neighbors(matrix, rows[start:start + ROW_BLOCK], norms, limit)
+        computing += time.perf_counter() - block_started
+        _insert_neighbors(songs[song_index], songs[neighbor_index], scores)
+        written += len(scores)
+
+    db.session.query(SongNeighborStale).filter(
+        SongNeighborStale.id <= stale_upto
+    ).delete(synchronize_session=False)
+    db.session.commit()
+
+    return {
+        'full': full,
+        'favorites': len(song_ids),
+        'songs': len(rows),
+        'neighbors': written,
+        'build_seconds': loaded + computing,
+        'total_seconds': time.perf_counter() - started,
+    }
+
+
+def recommended_songs_query(user_id):
+    """
+    把用户收藏歌曲的相似歌曲按相似度求和排序，一次按 song_id 主键索引查找完成
+
+    已收藏和非公开的歌曲不会出现在结果中。
+    """
+    user_favorites = db.session.query(Favorite.song_id).filter(Favorite.user_id == user_id)
+    scores = db.session.query(
+        SongNeighbor.neighbor_id, func.sum(SongNeighbor.score).label('score')
+    ).filter(
+        SongNeighbor.song_id.in_(user_favorites),
+        SongNeighbor.neighbor_id.notin_(user_favorites)
+    ).group_by(SongNeighbor.neighbor_id).subquery()
+
+    return Song.query.join(scores, Song.id == scores.c.neighbor_id).filter(
+        Song.visibility == 'public'
+    ).order_by(scores.c.score.desc(), Song.play_count.desc(), Song.id.desc())
+
+
+def _mark_stale(connection, favorite):
+    if favorite.song_id is not None:
+        connection.execute(SongNeighborStale.__table__.insert(), {'song_id': favorite.song_id})
+
+
+@event.listens_for(Favorite, 'after_insert')
+def _favorite_added(mapper, connection, favorite):
+    _mark_stale(connection, favorite)
+
+
+@event.listens_for(Favorite, 'after_delete')
+def _favorite_removed(mapper, connection, favorite):
+    _mark_stale(connection, favorite)
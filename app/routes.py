@@ -1,17 +1,35 @@
 import os
 import uuid
-import requests
 import random
 import re
-from collections import Counter
 
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, send_from_directory, current_app, session
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, send_from_directory, send_file, current_app, session, abort
 from flask_login import current_user, login_required
 from flask_babel import _
 from werkzeug.utils import secure_filename
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
 from app import db
-from app.models import Song, Playlist, PlaylistItem, User, Comment, Favorite
-from app.forms import SongUploadForm, PlaylistForm, ProfileForm, CommentForm
+from app.models import Song, Playlist, PlaylistItem, User, Comment, Favorite, Job, UploadSession
+from app.forms import SongUploadForm, SongMetadataForm, PlaylistForm, ProfileForm, CommentForm
+from app.search import search_songs, search_sort_keys
+from app.pagination import keyset_paginate, forget_count
+from app.play_counts import play_counter
+from app.cache import cache
+from app.recommendations import recommended_songs_query
+from app.covers import resolve_cover, artist_cover_candidates, cover_job_key
+from app.cover_store import download_cover_image, release_cover
+from app.audio_store import (
+    store_audio_stream, release_audio, stored_audio_path, send_audio, is_audio_static_path,
+    set_audio_cache_headers, audio_version
+)
+from app.waveform import enqueue_waveform, waveform_path
+from app.audio_metadata import TAG_FIELDS, enqueue_metadata
+from app.chunked_uploads import UploadError, start_upload, write_chunk, finish_upload, discard_partial
+from app.image_variants import image_variants, enqueue_variants
+from app.upload_manifest import upload_manifest
+from app.jobs import enqueue, job_queue
+from app.http_clients import provider_clients
 
 bp = Blueprint('main', __name__)
 
@@ -29,196 +47,128 @@ def get_unique_filename(filename):
     unique_filename = f"{uuid.uuid4().hex}.{ext}"
     return unique_filename
 
-def search_netease_cover(artist, title, exclude_albums=None):
-    """搜索网易云音乐封面"""
-    if exclude_albums is None:
-        exclude_albums = set()
-    
-    try:
-        # 先精确搜索歌曲
-        search_url = "https://music.163.com/api/search/get/web"
-        params = {
-            'csrf_token': '',
-            's': f"{artist} {title}",
-            'type': 1,
-            'offset': 0,
-            'total': True,
-            'limit': 20
-        }
-        
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-            'Referer': 'https://music.163.com/'
-        }
-        
-        response = requests.get(search_url, params=params, headers=headers, timeout=10)
-        if response.status_code == 200:
-            data = response.json()
-            songs = data.get('result', {}).get('songs', [])
-            
-            # 收集所有匹配的专辑封面
-            covers = []
-            for song in songs:
-                song_artists = [ar.get('name', '') for ar in song.get('artists', [])]
-                if any(artist.lower() in ar.lower() or ar.lower() in artist.lower() for ar in song_artists):
-                    album = song.get('album', {})
-                    album_name = album.get('name', '')
-                    pic_url = album.get('picUrl', '')
-                    
-                    if pic_url and album_name not in exclude_albums:
-                        covers.append({
-                            'url': pic_url + '?param=600y600',
-                            'album': album_name,
-                            'title': song.get('name', ''),
-                            'match_score': 100 if title.lower() in song.get('name', '').lower() else 50
-                        })
-            
-            # 按匹配度排序，优先返回精确匹配的
-            if covers:
-                covers.sort(key=lambda x: x['match_score'], reverse=True)
-                return covers[0]['url']
-    except Exception as e:
-        print(f"NetEase search error: {e}")
-    return None
+def listing_query(query):
+    """列表页通用查询：JOIN 预加载上传者，评论数直接读取 Song.comments_count"""
+    return query.options(joinedload(Song.uploader))
 
+SONGS_PER_PAGE = 20
+SEARCH_RESULTS_PER_PAGE = 12
 
-def search_qq_music_cover(artist, title, exclude_albums=None):
-    """搜索QQ音乐封面"""
-    if exclude_albums is None:
-        exclude_albums = set()
-    
-    try:
-        # QQ音乐搜索API
-        search_url = "https://c.y.qq.com/soso/fcgi-bin/client_search_cp"
-        params = {
-            'ct': 24,
-            'qqmusic_ver': 1298,
-            'new_json': 1,
-            'remoteplace': 'txt.yqq.song',
-            'searchid': random.randint(100000000, 999999999),
-            't': 0,
-            'aggr': 1,
-            'cr': 1,
-            'catZhida': 1,
-            'lossless': 0,
-            'flag_qc': 0,
-            'p': 1,
-            'n': 20,
-            'w': f"{artist} {title}",
-            'g_tk': 5381,
-            'loginUin': 0,
-            'hostUin': 0,
-            'format': 'json',
-            'inCharset': 'utf8',
-            'outCharset': 'utf-8',
-            'notice': 0,
-            'platform': 'yqq.json',
-            'needNewCode': 0
-        }
-        
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-            'Referer': 'https://y.qq.com/'
-        }
-        
-        response = requests.get(search_url, params=params, headers=headers, timeout=10)
-        if response.status_code == 200:
-            data = response.json()
-            songs = data.get('data', {}).get('song', {}).get('list', [])
-            
-            # 收集所有匹配的专辑封面
-            covers = []
-            for song in songs:
-                song_artists = [singer.get('name', '') for singer in song.get('singer', [])]
-                if any(artist.lower() in ar.lower() or ar.lower() in artist.lower() for ar in song_artists):
-                    album = song.get('album', {})
-                    album_name = album.get('name', '')
-                    album_mid = album.get('mid', '')
-                    
-                    if album_mid and album_name not in exclude_albums:
-                        covers.append({
-                            'url': f"https://y.gtimg.cn/music/photo_new/T002R600x600M000{album_mid}.jpg",
-                            'album': album_name,
-                            'title': song.get('name', ''),
-                            'match_score': 100 if title.lower() in song.get('name', '').lower() else 50
-                        })
-            
-            # 按匹配度排序，优先返回精确匹配的
-            if covers:
-                covers.sort(key=lambda x: x['match_score'], reverse=True)
-                return covers[0]['url']
-    except Exception as e:
-        print(f"QQ Music search error: {e}")
-    return None
+# 游标分页的排序键，最后一列保证唯一
+NEWEST_FIRST = [(Song.upload_date, True), (Song.id, True)]
+FAVORITED_NEWEST_FIRST = [(Favorite.created_at, True), (Favorite.id, True)]
 
+def library_page(cursor):
+    query = listing_query(Song.query.filter_by(visibility='public'))
+    return keyset_paginate(query, NEWEST_FIRST, cursor, per_page=SONGS_PER_PAGE,
+                           count_key=('library',))
 
-def download_cover_image(cover_url, save_dir):
-    """下载封面图片并保存到本地"""
-    try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-            'Referer': 'https://music.163.com/'
-        }
-        response = requests.get(cover_url, headers=headers, timeout=30)
-        if response.status_code == 200:
-            # 生成唯一文件名
-            unique_filename = f"{uuid.uuid4().hex}.jpg"
-            save_path = os.path.join(save_dir, unique_filename)
-            
-            with open(save_path, 'wb') as f:
-                f.write(response.content)
-            
-            return unique_filename
-    except Exception as e:
-        print(f"Error downloading cover: {e}")
-    return None
+def my_music_page(cursor):
+    query = listing_query(Song.query.filter_by(user_id=current_user.id))
+    return keyset_paginate(query, NEWEST_FIRST, cursor, per_page=SONGS_PER_PAGE,
+                           count_key=('my_music', current_user.id))
+
+def forget_song_counts(user_id, public):
+    """歌曲增删或改变可见性后丢弃音乐库和“我的音乐”缓存的总数"""
+    forget_count(('my_music', user_id))
+    if public:
+        forget_count(('library',))
+
+def favorites_page(cursor):
+    query = listing_query(db.session.query(Song).join(Favorite).filter(
+        Favorite.user_id == current_user.id
+    ))
+    return keyset_paginate(query, FAVORITED_NEWEST_FIRST, cursor, per_page=SONGS_PER_PAGE,
+                           count_key=('favorites', current_user.id))
+
+def search_page(query, cursor):
+    return keyset_paginate(listing_query(search_songs(query)), search_sort_keys(), cursor,
+                           per_page=SEARCH_RESULTS_PER_PAGE, count_key=('search', query))
+
+COMMENTS_PER_PAGE = 20
+NEWEST_COMMENTS_FIRST = [(Comment.created_at, True), (Comment.id, True)]
+
+def comments_page(song_id, cursor):
+    """歌曲评论分页，JOIN 预加载评论作者"""
+    query = Comment.query.filter_by(song_id=song_id).options(joinedload(Comment.author))
+    return keyset_paginate(query, NEWEST_COMMENTS_FIRST, cursor, per_page=COMMENTS_PER_PAGE)
+
+def comment_to_dict(comment):
+    author = comment.author
+    return {
+        'id': comment.id,
+        'content': comment.content,
+        'author': author.username,
+        'author_url': url_for('main.user_profile', username=author.username),
+        'author_avatar': url_for('static', filename=author.avatar) if author.avatar else None,
+        'created_at': comment.created_at.strftime('%Y-%m-%d %H:%M'),
+        'display_time': comment.local_created_at.strftime('%m-%d %H:%M')
+    }
+
+def song_to_dict(song):
+    """列表 JSON 接口中的歌曲摘要，包含 song_player_dict 的全部字段"""
+    return {
+        'id': song.id,
+        'title': song.title,
+        'artist': song.artist,
+        'album': song.album,
+        'genre': song.genre,
+        'duration': song.duration,
+        'cover_image': url_for('static', filename=song.cover_image) if song.cover_image else None,
+        'cover_variants': image_variants(song.cover_image),
+        'file_path': url_for('main.stream_song', song_id=song.id, v=audio_version(song.file_path)),
+        'waveform': url_for('main.song_waveform', song_id=song.id, v=audio_version(song.file_path)),
+        'uploader': song.uploader.username if song.uploader else None,
+        'play_count': song.play_count,
+        'likes_count': song.likes_count,
+        'comments_count': song.comments_count,
+        'url': url_for('main.song_detail', song_id=song.id)
+    }
+
+def page_to_dict(page):
+    return {
+        'songs': [song_to_dict(song) for song in page.items],
+        'next_cursor': page.next_cursor,
+        'prev_cursor': page.prev_cursor,
+        'total': page.total
+    }
+
+HOME_SECTIONS_KEY = 'home:sections'
+HOME_SECTION_SIZE = 6
+
+def build_home_sections():
+    """首页公共区块：热门和最新歌曲，序列化为纯数据以便放入共享缓存"""
+    base_query = listing_query(Song.query.filter_by(visibility='public'))
+    popular = base_query.order_by(Song.play_count.desc(), Song.id.desc()).limit(HOME_SECTION_SIZE).all()
+    newest = base_query.order_by(Song.upload_date.desc(), Song.id.desc()).limit(HOME_SECTION_SIZE).all()
+    return {
+        'public_songs': [song_to_dict(song) for song in popular],
+        'new_songs': [song_to_dict(song) for song in newest]
+    }
+
+def invalidate_home_sections():
+    """公开歌曲集合变化后丢弃首页缓存"""
+    cache.delete(HOME_SECTIONS_KEY)
 
 @bp.route('/')
 def index():
-    # 公共热门歌曲
-    public_songs = Song.query.filter_by(visibility='public').order_by(Song.play_count.desc()).limit(6).all()
-    
-    # 新上传的公共歌曲
-    new_songs = Song.query.filter_by(visibility='public').order_by(Song.upload_date.desc()).limit(6).all()
-    
+    # 命中缓存时匿名访问不查询数据库
+    sections = cache.get_or_set(HOME_SECTIONS_KEY, build_home_sections,
+                                ttl=current_app.config['HOME_CACHE_TTL'])
     return render_template('index.html', title='Home', 
-                         public_songs=public_songs, new_songs=new_songs)
+                         public_songs=sections['public_songs'], new_songs=sections['new_songs'])
 
 @bp.route('/recommendations')
 def recommendations():
-    """基于用户收藏和歌曲风格的简单推荐列表。"""
-    base_query = Song.query.filter_by(visibility='public')
+    """基于共同收藏的相似歌曲推荐，相似度由 `flask recommendations refresh` 离线计算。"""
+    base_query = listing_query(Song.query.filter_by(visibility='public'))
     recommended_songs = []
 
     if current_user.is_authenticated:
-        # 当前用户收藏的歌曲
-        favorite_song_ids = [fav.song_id for fav in Favorite.query.filter_by(user_id=current_user.id).all()]
-
-        if favorite_song_ids:
-            liked_songs = Song.query.filter(Song.id.in_(favorite_song_ids)).all()
-            genres = [s.genre for s in liked_songs if s.genre]
-
-            if genres:
-                genre_counter = Counter(genres)
-                top_genres = [g for g, _ in genre_counter.most_common(3)]
-
-                # 推荐同风格但未被当前用户收藏的公共歌曲，按播放量+点赞数排序
-                recommended_songs = base_query.filter(
-                    Song.genre.in_(top_genres),
-                    ~Song.id.in_(favorite_song_ids)
-                ).order_by(
-                    Song.play_count.desc(),
-                    Song.likes_count.desc()
-                ).limit(20).all()
-
-        # 如果没有足够数据或没有收藏，退化为热门歌曲推荐
-        if not recommended_songs:
-            recommended_songs = base_query.order_by(
-                Song.play_count.desc(),
-                Song.likes_count.desc()
-            ).limit(20).all()
-    else:
-        # 未登录用户：简单返回热门公共歌曲
+        recommended_songs = listing_query(recommended_songs_query(current_user.id)).limit(20).all()
+
+    # 未登录、没有收藏或相似表尚未构建时，退化为热门歌曲推荐
+    if not recommended_songs:
         recommended_songs = base_query.order_by(
             Song.play_count.desc(),
             Song.likes_count.desc()
@@ -228,15 +178,92 @@ def recommendations():
                            title=_('Recommendations'),
                            songs=recommended_songs)
 
+def create_uploaded_song(form, audio_db_path, original_filename):
+    """
+    upload() 和分块上传完成时共用：保存封面、创建歌曲记录并加入后台任务，返回 Song
+
+    标题和艺术家留空时先用文件名占位，留空的字段由后台任务从音频标签填充。
+    出错时回滚并释放已保存的音频和封面，然后重新抛出异常。
+    """
+    cover_upload_dir = os.path.join(current_app.root_path, 'static', 'uploads', 'covers')
+    os.makedirs(cover_upload_dir, exist_ok=True)
+    cover_save_path = None
+    
+    try:
+        # 处理封面图片上传或自动搜索
+        cover_db_path = None
+        search_cover = False
+        
+        # 优先使用用户上传的封面
+        if form.cover_image.data and form.cover_image.data.filename:
+            cover_file = form.cover_image.data
+            if allowed_file(cover_file.filename, ALLOWED_IMAGE_EXTENSIONS):
+                cover_filename = secure_filename(cover_file.filename)
+                unique_cover_filename = get_unique_filename(cover_filename)
+                cover_save_path = os.path.join(cover_upload_dir, unique_cover_filename)
+                cover_file.save(cover_save_path)
+                upload_manifest.record(cover_save_path)
+                cover_db_path = os.path.join('uploads', 'covers', unique_cover_filename).replace('\\', '/')
+            else:
+                flash(_('Invalid image file type. Please use JPG, PNG, or GIF.'), 'warning')
+        
+        # 如果没有上传封面且勾选了自动搜索，提交后交给后台任务，不在请求内访问外部接口
+        elif form.auto_search_cover.data:
+            search_cover = True
+        
+        # 创建歌曲记录
+        fill = [field for field in TAG_FIELDS if not (getattr(form, field).data or '').strip()]
+        song = Song(
+            title=form.title.data or os.path.splitext(os.path.basename(original_filename))[0][:100],
+            artist=form.artist.data or '',
+            album=form.album.data or '',
+            genre=form.genre.data or '',
+            file_path=audio_db_path,
+            cover_image=cover_db_path,
+            user_id=current_user.id,
+            visibility=form.visibility.data
+        )
+        
+        db.session.add(song)
+        if song.visibility == 'public':
+            current_user.public_songs_count = User.public_songs_count + 1
+        
+        # 后台任务与歌曲在同一事务中提交，不会出现有歌无任务的情况
+        db.session.flush()
+        # 标题或艺术家要从标签读取时，等元数据填好再搜索封面
+        defer_cover = search_cover and ('title' in fill or 'artist' in fill)
+        enqueue_metadata(song, fill, fetch_cover=defer_cover)
+        enqueue_waveform(audio_db_path)
+        if search_cover and not defer_cover:
+            enqueue('fetch_cover', {'song_id': song.id}, dedup_key=cover_job_key(song.id))
+        # 上传的封面在后台生成缩略图
+        enqueue_variants(cover_db_path)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        # 如果出错，删除已上传的文件（音频可能与其他歌曲共用，只在没有引用时删除）
+        release_audio(audio_db_path)
+        if cover_save_path and os.path.exists(cover_save_path):
+            os.remove(cover_save_path)
+            upload_manifest.record(cover_save_path)
+        raise
+    
+    job_queue.notify()
+    forget_song_counts(current_user.id, song.visibility == 'public')
+    if song.visibility == 'public':
+        invalidate_home_sections()
+    if search_cover:
+        flash(_('Searching for an album cover in the background, it will appear on the song page shortly.'), 'info')
+    
+    visibility_msg = _('publicly shared') if form.visibility.data == 'public' else _('privately saved')
+    flash(_('🎵 Your song has been uploaded successfully and is %(status)s!', status=visibility_msg), 'success')
+    return song
+
 @bp.route('/upload', methods=['GET', 'POST'])
 @login_required
 def upload():
     form = SongUploadForm()
     
-    # 临时保存上传的文件信息
-    temp_audio_filename = None
-    temp_cover_filename = None
-    
     if form.validate_on_submit():
         # 检查音频文件
         audio_file = form.audio_file.data
@@ -249,132 +276,106 @@ def upload():
             return render_template('upload.html', title='Upload Song', form=form)
         
         try:
-            # 创建上传目录
-            upload_base = os.path.join(current_app.root_path, 'static', 'uploads')
-            audio_upload_dir = os.path.join(upload_base, 'audio')
-            cover_upload_dir = os.path.join(upload_base, 'covers')
-            
-            os.makedirs(audio_upload_dir, exist_ok=True)
-            os.makedirs(cover_upload_dir, exist_ok=True)
-            
-            # 处理音频文件上传
-            audio_filename = secure_filename(audio_file.filename)
-            unique_audio_filename = get_unique_filename(audio_filename)
-            audio_save_path = os.path.join(audio_upload_dir, unique_audio_filename)
-            audio_file.save(audio_save_path)
-            
-            # 数据库中的相对路径（统一用 / 分隔符以支持跨平台）
-            audio_db_path = os.path.join('uploads', 'audio', unique_audio_filename).replace('\\', '/')
-            
-            # 处理封面图片上传或自动搜索
-            cover_db_path = None
-            
-            # 优先使用用户上传的封面
-            if form.cover_image.data and form.cover_image.data.filename:
-                cover_file = form.cover_image.data
-                if allowed_file(cover_file.filename, ALLOWED_IMAGE_EXTENSIONS):
-                    cover_filename = secure_filename(cover_file.filename)
-                    unique_cover_filename = get_unique_filename(cover_filename)
-                    cover_save_path = os.path.join(cover_upload_dir, unique_cover_filename)
-                    cover_file.save(cover_save_path)
-                    cover_db_path = os.path.join('uploads', 'covers', unique_cover_filename).replace('\\', '/')
-                else:
-                    flash(_('Invalid image file type. Please use JPG, PNG, or GIF.'), 'warning')
-            
-            # 如果没有上传封面且勾选了自动搜索
-            elif form.auto_search_cover.data:
-                cover_url = None
-                search_source = None
-                
-                try:
-                    # 优先搜索网易云音乐
-                    cover_url = search_netease_cover(form.artist.data, form.title.data)
-                    if cover_url:
-                        search_source = _('NetEase Cloud Music')
-                    else:
-                        # 备选QQ音乐
-                        cover_url = search_qq_music_cover(form.artist.data, form.title.data)
-                        if cover_url:
-                            search_source = _('QQ Music')
-                        else:
-                            # 最后备选iTunes
-                            search_query = f"{form.artist.data} {form.title.data}"
-                            itunes_url = f"https://itunes.apple.com/search?term={requests.utils.quote(search_query)}&media=music&limit=1"
-                            
-                            response = requests.get(itunes_url, timeout=10)
-                            if response.status_code == 200:
-                                data = response.json()
-                                if data.get('results'):
-                                    result = data['results'][0]
-                                    cover_url = result.get('artworkUrl100', '').replace('100x100', '600x600')
-                                    if cover_url:
-                                        search_source = _('Apple Music')
-                    
-                    if cover_url:
-                        # 下载封面图片
-                        unique_cover_filename = download_cover_image(cover_url, cover_upload_dir)
-                        if unique_cover_filename:
-                            cover_db_path = os.path.join('uploads', 'covers', unique_cover_filename).replace('\\', '/')
-                            flash(_('🎨 Found and downloaded album cover from %(source)s!', source=search_source), 'success')
-                        else:
-                            flash(_('Cover download failed, please try again later.'), 'warning')
-                    else:
-                        flash(_('No album cover was found for this song.'), 'info')
-                        
-                except Exception as e:
-                    flash(_('Error occurred while searching for cover: %(error)s', error=str(e)), 'warning')
-            
-            # 创建歌曲记录
-            song = Song(
-                title=form.title.data,
-                artist=form.artist.data,
-                album=form.album.data or '',
-                genre=form.genre.data or '',
-                file_path=audio_db_path,
-                cover_image=cover_db_path,
-                user_id=current_user.id,
-                visibility=form.visibility.data
-            )
-            
-            db.session.add(song)
-            db.session.commit()
-            
-            visibility_msg = _('publicly shared') if form.visibility.data == 'public' else _('privately saved')
-            flash(_('🎵 Your song has been uploaded successfully and is %(status)s!', status=visibility_msg), 'success')
+            # 处理音频文件上传：边写边计算哈希，相同内容的文件共用一份
+            audio_ext = secure_filename(audio_file.filename).rsplit('.', 1)[1].lower()
+            audio_filename = store_audio_stream(audio_file.stream, audio_ext)
+            create_uploaded_song(form, stored_audio_path(audio_filename), audio_file.filename)
             return redirect(url_for('main.library'))
             
         except Exception as e:
-            db.session.rollback()
-            # 如果出错，删除已上传的文件
-            if 'audio_save_path' in locals() and os.path.exists(audio_save_path):
-                os.remove(audio_save_path)
-            if 'cover_save_path' in locals() and os.path.exists(cover_save_path):
-                os.remove(cover_save_path)
-                
             flash(_('Error uploading file: %(error)s', error=str(e)), 'error')
             print(f"Upload error: {e}")
     
     # 如果是GET请求或验证失败，显示表单（保留用户输入）
     return render_template('upload.html', title='Upload Song', form=form)
 
+def upload_session_or_404(upload_id):
+    upload = db.session.get(UploadSession, upload_id)
+    if upload is None or upload.user_id != current_user.id:
+        abort(404)
+    return upload
+
+def upload_status(upload):
+    return {
+        'upload_id': upload.id,
+        'chunk_size': upload.chunk_size,
+        'total_size': upload.total_size,
+        'received_bytes': upload.received_bytes,
+        'next_chunk': upload.next_chunk,
+        'chunks': -(-upload.total_size // upload.chunk_size)
+    }
+
+# 分块上传：创建会话 -> 按顺序上传分块（可随时查询进度后续传）-> 提交歌曲信息完成
+@bp.route('/api/uploads', methods=['POST'])
+@login_required
+def api_start_upload():
+    data = request.get_json(silent=True) or {}
+    try:
+        upload = start_upload(current_user.id, secure_filename(data.get('filename') or ''),
+                              data.get('size'), data.get('sha256'))
+    except UploadError as e:
+        return jsonify({'success': False, 'error': str(e)}), e.status
+    return jsonify(dict(upload_status(upload), success=True)), 201
+
+@bp.route('/api/uploads/<upload_id>')
+@login_required
+def api_upload_status(upload_id):
+    return jsonify(dict(upload_status(upload_session_or_404(upload_id)), success=True))
+
+@bp.route('/api/uploads/<upload_id>/chunks/<int:index>', methods=['PUT'])
+@login_required
+def api_upload_chunk(upload_id, index):
+    upload = upload_session_or_404(upload_id)
+    try:
+        write_chunk(upload, index, request.stream, request.content_length,
+                    request.headers.get('X-Chunk-SHA256'))
+    except UploadError as e:
+        return jsonify(dict(upload_status(upload), success=False, error=str(e))), e.status
+    return jsonify(dict(upload_status(upload), success=True))
+
+@bp.route('/api/uploads/<upload_id>/complete', methods=['POST'])
+@login_required
+def api_complete_upload(upload_id):
+    upload = upload_session_or_404(upload_id)
+    form = SongMetadataForm()
+    if not form.validate_on_submit():
+        return jsonify({'success': False, 'errors': form.errors}), 400
+    
+    try:
+        original_filename = upload.filename
+        audio_filename = finish_upload(upload)
+        song = create_uploaded_song(form, stored_audio_path(audio_filename), original_filename)
+    except UploadError as e:
+        return jsonify({'success': False, 'error': str(e)}), e.status
+    except Exception:
+        # 会话和部分文件仍在，客户端可以重试
+        current_app.logger.exception('Completing upload %s failed', upload_id)
+        return jsonify({'success': False, 'error': _('Upload failed, please try again.')}), 500
+    discard_partial(upload_id)
+    return jsonify({'success': True, 'song_id': song.id, 'redirect': url_for('main.library')})
+
 @bp.route('/library')
 def library():
-    page = request.args.get('page', 1, type=int)
-    # 只显示公开的音乐，并预加载上传者信息
-    songs = Song.query.filter_by(visibility='public')\
-                     .order_by(Song.upload_date.desc())\
-                     .paginate(page=page, per_page=20, error_out=False)
+    # 只显示公开的音乐，按上传时间游标分页
+    songs = library_page(request.args.get('cursor'))
     return render_template('library.html', title='Music Library', songs=songs)
 
+@bp.route('/api/library')
+def api_library():
+    return jsonify(page_to_dict(library_page(request.args.get('cursor'))))
+
 @bp.route('/my_music')
 @login_required
 def my_music():
     """显示用户的所有音乐（公开和私人）"""
-    page = request.args.get('page', 1, type=int)
-    songs = Song.query.filter_by(user_id=current_user.id).order_by(Song.upload_date.desc()).paginate(
-        page=page, per_page=20, error_out=False)
+    songs = my_music_page(request.args.get('cursor'))
     return render_template('my_music.html', title='My Music', songs=songs)
 
+@bp.route('/api/my_music')
+@login_required
+def api_my_music():
+    return jsonify(page_to_dict(my_music_page(request.args.get('cursor'))))
+
 @bp.route('/song/<int:song_id>/visibility', methods=['POST'])
 @login_required
 def update_song_visibility(song_id):
@@ -391,8 +392,15 @@ def update_song_visibility(song_id):
         flash(_('Invalid visibility value.'), 'error')
         return redirect(request.referrer or url_for('main.my_music'))
 
+    changed = song.visibility != new_visibility
+    if changed:
+        delta = 1 if new_visibility == 'public' else -1
+        current_user.public_songs_count = User.public_songs_count + delta
     song.visibility = new_visibility
     db.session.commit()
+    if changed:
+        forget_count(('library',))
+        invalidate_home_sections()
     return redirect(request.referrer or url_for('main.my_music'))
 
 @bp.route('/playlists')
@@ -424,7 +432,41 @@ def playlist_detail(playlist_id):
     playlist = Playlist.query.get_or_404(playlist_id)
     # 只获取仍然存在歌曲的播放列表项
     items = playlist.items.join(Song).order_by(PlaylistItem.order, PlaylistItem.added_at).all()
-    return render_template('playlist_detail.html', title=playlist.name, playlist=playlist, items=items)
+    # 总时长来自上传后提取的 Song.duration，不需要读取音频文件
+    total_duration = sum(item.song.duration or 0 for item in items)
+    return render_template('playlist_detail.html', title=playlist.name, playlist=playlist, items=items,
+                           total_duration=total_duration)
+
+@bp.route('/api/playlist/<int:playlist_id>/manifest')
+def api_playlist_manifest(playlist_id):
+    """
+    播放列表的播放清单：按顺序返回所有可播放曲目的音频地址和时长，一次查询
+
+    私有播放列表只有创建者可见；他人的私有歌曲不出现在清单中。响应带 ETag，内容未变时返回 304。
+    """
+    playlist = Playlist.query.get_or_404(playlist_id)
+    is_owner = current_user.is_authenticated and playlist.user_id == current_user.id
+    if playlist.visibility != 'public' and not is_owner:
+        abort(404)
+    
+    query = Song.query.join(PlaylistItem).filter(PlaylistItem.playlist_id == playlist.id)
+    if current_user.is_authenticated:
+        query = query.filter(db.or_(Song.visibility == 'public', Song.user_id == current_user.id))
+    else:
+        query = query.filter(Song.visibility == 'public')
+    tracks = [song_player_dict(song) for song in query.order_by(PlaylistItem.order, PlaylistItem.added_at)]
+    
+    response = jsonify({
+        'id': playlist.id,
+        'name': playlist.name,
+        'tracks': tracks,
+        'total_duration': sum(track['duration'] or 0 for track in tracks)
+    })
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.vary.add('Cookie')
+    response.add_etag()
+    return response.make_conditional(request)
 
 @bp.route('/api/add_to_playlist', methods=['POST'])
 @login_required
@@ -460,24 +502,23 @@ def api_add_to_playlist():
 @bp.route('/search')
 def search():
     query = request.args.get('q', '').strip()
-    page = request.args.get('page', 1, type=int)
     
     if query:
-        # 只在公开音乐中搜索
-        songs = Song.query.filter(
-            Song.visibility == 'public',
-            (Song.title.ilike(f'%{query}%')) | 
-            (Song.artist.ilike(f'%{query}%')) |
-            (Song.album.ilike(f'%{query}%')) |
-            (Song.genre.ilike(f'%{query}%'))
-        ).order_by(Song.title).paginate(
-            page=page, per_page=12, error_out=False)
+        # 只在公开音乐中搜索（FTS5 全文索引，按相关度排序）
+        songs = search_page(query, request.args.get('cursor'))
     else:
         # 如果没有搜索词，显示空结果
         songs = []
     
     return render_template('search.html', title='Search', songs=songs, query=query)
 
+@bp.route('/api/search')
+def api_search():
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'Query is required'}), 400
+    return jsonify(page_to_dict(search_page(query, request.args.get('cursor'))))
+
 # API端点 - 搜索歌曲封面
 @bp.route('/api/search_cover')
 def api_search_cover():
@@ -488,31 +529,9 @@ def api_search_cover():
         return jsonify({'error': 'Title and artist are required'}), 400
     
     try:
-        cover_url = None
-        source = None
-        
-        # 优先搜索网易云音乐
-        cover_url = search_netease_cover(artist, title)
-        if cover_url:
-            source = _('NetEase Cloud Music')
-        else:
-            # 备选QQ音乐
-            cover_url = search_qq_music_cover(artist, title)
-            if cover_url:
-                source = _('QQ Music')
-            else:
-                # 最后备选iTunes
-                search_query = f"{artist} {title}"
-                itunes_url = f"https://itunes.apple.com/search?term={requests.utils.quote(search_query)}&media=music&limit=1"
-                
-                response = requests.get(itunes_url, timeout=10)
-                if response.status_code == 200:
-                    data = response.json()
-                    if data.get('results'):
-                        result = data['results'][0]
-                        cover_url = result.get('artworkUrl100', '').replace('100x100', '600x600')
-                        if cover_url:
-                            source = _('Apple Music')
+        match = resolve_cover(artist, title)
+        cover_url = match.url if match else None
+        source = match.source if match else None
         
         if cover_url:
             return jsonify({
@@ -526,6 +545,12 @@ def api_search_cover():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
+@bp.route('/api/providers/status')
+@login_required
+def api_provider_status():
+    """各外部来源的熔断器状态、请求数和延迟分位数（当前进程）"""
+    return jsonify(provider_clients.stats())
+
 # API端点 - 更换歌曲封面
 @bp.route('/api/update_cover/<int:song_id>', methods=['POST'])
 @login_required
@@ -537,54 +562,13 @@ def api_update_cover(song_id):
         return jsonify({'success': False, 'error': 'Permission denied'}), 403
     
     try:
-        # 搜索新的封面图片
+        # 从缓存的歌手候选封面（iTunes 或 Last.fm）中随机挑一张
         cover_url = None
+        covers = artist_cover_candidates(song.artist)
+        if covers:
+            cover_url = random.choice(covers)
         
-        # 方案1: iTunes搜索艺术家的多个专辑
-        try:
-            itunes_url = f"https://itunes.apple.com/search?term={requests.utils.quote(song.artist)}&media=music&limit=20"
-            response = requests.get(itunes_url, timeout=10)
-            if response.status_code == 200:
-                data = response.json()
-                results = data.get('results', [])
-                
-                # 收集不同的专辑封面
-                covers = []
-                for result in results:
-                    result_artist = result.get('artistName', '').lower()
-                    if song.artist.lower() in result_artist or result_artist in song.artist.lower():
-                        cover_candidate = result.get('artworkUrl100', '').replace('100x100', '600x600')
-                        if cover_candidate and cover_candidate not in covers:
-                            covers.append(cover_candidate)
-                
-                if covers:
-                    cover_url = random.choice(covers)
-        except Exception as e:
-            print(f"iTunes search error: {e}")
-        
-        # 方案2: 如果iTunes失败，使用通用音乐封面API
-        if not cover_url:
-            try:
-                # 使用Last.fm API作为备选
-                lastfm_url = f"https://ws.audioscrobbler.com/2.0/?method=artist.gettopalbums&artist={requests.utils.quote(song.artist)}&api_key=b25b959554ed76058ac220b7b2e0a026&format=json&limit=10"
-                response = requests.get(lastfm_url, timeout=10)
-                if response.status_code == 200:
-                    data = response.json()
-                    albums = data.get('topalbums', {}).get('album', [])
-                    
-                    covers = []
-                    for album in albums:
-                        images = album.get('image', [])
-                        for img in images:
-                            if img.get('size') == 'extralarge' and img.get('#text'):
-                                covers.append(img.get('#text'))
-                    
-                    if covers:
-                        cover_url = random.choice(covers)
-            except Exception as e:
-                print(f"Last.fm search error: {e}")
-        
-        # 方案3: 最后备选 - 使用简单占位封面
+        # 最后备选 - 使用简单占位封面
         if not cover_url:
             try:
                 # 简单的备选封面URL列表
@@ -607,15 +591,18 @@ def api_update_cover(song_id):
             # 下载新封面
             unique_cover_filename = download_cover_image(cover_url, cover_upload_dir)
             if unique_cover_filename:
-                # 删除旧封面
-                if song.cover_image:
-                    old_cover_path = os.path.join(current_app.root_path, 'static', song.cover_image)
-                    if os.path.exists(old_cover_path):
-                        os.remove(old_cover_path)
-                
                 # 更新数据库
+                old_cover_image = song.cover_image
                 song.cover_image = os.path.join('uploads', 'covers', unique_cover_filename).replace('\\', '/')
+                enqueue_variants(song.cover_image)
                 db.session.commit()
+                job_queue.notify()
+                
+                # 提交后再释放旧封面，其他歌曲仍在使用时保留文件
+                if old_cover_image != song.cover_image:
+                    release_cover(old_cover_image)
+                if song.visibility == 'public':
+                    invalidate_home_sections()
                 
                 return jsonify({
                     'success': True,
@@ -631,31 +618,95 @@ def api_update_cover(song_id):
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
-# API端点 - 获取歌曲信息
-@bp.route('/api/song/<int:song_id>')
-def api_get_song(song_id):
+def can_view_song(song):
+    """公开歌曲所有人可见，私有歌曲只有上传者可见"""
+    return song.visibility == 'public' or (current_user.is_authenticated and song.user_id == current_user.id)
+
+@bp.before_app_request
+def protect_audio_static():
+    # 音频目录不经 static 直接访问，否则私有歌曲可以绕过可见性检查
+    if request.endpoint == 'static' and is_audio_static_path((request.view_args or {}).get('filename')):
+        abort(404)
+
+@bp.route('/song/<int:song_id>/audio')
+def stream_song(song_id):
+    """歌曲音频：检查可见性后发送文件，支持拖动进度时的 Range 请求"""
     song = Song.query.get_or_404(song_id)
-    
-    # 构建完整的文件路径
-    static_file_path = os.path.join(current_app.root_path, 'static', song.file_path)
-    file_exists = os.path.exists(static_file_path)
-    
-    # 如果文件存在，使用相对路径
-    if file_exists:
-        # 使用Flask的url_for生成正确的URL
-        audio_url = url_for('static', filename=song.file_path)
-    else:
-        # 使用一个不会被广告拦截器阻止的测试音频
-        audio_url = "https://assets.mixkit.co/music/preview/mixkit-tech-house-vibes-130.mp3"
-    
-    return jsonify({
+    if not can_view_song(song):
+        abort(404)
+    return send_audio(song.file_path)
+
+@bp.route('/song/<int:song_id>/waveform')
+def song_waveform(song_id):
+    """播放器进度条的波形峰值：int8 的 (最小值, 最大值) 交错数组，上传后由后台任务生成"""
+    song = Song.query.get_or_404(song_id)
+    if not can_view_song(song):
+        abort(404)
+    if not upload_manifest.exists(waveform_path(song.file_path)):
+        abort(404)
+    path = os.path.join(current_app.root_path, 'static', waveform_path(song.file_path))
+    try:
+        response = send_file(path, mimetype='application/octet-stream',
+                             etag=os.path.splitext(os.path.basename(path))[0])
+    except FileNotFoundError:
+        # 其他进程已删除，清单尚未刷新
+        upload_manifest.record(path)
+        abort(404)
+    return set_audio_cache_headers(response, audio_version(song.file_path))
+
+def song_player_dict(song):
+    """播放器需要的歌曲信息；单首、批量接口和页面内嵌数据共用"""
+    return {
         'id': song.id,
         'title': song.title,
         'artist': song.artist,
         'album': song.album,
-        'file_path': audio_url,
+        'duration': song.duration,
+        'file_path': url_for('main.stream_song', song_id=song.id, v=audio_version(song.file_path)),
+        'waveform': url_for('main.song_waveform', song_id=song.id, v=audio_version(song.file_path)),
         'cover_image': url_for('static', filename=song.cover_image) if song.cover_image else None
-    })
+    }
+
+# API端点 - 获取歌曲信息
+@bp.route('/api/song/<int:song_id>')
+def api_get_song(song_id):
+    song = Song.query.get_or_404(song_id)
+    if not can_view_song(song):
+        abort(404)
+    return jsonify(song_player_dict(song))
+
+# 批量接口单次最多返回的歌曲数
+API_SONGS_MAX_IDS = 100
+
+@bp.route('/api/songs')
+def api_get_songs():
+    """
+    一次查询返回多首歌曲的播放信息：/api/songs?ids=1,2,3，按请求顺序返回，看不到的歌曲直接省略
+
+    响应带 ETag，客户端重新验证时内容未变返回 304。
+    """
+    try:
+        ids = [int(value) for value in request.args.get('ids', '').split(',') if value.strip()]
+    except ValueError:
+        return jsonify({'success': False, 'error': 'ids must be comma-separated integers'}), 400
+    ids = list(dict.fromkeys(ids))[:API_SONGS_MAX_IDS]
+    
+    songs = {}
+    if ids:
+        query = Song.query.filter(Song.id.in_(ids))
+        if current_user.is_authenticated:
+            query = query.filter(db.or_(Song.visibility == 'public', Song.user_id == current_user.id))
+        else:
+            query = query.filter(Song.visibility == 'public')
+        songs = {song.id: song for song in query}
+    
+    response = jsonify({'songs': [song_player_dict(songs[song_id]) for song_id in ids if song_id in songs]})
+    # 结果取决于登录用户能看到的私有歌曲，只允许浏览器缓存，每次使用前重新验证
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.vary.add('Cookie')
+    response.add_etag()
+    return response.make_conditional(request)
 
 # 社交功能路由
 @bp.route('/user/<username>')
@@ -713,10 +764,14 @@ def edit_profile():
                 avatar_path = os.path.join('uploads', 'avatars', unique_avatar_filename)
                 
                 # 保存文件
-                avatar_file.save(os.path.join(current_app.root_path, 'static', avatar_path))
+                avatar_save_path = os.path.join(current_app.root_path, 'static', avatar_path)
+                avatar_file.save(avatar_save_path)
+                upload_manifest.record(avatar_save_path)
                 current_user.avatar = avatar_path
+                enqueue_variants(avatar_path)
         
         db.session.commit()
+        job_queue.notify()
         flash(_('Your profile has been updated!'), 'success')
         return redirect(url_for('main.user_profile', username=current_user.username))
     
@@ -764,16 +819,15 @@ def song_detail(song_id):
     song = Song.query.get_or_404(song_id)
     
     # 只允许查看公开歌曲，或者是自己的歌曲
-    if song.visibility != 'public' and (not current_user.is_authenticated or song.user_id != current_user.id):
+    if not can_view_song(song):
         flash(_('This song is not available.'), 'error')
         return redirect(url_for('main.index'))
     
-    # 增加播放次数
-    song.play_count += 1
-    db.session.commit()
+    # 增加播放次数（先进入缓冲，由后台线程批量写库）
+    play_counter.increment(song.id)
     
-    # 获取评论
-    comments = Comment.query.filter_by(song_id=song_id).order_by(Comment.created_at.desc()).all()
+    # 只渲染第一页评论，更早的评论由前端通过 JSON 接口按游标加载
+    comments = comments_page(song_id, None)
     
     # 检查当前用户是否收藏了这首歌
     is_favorited = False
@@ -783,12 +837,33 @@ def song_detail(song_id):
     # 评论表单
     form = CommentForm()
     
+    # 封面仍在后台搜索时，页面轮询歌曲接口直到封面出现
+    cover_pending = not song.cover_image and Job.query.filter(
+        Job.dedup_key == cover_job_key(song.id),
+        Job.status.in_(['pending', 'running'])
+    ).first() is not None
+    
     return render_template('song_detail.html', 
                          title=f"{song.title} - {song.artist}",
                          song=song, 
                          comments=comments, 
                          form=form,
-                         is_favorited=is_favorited)
+                         is_favorited=is_favorited,
+                         cover_pending=cover_pending)
+
+@bp.route('/song/<int:song_id>/comments')
+def api_song_comments(song_id):
+    """按游标分页返回更早的评论"""
+    song = Song.query.get_or_404(song_id)
+    if not can_view_song(song):
+        return jsonify({'success': False, 'error': 'Song not available'}), 404
+    
+    comments = comments_page(song_id, request.args.get('cursor'))
+    return jsonify({
+        'success': True,
+        'comments': [comment_to_dict(comment) for comment in comments.items],
+        'next_cursor': comments.next_cursor
+    })
 
 @bp.route('/song/<int:song_id>/comment', methods=['POST'])
 @login_required
@@ -803,18 +878,15 @@ def add_comment(song_id):
             song_id=song_id
         )
         db.session.add(comment)
+        song.comments_count = Song.comments_count + 1
         db.session.commit()
         
         # 如果是通过AJAX提交（前端设置了 X-Requested-With）则返回JSON
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
             return jsonify({
                 'success': True,
-                'comment': {
-                    'id': comment.id,
-                    'content': comment.content,
-                    'author': comment.author.username,
-                    'created_at': comment.created_at.strftime('%Y-%m-%d %H:%M')
-                }
+                'comment': comment_to_dict(comment),
+                'comments_count': song.comments_count
             })
         else:
             flash(_('Comment added successfully!'), 'success')
@@ -826,6 +898,23 @@ def add_comment(song_id):
         flash(_('Please enter a valid comment.'), 'error')
         return redirect(url_for('main.song_detail', song_id=song_id))
 
+@bp.route('/comment/<int:comment_id>/delete', methods=['POST'])
+@login_required
+def delete_comment(comment_id):
+    """删除评论：评论作者和歌曲上传者可以删除"""
+    comment = Comment.query.get_or_404(comment_id)
+    song = comment.song
+    if current_user.id not in (comment.user_id, song.user_id):
+        abort(403)
+    db.session.delete(comment)
+    song.comments_count = db.case((Song.comments_count > 0, Song.comments_count - 1), else_=0)
+    db.session.commit()
+    
+    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        return jsonify({'success': True, 'comments_count': song.comments_count})
+    flash(_('Comment deleted.'), 'success')
+    return redirect(url_for('main.song_detail', song_id=song.id))
+
 @bp.route('/song/<int:song_id>/favorite', methods=['POST'])
 @login_required
 def toggle_favorite(song_id):
@@ -841,18 +930,26 @@ def toggle_favorite(song_id):
     if favorite:
         # 取消收藏
         db.session.delete(favorite)
-        song.likes_count = max(0, song.likes_count - 1)
+        # 使用 SQL 表达式增减，避免并发请求的读-改-写相互覆盖
+        song.likes_count = db.case((Song.likes_count > 0, Song.likes_count - 1), else_=0)
         is_favorited = False
         message = _('Removed from favorites')
     else:
         # 添加收藏
         favorite = Favorite(user_id=current_user.id, song_id=song_id)
         db.session.add(favorite)
-        song.likes_count += 1
+        song.likes_count = Song.likes_count + 1
         is_favorited = True
         message = _('Added to favorites')
     
-    db.session.commit()
+    try:
+        db.session.commit()
+        forget_count(('favorites', current_user.id))
+    except IntegrityError:
+        # 并发的重复收藏请求被唯一约束拦截，结果等同于已收藏
+        db.session.rollback()
+        is_favorited = True
+        message = _('Added to favorites')
     
     if request.is_json:
         return jsonify({
@@ -869,14 +966,14 @@ def toggle_favorite(song_id):
 @login_required
 def favorites():
     """用户收藏的歌曲列表"""
-    page = request.args.get('page', 1, type=int)
-    favorites = db.session.query(Song).join(Favorite).filter(
-        Favorite.user_id == current_user.id
-    ).order_by(Favorite.created_at.desc()).paginate(
-        page=page, per_page=20, error_out=False
-    )
+    favorites = favorites_page(request.args.get('cursor'))
     return render_template('favorites.html', title='My Favorites', songs=favorites)
 
+@bp.route('/api/favorites')
+@login_required
+def api_favorites():
+    return jsonify(page_to_dict(favorites_page(request.args.get('cursor'))))
+
 @bp.route('/delete_song/<int:song_id>', methods=['POST'])
 @login_required
 def delete_song(song_id):
@@ -888,21 +985,22 @@ def delete_song(song_id):
         return redirect(url_for('main.library'))
     
     try:
-        # 删除物理文件
-        if song.file_path:
-            audio_path = os.path.join(current_app.root_path, 'static', song.file_path)
-            if os.path.exists(audio_path):
-                os.remove(audio_path)
-        
-        if song.cover_image:
-            cover_path = os.path.join(current_app.root_path, 'static', song.cover_image)
-            if os.path.exists(cover_path):
-                os.remove(cover_path)
-        
         # 从数据库删除
+        file_path = song.file_path
+        cover_image = song.cover_image
+        was_public = song.visibility == 'public'
+        if was_public:
+            current_user.public_songs_count = User.public_songs_count - 1
         db.session.delete(song)
         db.session.commit()
         
+        # 音频和封面文件按内容在歌曲间共享，提交后只在没有其他引用时删除
+        release_audio(file_path)
+        release_cover(cover_image)
+        forget_song_counts(current_user.id, was_public)
+        if was_public:
+            invalidate_home_sections()
+        
         flash(_('Song deleted successfully!'), 'success')
         
     except Exception as e:
@@ -0,0 +1,179 @@
+import re
+import threading
+import time
+import weakref
+from sqlalchemy import event, text, table, column, literal_column, or_, false
+from sqlalchemy.engine import Engine
+from app import db
+from app.models import Song
+
+# SQLite FTS5 全文索引，只收录公开歌曲；rowid 即 Song.id
+FTS_TABLE = 'song_fts'
+FTS_COLUMNS = ('title', 'artist', 'album', 'genre')
+# bm25 列权重：标题 > 艺术家 > 专辑 > 风格
+FTS_WEIGHTS = (10.0, 5.0, 2.0, 1.0)
+CREATE_FTS_SQL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+    f"USING fts5({', '.join(FTS_COLUMNS)}, tokenize='unicode61 remove_diacritics 2')"
+)
+
+# 索引是否存在的检查结果按 engine 缓存的秒数；其他进程建立或删除索引后最多这么久被发现
+FTS_CHECK_INTERVAL = 30
+
+# 中日韩字符没有空格分词，索引和查询时都按单字切开，用短语查询保证连续匹配
+CJK_CHARS = '\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff'
+_CJK_RE = re.compile(f'([{CJK_CHARS}])')
+_TOKEN_RE = re.compile(f'[{CJK_CHARS}]+|[^\\W_{CJK_CHARS}]+')
+
+
+def segment(value):
+    """在中日韩字符两侧插入空格，让 unicode61 分词器按单字建立索引"""
+    if not value:
+        return ''
+    return _CJK_RE.sub(r' \1 ', value)
+
+
+def build_match_query(query):
+    """把用户输入转换为 FTS5 MATCH 表达式：拉丁词做前缀匹配，中文按短语匹配"""
+    terms = []
+    for token in _TOKEN_RE.findall(query or ''):
+        if _CJK_RE.match(token):
+            terms.append('"%s"' % ' '.join(token))
+        else:
+            terms.append('"%s"*' % token)
+    return ' '.join(terms)
+
+
+_fts_state = weakref.WeakKeyDictionary()  # {engine: (索引是否存在, 检查时间)}
+_fts_state_lock = threading.Lock()
+
+
+def fts_enabled(bind):
+    """
+    当前数据库是否可以使用 FTS 索引（仅 SQLite 且已建表）
+
+    查询 sqlite_master 的结果按 engine 缓存 FTS_CHECK_INTERVAL 秒，建表或删表后不会一直沿用：
+    本进程重建索引时直接更新缓存，语句因索引不存在而失败时清除缓存。
+    """
+    if bind.dialect.name != 'sqlite':
+        return False
+    engine = bind.engine
+    cached = _fts_state.get(engine)
+    if cached is not None and time.monotonic() - cached[1] < FTS_CHECK_INTERVAL:
+        return cached[0]
+    present = bind.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+        {'name': FTS_TABLE}
+    ).first() is not None
+    _set_fts_state(engine, present)
+    return present
+
+
+def _set_fts_state(engine, present):
+    with _fts_state_lock:
+        if present is None:
+            _fts_state.pop(engine, None)
+        else:
+            _fts_state[engine] = (present, time.monotonic())
+
+
+@event.listens_for(Engine, 'handle_error')
+def _forget_missing_index(context):
+    # 索引被其他进程删除：本次语句失败，之后重新检查并退化为 ILIKE
+    if FTS_TABLE in (context.statement or '') and 'no such table' in str(context.original_exception):
+        _set_fts_state(context.engine, None)
+
+
+def _index_row(song):
+    row = {column_name: segment(getattr(song, column_name)) for column_name in FTS_COLUMNS}
+    row['id'] = song.id
+    return row
+
+
+def _sync_song(connection, song):
+    connection.execute(text(f'DELETE FROM {FTS_TABLE} WHERE rowid = :id'), {'id': song.id})
+    if song.visibility == 'public':
+        connection.execute(
+            text(f"INSERT INTO {FTS_TABLE} (rowid, {', '.join(FTS_COLUMNS)}) "
+                 f"VALUES (:id, {', '.join(':' + c for c in FTS_COLUMNS)})"),
+            _index_row(song)
+        )
+
+
+@event.listens_for(Song, 'after_insert')
+def _song_inserted(mapper, connection, song):
+    if fts_enabled(connection):
+        _sync_song(connection, song)
+
+
+@event.listens_for(Song, 'after_update')
+def _song_updated(mapper, connection, song):
+    # 先看索引列是否变化，播放次数等计数更新不必检查索引
+    state = db.inspect(song)
+    if not any(state.attrs[name].history.has_changes() for name in FTS_COLUMNS + ('visibility',)):
+        return
+    if fts_enabled(connection):
+        _sync_song(connection, song)
+
+
+@event.listens_for(Song, 'after_delete')
+def _song_deleted(mapper, connection, song):
+    if fts_enabled(connection):
+        connection.execute(text(f'DELETE FROM {FTS_TABLE} WHERE rowid = :id'), {'id': song.id})
+
+
+def search_songs(query):
+    """公开歌曲搜索：SQLite 上走 FTS5 按 bm25 相关度排序，其他数据库退化为 ILIKE"""
+    if fts_enabled(db.session.connection()):
+        match = build_match_query(query)
+        if not match:
+            return Song.query.filter(false())
+        fts = table(FTS_TABLE, column('rowid'))
+        return Song.query.join(fts, fts.c.rowid == Song.id).filter(
+            Song.visibility == 'public',
+            text(f'{FTS_TABLE} MATCH :match').bindparams(match=match)
+        ).order_by(*[key for key, _ in search_sort_keys()])
+
+    pattern = f'%{query}%'
+    return Song.query.filter(
+        Song.visibility == 'public',
+        or_(Song.title.ilike(pattern),
+            Song.artist.ilike(pattern),
+            Song.album.ilike(pattern),
+            Song.genre.ilike(pattern))
+    ).order_by(*[key for key, _ in search_sort_keys()])
+
+
+def search_sort_keys():
+    """search_songs() 结果的排序键 [(表达式, 是否降序)]，供游标分页使用"""
+    if fts_enabled(db.session.connection()):
+        rank = db.func.bm25(literal_column(FTS_TABLE), *FTS_WEIGHTS)
+        return [(rank, False), (Song.id, False)]
+    return [(Song.title, False), (Song.id, False)]
+
+
+def rebuild_index(batch_size=1000):
+    """重建 FTS 索引，返回收录的歌曲数量"""
+    connection = db.session.connection()
+    if connection.dialect.name != 'sqlite':
+        return None
+
+    connection.execute(text(f'DROP TABLE IF EXISTS {FTS_TABLE}'))
+    connection.execute(text(CREATE_FTS_SQL))
+    _set_fts_state(connection.engine, True)
+    insert = text(f"INSERT INTO {FTS_TABLE} (rowid, {', '.join(FTS_COLUMNS)}) "
+                  f"VALUES (:id, {', '.join(':' + c for c in FTS_COLUMNS)})")
+
+    indexed = 0
+    last_id = 0
+    while True:
+        songs = Song.query.filter(Song.visibility == 'public', Song.id > last_id)\
+                          .order_by(Song.id).limit(batch_size).all()
+        if not songs:
+            break
+        connection.execute(insert, [_index_row(song) for song in songs])
+        indexed += len(songs)
+        last_id = songs[-1].id
+
+    db.session.commit()
+    return indexed
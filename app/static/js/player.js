@@ -2,9 +2,117 @@
 let currentPlayButton = null;
 let allPlayButtons = {};
 
+// 歌曲播放信息缓存：页面内嵌的数据和接口返回的数据都放在这里，重复播放或切歌不再请求
+const songCache = new Map();
+
+function cacheSongs(songs) {
+    songs.forEach(song => songCache.set(String(song.id), song));
+}
+
+// 读取页面内嵌的 <script type="application/json" class="player-songs">
+function loadEmbeddedSongs() {
+    document.querySelectorAll('script.player-songs').forEach(el => {
+        try {
+            cacheSongs(JSON.parse(el.textContent));
+        } catch (error) {
+            console.error('解析歌曲数据失败:', error);
+        }
+    });
+}
+
+// 批量获取歌曲信息，只请求缓存中没有的
+function getSongs(songIds) {
+    const missing = songIds.map(String).filter(id => !songCache.has(id));
+    const done = () => songIds.map(id => songCache.get(String(id))).filter(Boolean);
+    if (!missing.length) {
+        return Promise.resolve(done());
+    }
+    return fetch(`/api/songs?ids=${missing.join(',')}`)
+        .then(response => response.json())
+        .then(data => {
+            cacheSongs(data.songs || []);
+            return done();
+        });
+}
+
+function getSong(songId) {
+    return getSongs([songId]).then(songs => {
+        if (!songs.length) throw new Error(`Song ${songId} not found`);
+        return songs[0];
+    });
+}
+
+// 播放队列：从播放列表播放时按清单顺序自动播放下一首
+let playQueue = [];
+let queueIndex = -1;
+const manifestCache = new Map();
+// 当前曲目剩余多少秒时开始缓冲下一首
+const PREFETCH_SECONDS = 30;
+let preloader = null;
+
+function loadManifest(url) {
+    if (!manifestCache.has(url)) {
+        manifestCache.set(url, fetch(url)
+            .then(response => {
+                if (!response.ok) throw new Error(`Manifest ${url}: ${response.status}`);
+                return response.json();
+            })
+            .then(manifest => {
+                cacheSongs(manifest.tracks);
+                return manifest;
+            })
+            .catch(error => {
+                manifestCache.delete(url);
+                throw error;
+            }));
+    }
+    return manifestCache.get(url);
+}
+
+// 按清单建立队列并从 songId（默认第一首）开始播放
+function playFromManifest(url, songId) {
+    loadManifest(url)
+        .then(manifest => {
+            playQueue = manifest.tracks.map(track => String(track.id));
+            if (!playQueue.length) return;
+            queueIndex = songId ? Math.max(0, playQueue.indexOf(String(songId))) : 0;
+            playAudio(playQueue[queueIndex]);
+        })
+        .catch(error => {
+            console.error('获取播放清单失败:', error);
+            if (songId) playAudio(songId);
+        });
+}
+
+function playNext() {
+    if (queueIndex < 0 || queueIndex + 1 >= playQueue.length) return false;
+    queueIndex += 1;
+    playAudio(playQueue[queueIndex]);
+    return true;
+}
+
+// 下一首快开始时用隐藏的 audio 元素预先缓冲开头部分（Range 请求），切歌时直接命中浏览器缓存
+function prefetchNext(audioPlayer) {
+    if (queueIndex < 0 || queueIndex + 1 >= playQueue.length || !audioPlayer.duration) return;
+    if (audioPlayer.duration - audioPlayer.currentTime > PREFETCH_SECONDS) return;
+    const next = songCache.get(playQueue[queueIndex + 1]);
+    if (!next || (preloader && preloader.dataset.songId === String(next.id))) return;
+    
+    preloader = preloader || new Audio();
+    preloader.preload = 'auto';
+    preloader.muted = true;
+    preloader.dataset.songId = String(next.id);
+    preloader.src = next.file_path;
+    preloader.load();
+    if (next.waveform) fetch(next.waveform).catch(() => {});
+}
+
 // 播放音频函数
 function playAudio(songId) {
     const audioPlayer = document.getElementById('main-audio');
+    // 播放队列外的歌曲时结束队列
+    queueIndex = playQueue.indexOf(String(songId));
+    if (queueIndex < 0) playQueue = [];
     const playerContainer = document.getElementById('audio-player');
     const playButton = document.querySelector(`[data-song-id="${songId}"]`) || document.getElementById(`play-btn-${songId}`);
     
@@ -28,9 +136,8 @@ function playAudio(songId) {
         return;
     }
     
-    // 获取歌曲信息
-    fetch(`/api/song/${songId}`)
-        .then(response => response.json())
+    // 获取歌曲信息（优先使用缓存）
+    getSong(songId)
         .then(data => {
             // 先暂停当前播放
             audioPlayer.pause();
@@ -42,6 +149,7 @@ function playAudio(songId) {
             audioPlayer.src = data.file_path;
             audioPlayer.dataset.currentSong = songId;
             audioPlayer.load();
+            loadWaveform(data.waveform, songId);
             
             // 显示播放器
             playerContainer.style.display = 'block';
@@ -62,6 +170,64 @@ function playAudio(songId) {
         });
 }
 
+// 波形：服务器预先计算的 int8 (最小值, 最大值) 交错数组，不需要下载音频
+let waveformPeaks = null;
+
+function loadWaveform(url, songId) {
+    const canvas = document.getElementById('player-waveform');
+    if (!canvas) return;
+    waveformPeaks = null;
+    canvas.style.display = 'none';
+    if (!url) return;
+    
+    fetch(url)
+        .then(response => response.ok ? response.arrayBuffer() : null)
+        .then(buffer => {
+            const audioPlayer = document.getElementById('main-audio');
+            // 加载期间已切换到别的歌曲
+            if (!buffer || audioPlayer.dataset.currentSong != songId) return;
+            waveformPeaks = new Int8Array(buffer);
+            canvas.style.display = 'block';
+            drawWaveform();
+        })
+        .catch(error => {
+            console.error('获取波形失败:', error);
+        });
+}
+
+function drawWaveform() {
+    const canvas = document.getElementById('player-waveform');
+    const audioPlayer = document.getElementById('main-audio');
+    if (!canvas || !waveformPeaks || !waveformPeaks.length) return;
+    
+    const width = canvas.clientWidth;
+    const height = canvas.clientHeight;
+    const ratio = window.devicePixelRatio || 1;
+    if (canvas.width !== width * ratio) {
+        canvas.width = width * ratio;
+        canvas.height = height * ratio;
+    }
+    const ctx = canvas.getContext('2d');
+    ctx.setTransform(ratio, 0, 0, ratio, 0, 0);
+    ctx.clearRect(0, 0, width, height);
+    
+    const pairs = waveformPeaks.length / 2;
+    const progress = audioPlayer.duration ? audioPlayer.currentTime / audioPlayer.duration : 0;
+    const middle = height / 2;
+    // 每个像素列取所覆盖区间的最值
+    for (let x = 0; x < width; x++) {
+        const start = Math.floor(x * pairs / width);
+        const end = Math.max(start + 1, Math.floor((x + 1) * pairs / width));
+        let min = 0, max = 0;
+        for (let i = start; i < end; i++) {
+            min = Math.min(min, waveformPeaks[i * 2]);
+            max = Math.max(max, waveformPeaks[i * 2 + 1]);
+        }
+        ctx.fillStyle = x / width < progress ? '#1db954' : '#adb5bd';
+        ctx.fillRect(x, middle - max / 127 * middle, 1, Math.max(1, (max - min) / 127 * middle));
+    }
+}
+
 // 更新播放器信息
 function updatePlayerInfo(songData) {
     const playerTitle = document.getElementById('player-title');
@@ -127,6 +293,7 @@ function resetPlayButton(button) {
 // 音频事件监听 & 其他 DOM 事件
 document.addEventListener('DOMContentLoaded', function() {
     const audioPlayer = document.getElementById('main-audio');
+    loadEmbeddedSongs();
     
     if (audioPlayer) {
         // 播放事件
@@ -149,8 +316,25 @@ document.addEventListener('DOMContentLoaded', function() {
                 resetPlayButton(currentPlayButton);
                 currentPlayButton = null;
             }
+            // 队列中还有歌曲时自动播放下一首
+            playNext();
+        });
+        audioPlayer.addEventListener('timeupdate', function() {
+            prefetchNext(audioPlayer);
         });
         
+        // 波形随播放进度着色，点击波形跳转
+        audioPlayer.addEventListener('timeupdate', drawWaveform);
+        window.addEventListener('resize', drawWaveform);
+        const waveformCanvas = document.getElementById('player-waveform');
+        if (waveformCanvas) {
+            waveformCanvas.addEventListener('click', function(e) {
+                if (!audioPlayer.duration) return;
+                const rect = waveformCanvas.getBoundingClientRect();
+                audioPlayer.currentTime = (e.clientX - rect.left) / rect.width * audioPlayer.duration;
+            });
+        }
+        
         // 错误事件
         audioPlayer.addEventListener('error', function(e) {
             console.error('音频播放错误:', e);
@@ -235,13 +419,27 @@ document.addEventListener('DOMContentLoaded', function() {
 
 // 兼容旧的播放按钮点击事件
 document.addEventListener('click', function(e) {
+    const playAllButton = e.target.closest('.play-all-btn');
+    if (playAllButton) {
+        e.preventDefault();
+        playFromManifest(playAllButton.dataset.manifestUrl, null);
+        return;
+    }
+    
     if (e.target.classList.contains('play-btn') || e.target.closest('.play-btn')) {
         const button = e.target.classList.contains('play-btn') ? e.target : e.target.closest('.play-btn');
         const songId = button.dataset.songId;
+        // 播放列表中的歌曲按清单排队，播完自动接下一首
+        const manifestContainer = button.closest('[data-manifest-url]');
         
         if (songId) {
             e.preventDefault();
-            playAudio(songId);
+            allPlayButtons[songId] = button;
+            if (manifestContainer) {
+                playFromManifest(manifestContainer.dataset.manifestUrl, songId);
+            } else {
+                playAudio(songId);
+            }
         }
     }
 });
\ No newline at end of file
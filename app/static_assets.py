@@ -0,0 +1,186 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import threading
+
+from flask import current_app, abort, request, send_file, url_for
+
+try:
+    import brotli
+except ImportError:  # 未安装时只生成 gzip
+    brotli = None
+
+# 不属于构建产物的目录：用户上传的文件另有清单和缓存策略
+EXCLUDED_DIRS = {'uploads'}
+# 值得预压缩的文本类型
+COMPRESSIBLE_EXTENSIONS = {'css', 'js', 'svg', 'json', 'map', 'txt', 'xml', 'html'}
+# 按优先顺序：编码 -> 文件后缀
+ENCODING_SUFFIXES = (('br', '.br'), ('gzip', '.gz'))
+
+
+def fingerprint_name(path, digest):
+    """css/style.css -> css/style.<哈希>.css"""
+    stem, ext = os.path.splitext(path)
+    return f"{stem}.{digest}{ext}"
+
+
+def _write_atomic(target, data):
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    temp = f"{target}.{os.getpid()}.tmp"
+    with open(temp, 'wb') as f:
+        f.write(data)
+    os.replace(temp, target)
+
+
+def _compress(data):
+    """返回 {编码: 压缩后的内容}，只保留比原文件小的"""
+    variants = {'gzip': gzip.compress(data, 9, mtime=0)}
+    if brotli is not None:
+        variants['br'] = brotli.compress(data, quality=11)
+    return {encoding: body for encoding, body in variants.items() if len(body) < len(data)}
+
+
+def build_asset(static_dir, build_dir, path):
+    """
+    为一个 static 文件写出带内容哈希的副本及其预压缩版本，返回清单条目
+
+    文件名含哈希，已存在的输出直接复用，多个进程同时启动也只会写出相同的内容。
+    """
+    with open(os.path.join(static_dir, path), 'rb') as f:
+        data = f.read()
+    name = fingerprint_name(path, hashlib.sha256(data).hexdigest()[:12])
+    target = os.path.join(build_dir, name)
+    if not os.path.exists(target):
+        _write_atomic(target, data)
+    encodings = []
+    if path.rsplit('.', 1)[-1].lower() in COMPRESSIBLE_EXTENSIONS:
+        compressed = None
+        for encoding, suffix in ENCODING_SUFFIXES:
+            if os.path.exists(target + suffix):
+                encodings.append(encoding)
+                continue
+            if compressed is None:
+                compressed = _compress(data)
+            if encoding in compressed:
+                _write_atomic(target + suffix, compressed[encoding])
+                encodings.append(encoding)
+    return {'name': name, 'encodings': encodings}
+
+
+class AssetManifest:
+    """一个应用的构建清单：原路径 -> 带哈希的文件名及可用的预压缩版本"""
+
+    def __init__(self, app):
+        self.app = app
+        self._lock = threading.Lock()
+        self._manifest = {}  # {原路径: 条目}
+        self._names = {}  # {带哈希的路径: 条目}
+        self._mtimes = {}  # 调试模式下检查源文件是否修改
+
+    def build(self):
+        """遍历 static（不含上传目录），构建全部文件并写出 manifest.json，返回清单"""
+        static_dir = self.app.static_folder
+        build_dir = self.app.config['ASSET_BUILD_DIR']
+        manifest, mtimes = {}, {}
+        for root, dirs, files in os.walk(static_dir):
+            rel_root = os.path.relpath(root, static_dir).replace(os.sep, '/')
+            if rel_root == '.':
+                dirs[:] = [d for d in dirs if d not in EXCLUDED_DIRS]
+                rel_root = ''
+            dirs[:] = [d for d in dirs if not d.startswith('.')]
+            for filename in files:
+                if filename.startswith('.'):
+                    continue
+                path = f"{rel_root}/{filename}" if rel_root else filename
+                mtimes[path] = os.stat(os.path.join(root, filename)).st_mtime_ns
+                manifest[path] = build_asset(static_dir, build_dir, path)
+        _write_atomic(os.path.join(build_dir, 'manifest.json'),
+                      json.dumps(manifest, indent=2, sort_keys=True).encode())
+        with self._lock:
+            self._manifest = manifest
+            self._names = {entry['name']: entry for entry in manifest.values()}
+            self._mtimes = mtimes
+        return manifest
+
+    def entry(self, path):
+        entry = self._manifest.get(path)
+        if entry is None or not self.app.debug:
+            return entry
+        # 调试时修改了 CSS/JS 不必重启：源文件变化后重新构建这一个文件
+        source = os.path.join(self.app.static_folder, path)
+        try:
+            mtime = os.stat(source).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        if mtime != self._mtimes.get(path):
+            entry = build_asset(self.app.static_folder, self.app.config['ASSET_BUILD_DIR'], path)
+            with self._lock:
+                self._manifest[path] = entry
+                self._names[entry['name']] = entry
+                self._mtimes[path] = mtime
+        return entry
+
+    def by_name(self, filename):
+        return self._names.get(filename)
+
+
+class StaticAssets:
+    """
+    static 下的 CSS、JS 等文件按内容哈希改名后提供，URL 随内容变化，可以永久缓存
+
+    启动时构建（也可用 `flask assets build` 提前构建）；模板中的 url_for('static', ...)
+    遇到清单内的文件时改为指向 /assets/ 下带哈希的地址，响应按 Accept-Encoding 选择预压缩版本。
+    清单按应用保存在 app.extensions['static_assets']。
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        assets = AssetManifest(app)
+        app.extensions['static_assets'] = assets
+        if not app.config['ASSET_FINGERPRINT']:
+            return
+        assets.build()
+        app.add_url_rule('/assets/<path:filename>', endpoint='assets', view_func=self.send_asset)
+        app.add_template_global(self.url_for, 'url_for')
+
+    @property
+    def assets(self):
+        return current_app.extensions['static_assets']
+
+    def build(self):
+        return self.assets.build()
+
+    def url_for(self, endpoint, **values):
+        """模板中替代 url_for：清单内的 static 文件返回带哈希的地址，其余照常"""
+        if endpoint == 'static':
+            entry = self.assets.entry(values.get('filename'))
+            if entry is not None:
+                values['filename'] = entry['name']
+                endpoint = 'assets'
+        return url_for(endpoint, **values)
+
+    def send_asset(self, filename):
+        entry = self.assets.by_name(filename)
+        if entry is None:
+            abort(404)
+        path = os.path.join(current_app.config['ASSET_BUILD_DIR'], filename)
+        encoding = next((encoding for encoding, _ in ENCODING_SUFFIXES
+                         if encoding in entry['encodings'] and request.accept_encodings[encoding]), None)
+        suffix = dict(ENCODING_SUFFIXES).get(encoding, '')
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        response = send_file(path + suffix, mimetype=mimetype,
+                             etag=f"{filename}{suffix}", max_age=current_app.config['ASSET_CACHE_MAX_AGE'])
+        if encoding:
+            response.content_encoding = encoding
+        response.vary.add('Accept-Encoding')
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+
+static_assets = StaticAssets()
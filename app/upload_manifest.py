@@ -0,0 +1,191 @@
+import os
+import posixpath
+import threading
+
+from flask import current_app
+
+UPLOADS_DIR = 'uploads'
+
+
+def _static_dir(app):
+    return os.path.join(app.root_path, 'static')
+
+
+def _scan_dir(static_dir, rel_dir):
+    """读取一个目录：返回 (目录 mtime, 文件名集合, 子目录列表)；目录不存在时返回 None"""
+    path = os.path.join(static_dir, rel_dir)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+        files, subdirs = set(), []
+        with os.scandir(path) as it:
+            for entry in it:
+                # 跳过写入中的临时文件（.upload-*、.download-*、*.tmp）
+                if entry.name.startswith('.') or entry.name.endswith('.tmp'):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(f'{rel_dir}/{entry.name}')
+                elif entry.is_file():
+                    files.add(entry.name)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    return mtime, files, subdirs
+
+
+class UploadFiles:
+    """一个应用的 static/uploads 文件清单及其轮询线程"""
+
+    def __init__(self, app):
+        self.app = app
+        self._lock = threading.Lock()
+        self._static_dir = None
+        self._dirs = {}  # {相对 static 的目录: (mtime, 文件名集合)}
+        self._pid = None
+
+    def build(self, static_dir):
+        """一次 os.scandir 遍历重建清单"""
+        dirs = {}
+        stack = [UPLOADS_DIR]
+        while stack:
+            rel_dir = stack.pop()
+            scanned = _scan_dir(static_dir, rel_dir)
+            if scanned is None:
+                continue
+            mtime, files, subdirs = scanned
+            dirs[rel_dir] = (mtime, files)
+            stack.extend(subdirs)
+        with self._lock:
+            self._static_dir = static_dir
+            self._dirs = dirs
+
+    def _current(self):
+        # 测试中会切换 static 目录，目录变化时重建
+        static_dir = _static_dir(self.app)
+        if static_dir != self._static_dir:
+            self.build(static_dir)
+        return static_dir
+
+    def exists(self, path):
+        """path 为相对 static 的路径（如 uploads/audio/<哈希>.mp3）"""
+        static_dir = self._current()
+        rel_dir, name = posixpath.split(posixpath.normpath(path or ''))
+        entry = self._dirs.get(rel_dir)
+        if entry is not None and name in entry[1]:
+            return True
+        if not (rel_dir + '/').startswith(UPLOADS_DIR + '/'):
+            return False
+        # 没有记录时确认一次，其他进程刚写入的文件不必等轮询
+        if os.path.isfile(os.path.join(static_dir, rel_dir, name)):
+            self._set(rel_dir, name, True)
+            return True
+        return False
+
+    def record(self, abs_path):
+        """本进程写入或删除 uploads 下的文件后调用，按文件当前是否存在更新清单"""
+        static_dir = self._current()
+        rel_path = os.path.relpath(abs_path, static_dir).replace(os.sep, '/')
+        if not rel_path.startswith(UPLOADS_DIR + '/'):
+            return
+        rel_dir, name = posixpath.split(rel_path)
+        self._set(rel_dir, name, os.path.isfile(abs_path))
+
+    def _set(self, rel_dir, name, present):
+        with self._lock:
+            mtime, files = self._dirs.get(rel_dir, (None, set()))
+            if present:
+                files.add(name)
+            else:
+                files.discard(name)
+            self._dirs[rel_dir] = (mtime, files)
+
+    def files(self):
+        """清单中全部文件的相对路径"""
+        self._current()
+        with self._lock:
+            return {f'{rel_dir}/{name}' for rel_dir, (_, names) in self._dirs.items() for name in names}
+
+    def poll(self):
+        """重新读取 mtime 有变化的目录，返回重新读取的目录数"""
+        static_dir = self._current()
+        with self._lock:
+            known = {rel_dir: mtime for rel_dir, (mtime, _) in self._dirs.items()}
+        changed = 0
+        stack = [rel_dir for rel_dir in known]
+        while stack:
+            rel_dir = stack.pop()
+            try:
+                mtime = os.stat(os.path.join(static_dir, rel_dir)).st_mtime_ns
+            except FileNotFoundError:
+                mtime = None
+            if rel_dir in known and mtime == known[rel_dir]:
+                continue
+            scanned = _scan_dir(static_dir, rel_dir)
+            changed += 1
+            with self._lock:
+                if scanned is None:
+                    self._dirs.pop(rel_dir, None)
+                    continue
+                self._dirs[rel_dir] = scanned[:2]
+            stack.extend(subdir for subdir in scanned[2] if subdir not in known)
+        return changed
+
+    def ensure_watcher(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        thread = threading.Thread(target=self._watch, name='upload-manifest-watcher', daemon=True)
+        thread.start()
+
+    def _watch(self):
+        interval = self.app.config['UPLOAD_MANIFEST_POLL_INTERVAL']
+        stop = threading.Event()
+        while not stop.wait(interval):
+            try:
+                with self.app.app_context():
+                    self.poll()
+            except Exception as e:
+                print(f"Upload manifest watcher error: {e}")
+
+
+class UploadManifest:
+    """
+    static/uploads 下文件的内存清单，判断文件是否存在时不必访问文件系统
+
+    启动时遍历一次目录；本进程的上传和删除代码调用 record() 保持同步。
+    其他进程（如独立的任务 worker）新写入的文件在查不到时确认一次后补记；
+    删除则由 UPLOAD_MANIFEST_POLL_INTERVAL 大于 0 时的轮询线程按目录 mtime 发现。
+    清单按应用保存在 app.extensions['upload_manifest']。
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        files = UploadFiles(app)
+        app.extensions['upload_manifest'] = files
+        files.build(_static_dir(app))
+        if app.config['UPLOAD_MANIFEST_POLL_INTERVAL'] > 0:
+            # 与任务 worker 相同，首个请求时按进程启动轮询线程
+            app.before_request(files.ensure_watcher)
+
+    @property
+    def state(self):
+        return current_app.extensions['upload_manifest']
+
+    def exists(self, path):
+        return self.state.exists(path)
+
+    def record(self, abs_path):
+        self.state.record(abs_path)
+
+    def files(self):
+        return self.state.files()
+
+    def poll(self):
+        return self.state.poll()
+
+
+upload_manifest = UploadManifest()
@@ -0,0 +1,254 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import wave
+
+import numpy as np
+from flask import current_app
+
+from app.jobs import enqueue, job_handler
+from app.upload_manifest import upload_manifest
+
+# 每次从解码器读取的帧数
+DECODE_FRAMES = 64 * 1024
+# 外部解码器输出的采样率，只用于画波形，8kHz 足够
+FFMPEG_SAMPLE_RATE = 8000
+FFMPEG_TIMEOUT = 300  # 秒
+# 总帧数未知时，边读边归约保留的小块数上限（相对于 bins 的倍数）
+STREAM_BLOCKS_PER_BIN = 16
+
+
+class UnsupportedAudio(Exception):
+    """没有可用的解码器，或文件无法解码"""
+
+
+# 扩展名 -> 解码函数；解码函数返回 (声道数, 总帧数或 None, 交错采样块的迭代器)，采样为 [-1, 1] 的 float32
+WAVEFORM_DECODERS = {}
+
+
+def waveform_decoder(*exts):
+    """注册某些扩展名的解码函数，后注册的覆盖先注册的"""
+    def decorator(func):
+        for ext in exts:
+            WAVEFORM_DECODERS[ext] = func
+        return func
+    return decorator
+
+
+def _pcm_to_float(data, sampwidth):
+    if sampwidth == 1:
+        return (np.frombuffer(data, dtype=np.uint8).astype(np.float32) - 128) / 128
+    if sampwidth == 2:
+        return np.frombuffer(data, dtype='<i2').astype(np.float32) / 32768
+    if sampwidth == 3:
+        raw = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        samples = raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)
+        samples = np.where(samples >= 1 << 23, samples - (1 << 24), samples)
+        return samples.astype(np.float32) / (1 << 23)
+    if sampwidth == 4:
+        return np.frombuffer(data, dtype='<i4').astype(np.float32) / 2147483648
+    raise UnsupportedAudio(f'Unsupported sample width {sampwidth}')
+
+
+@waveform_decoder('wav')
+def decode_wav(path):
+    try:
+        reader = wave.open(path, 'rb')
+    except (wave.Error, EOFError) as e:
+        raise UnsupportedAudio(str(e))
+    channels, sampwidth, frames = reader.getnchannels(), reader.getsampwidth(), reader.getnframes()
+
+    def chunks():
+        with reader:
+            while True:
+                data = reader.readframes(DECODE_FRAMES)
+                if not data:
+                    break
+                yield _pcm_to_float(data, sampwidth)
+
+    return channels, frames, chunks()
+
+
+@waveform_decoder('mp3', 'ogg', 'flac', 'm4a')
+def decode_ffmpeg(path):
+    """其他格式交给 ffmpeg 解码为单声道 8kHz，按块读取标准输出；未安装 ffmpeg 时不支持"""
+    ffmpeg = shutil.which('ffmpeg')
+    if ffmpeg is None:
+        raise UnsupportedAudio('ffmpeg is not installed')
+    # stderr 写入临时文件，避免管道写满后 ffmpeg 阻塞
+    errors = tempfile.TemporaryFile()
+    process = subprocess.Popen(
+        [ffmpeg, '-v', 'error', '-i', path, '-ac', '1', '-ar', str(FFMPEG_SAMPLE_RATE), '-f', 's16le', '-'],
+        stdout=subprocess.PIPE, stderr=errors,
+    )
+
+    def chunks():
+        # 超时后结束进程，读取随之结束
+        timer = threading.Timer(FFMPEG_TIMEOUT, process.kill)
+        timer.start()
+        try:
+            tail = b''
+            while True:
+                data = process.stdout.read(DECODE_FRAMES * 2)
+                if not data:
+                    break
+                data = tail + data
+                # 按 16 位采样对齐，多出的字节留到下一块
+                cut = len(data) - len(data) % 2
+                tail = data[cut:]
+                yield _pcm_to_float(data[:cut], 2)
+            returncode = process.wait()
+            if not timer.is_alive():
+                raise UnsupportedAudio(f'ffmpeg timed out after {FFMPEG_TIMEOUT}s')
+            if returncode != 0:
+                errors.seek(0)
+                raise UnsupportedAudio(errors.read().decode(errors='replace').strip())
+        finally:
+            timer.cancel()
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            process.stdout.close()
+            errors.close()
+
+    return 1, None, chunks()
+
+
+def _reduce_blocks(pending, block, mins, maxs):
+    """把 pending 中的完整块求最值追加到 mins/maxs，返回剩余的采样"""
+    full = len(pending) // block
+    if full:
+        reshaped = pending[:full * block].reshape(full, block)
+        mins.append(reshaped.min(axis=1))
+        maxs.append(reshaped.max(axis=1))
+        pending = pending[full * block:]
+    return pending
+
+
+def _to_int8(mins, maxs):
+    peaks = np.empty(len(mins) * 2, np.int8)
+    peaks[0::2] = np.clip(np.round(mins * 127), -127, 127)
+    peaks[1::2] = np.clip(np.round(maxs * 127), -127, 127)
+    return peaks
+
+
+def _compute_peaks_streaming(channels, chunks, bins):
+    """
+    总帧数未知时边读边归约：先按小块求最值，块数超过上限就两两合并、块大小加倍，
+    读完后再把小块按相同个数分到最多 bins 个区间，内存只与 bins 有关，与音频长度无关。
+    """
+    block = channels
+    limit = bins * STREAM_BLOCKS_PER_BIN
+    mins, maxs = np.empty(0, np.float32), np.empty(0, np.float32)
+    pending = np.empty(0, np.float32)
+    for chunk in chunks:
+        pending = np.concatenate((pending, chunk)) if len(pending) else chunk
+        new_mins, new_maxs = [mins], [maxs]
+        pending = _reduce_blocks(pending, block, new_mins, new_maxs)
+        mins, maxs = np.concatenate(new_mins), np.concatenate(new_maxs)
+        while len(mins) > limit:
+            # 奇数个时最后一块保持原大小，误差不超过一个小块
+            even = len(mins) - len(mins) % 2
+            mins = np.concatenate((mins[:even].reshape(-1, 2).min(axis=1), mins[even:]))
+            maxs = np.concatenate((maxs[:even].reshape(-1, 2).max(axis=1), maxs[even:]))
+            block *= 2
+    if len(pending):
+        mins = np.append(mins, pending.min())
+        maxs = np.append(maxs, pending.max())
+    if not len(mins):
+        return np.empty(0, np.int8)
+
+    starts = np.arange(0, len(mins), -(-len(mins) // bins))
+    return _to_int8(np.minimum.reduceat(mins, starts), np.maximum.reduceat(maxs, starts))
+
+
+def compute_peaks(channels, total_frames, chunks, bins):
+    """
+    把交错采样降采样为最多 bins 组 (最小值, 最大值)，返回 int8 数组 [min0, max0, min1, max1, ...]
+
+    每个区间的采样数相同（最后一个可能较短），按块 reshape 后用 NumPy 沿轴求最值，不逐个采样循环。
+    总帧数未知时边读边归约，区间边界近似。
+    """
+    if total_frames is None:
+        return _compute_peaks_streaming(channels, chunks, bins)
+    if total_frames <= 0:
+        return np.empty(0, np.int8)
+
+    per_bin = -(-total_frames // min(bins, total_frames)) * channels
+    mins, maxs = [], []
+    pending = np.empty(0, np.float32)
+    for chunk in chunks:
+        pending = np.concatenate((pending, chunk)) if len(pending) else chunk
+        pending = _reduce_blocks(pending, per_bin, mins, maxs)
+    if len(pending):
+        mins.append(pending.min(keepdims=True))
+        maxs.append(pending.max(keepdims=True))
+    if not mins:
+        return np.empty(0, np.int8)
+    return _to_int8(np.concatenate(mins), np.concatenate(maxs))
+
+
+def build_waveform(source, target, bins):
+    """解码 source 并把峰值写入 target（先写临时文件再改名），返回峰值组数"""
+    ext = source.rsplit('.', 1)[-1].lower()
+    decoder = WAVEFORM_DECODERS.get(ext)
+    if decoder is None:
+        raise UnsupportedAudio(f'No waveform decoder for .{ext}')
+    channels, total_frames, chunks = decoder(source)
+    peaks = compute_peaks(channels, total_frames, chunks, bins)
+
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    temp = f"{target}.tmp"
+    with open(temp, 'wb') as f:
+        f.write(peaks.tobytes())
+    os.replace(temp, target)
+    return len(peaks) // 2
+
+
+def waveform_path(file_path):
+    """uploads/audio/<哈希>.mp3 -> uploads/audio/waveforms/<哈希>.peaks；音频按内容寻址，波形同样共用"""
+    directory, filename = os.path.split(file_path)
+    return f"{directory}/waveforms/{os.path.splitext(filename)[0]}.peaks"
+
+
+def _static_path(path):
+    return os.path.join(current_app.root_path, 'static', path)
+
+
+def generate_waveform(file_path, force=False):
+    """
+    为歌曲音频生成波形峰值文件，返回峰值组数
+
+    已有波形时跳过（返回 None），除非 force；音频文件不存在时也返回 None。
+    """
+    source = _static_path(file_path)
+    target = _static_path(waveform_path(file_path))
+    if not os.path.exists(source) or (os.path.exists(target) and not force):
+        return None
+    pairs = build_waveform(source, target, current_app.config['WAVEFORM_PEAKS'])
+    upload_manifest.record(target)
+    return pairs
+
+
+def remove_waveform(file_path):
+    target = _static_path(waveform_path(file_path))
+    if os.path.exists(target):
+        os.remove(target)
+        upload_manifest.record(target)
+
+
+def enqueue_waveform(file_path):
+    """在调用方的会话中加入生成波形的任务，随调用方的事务提交"""
+    if file_path:
+        enqueue('waveform', {'path': file_path}, dedup_key=f'waveform:{file_path}')
+
+
+@job_handler('waveform')
+def waveform_job(payload):
+    # 无法解码的文件重试也不会成功，只记录日志
+    try:
+        generate_waveform(payload['path'])
+    except UnsupportedAudio as e:
+        print(f"Waveform skipped for {payload['path']}: {e}")
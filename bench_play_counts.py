@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+对比 song_detail 在不同播放次数写入模式下的吞吐量
+
+direct 为旧行为（每次浏览 UPDATE + COMMIT），memory / sqlite 为缓冲聚合
+用法: python bench_play_counts.py [线程数] [每线程请求数]
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+
+THREADS = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+REQUESTS = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+SONGS = 20
+
+
+def build_app(mode):
+    from app import create_app, db
+    from app.models import User, Song
+    from config import Config
+
+    workdir = tempfile.mkdtemp()
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+        PLAY_COUNT_MODE = mode
+        PLAY_COUNT_FLUSH_INTERVAL = 1
+        PLAY_COUNT_SPOOL_PATH = os.path.join(workdir, 'play_counts.db')
+
+    app = create_app(BenchConfig)
+    with app.app_context():
+        db.create_all()
+        user = User(username='bench', email='bench@example.com')
+        db.session.add(user)
+        db.session.commit()
+        for i in range(SONGS):
+            db.session.add(Song(title=f'Song {i}', artist='Artist', file_path='uploads/audio/x.mp3',
+                                user_id=user.id, visibility='public', play_count=0))
+        db.session.commit()
+    return app
+
+
+def run(app):
+    errors = []
+
+    def worker(offset):
+        client = app.test_client()
+        for i in range(REQUESTS):
+            response = client.get(f'/song/{(offset + i) % SONGS + 1}')
+            if response.status_code != 200:
+                errors.append(response.status_code)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(THREADS)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    from app import db
+    from app.models import Song
+    from app.play_counts import play_counter
+    with app.app_context():
+        play_counter.flush()
+        total = db.session.query(db.func.sum(Song.play_count)).scalar()
+    return THREADS * REQUESTS / elapsed, total, len(errors)
+
+
+def main():
+    print(f"{THREADS} threads x {REQUESTS} requests on /song/<id>")
+    print(f"{'mode':<8} | {'req/s':>8} | {'plays recorded':>14} | errors")
+    print('-' * 48)
+    for mode in ('direct', 'memory', 'sqlite'):
+        throughput, total, errors = run(build_app(mode))
+        print(f"{mode:<8} | {throughput:>8.1f} | {total:>14} | {errors}")
+
+
+if __name__ == '__main__':
+    main()
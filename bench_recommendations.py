@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+相似歌曲离线计算的耗时与内存：全量构建和小批量收藏变化后的增量刷新
+
+用法: python bench_recommendations.py [收藏数量 ...]   默认 1000000
+每次刷新在独立子进程中执行，内存为子进程常驻内存峰值减去只加载应用时的基线，
+其中包含 SQLITE_PRAGMAS 中 mmap_size 与 cache_size 占用的页面。
+"""
+
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+SIZES = [int(arg) for arg in sys.argv[1:] if arg.isdigit()] or [1000000]
+USERS = 50000
+SONGS = 100000
+CHANGED = 1000
+BATCH = 50000
+
+
+def create_bench_app():
+    from app import create_app
+    app = create_app()
+    app.app_context().push()
+    return app
+
+
+def build_database(size):
+    from app import db
+    from app.models import User, Song, Favorite
+
+    db.session.remove()
+    db.drop_all()
+    db.create_all()
+    db.session.execute(User.__table__.insert(), [
+        {'id': i, 'username': f'user{i}', 'email': f'user{i}@example.com'} for i in range(1, USERS + 1)
+    ])
+    db.session.execute(Song.__table__.insert(), [
+        {'id': i, 'title': f'Song {i}', 'artist': 'Artist', 'file_path': 'uploads/audio/bench.mp3',
+         'user_id': 1, 'visibility': 'public'} for i in range(1, SONGS + 1)
+    ])
+
+    # 歌曲热度呈长尾（对数均匀）分布，直接写表不触发收藏事件
+    rng = random.Random(42)
+    pairs = set()
+    while len(pairs) < size:
+        pairs.add((rng.randint(1, USERS), int(SONGS ** rng.random())))
+    rows = [{'user_id': u, 'song_id': s} for u, s in pairs]
+    for start in range(0, len(rows), BATCH):
+        db.session.execute(Favorite.__table__.insert(), rows[start:start + BATCH])
+    db.session.commit()
+    return pairs
+
+
+def change_favorites(pairs):
+    """模拟线上的一批新收藏，走 ORM 以触发待刷新标记"""
+    from app import db
+    from app.models import Favorite
+
+    rng = random.Random(7)
+    added = 0
+    while added < CHANGED:
+        pair = (rng.randint(1, USERS), rng.randint(1, SONGS))
+        if pair not in pairs:
+            pairs.add(pair)
+            db.session.add(Favorite(user_id=pair[0], song_id=pair[1]))
+            added += 1
+    db.session.commit()
+
+
+def child(mode):
+    """子进程入口：执行一次刷新（baseline 只加载应用），输出 JSON 结果"""
+    create_bench_app()
+    import numpy, scipy.sparse  # noqa: F401  基线也计入依赖库本身的内存
+    from app.recommendations import refresh_neighbors
+
+    result = {}
+    started = time.perf_counter()
+    if mode != 'baseline':
+        result = refresh_neighbors(full=mode == 'full')
+    result['elapsed'] = time.perf_counter() - started
+    result['maxrss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps(result))
+
+
+def run_child(mode):
+    output = subprocess.run([sys.executable, __file__, '--child', mode],
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    if '--child' in sys.argv:
+        child(sys.argv[sys.argv.index('--child') + 1])
+        return
+
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+    print(f"{'favorites':>10} | {'mode':<11} | {'songs':>7} | {'neighbors':>9} | "
+          f"{'compute s':>9} | {'total s':>7} | memory MB")
+    print('-' * 80)
+    create_bench_app()
+    baseline = run_child('baseline')['maxrss_mb']
+    for size in SIZES:
+        pairs = build_database(size)
+        for mode in ('full', 'incremental'):
+            if mode == 'incremental':
+                change_favorites(pairs)
+            stats = run_child(mode)
+            print(f"{size:>10} | {mode:<11} | {stats['songs']:>7} | {stats['neighbors']:>9} | "
+                  f"{stats['build_seconds']:>9.2f} | {stats['total_seconds']:>7.2f} | "
+                  f"{stats['maxrss_mb'] - baseline:>9.1f}")
+        print('-' * 80)
+
+
+if __name__ == '__main__':
+    main()
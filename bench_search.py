@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+对比 /search 的 ILIKE 查询与 FTS5 全文索引的查询延迟
+
+用法: python bench_search.py [歌曲数量 ...]   默认 10000 100000 1000000
+"""
+
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+SIZES = [int(arg) for arg in sys.argv[1:]] or [10000, 100000, 1000000]
+QUERIES = ['love', 'yes', '周杰伦', '晴天', 'rock night', 'zzzz']
+REPEAT = 5
+BATCH = 10000
+
+WORDS = ['love', 'night', 'yesterday', 'blue', 'rock', 'dream', 'summer', 'heart', 'fire', 'rain',
+         '晴天', '七里香', '月亮', '夜曲', '青花瓷', '稻香', '海', '风', '梦', '爱']
+ARTISTS = ['The Beatles', 'Queen', 'Adele', '周杰伦', '陶喆', '王菲', '林俊杰', 'Coldplay']
+GENRES = ['Pop', 'Rock', 'Jazz', '流行', '摇滚', 'Classical']
+
+
+def create_bench_app():
+    db_file = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + db_file
+
+    from app import create_app
+    app = create_app()
+    app.app_context().push()
+    return app
+
+
+def build_database(size):
+    from sqlalchemy import text
+    from app import db
+    from app.models import User, Song
+    from app.search import FTS_TABLE, FTS_COLUMNS, CREATE_FTS_SQL, segment
+
+    db.session.remove()
+    db.drop_all()
+    db.session.execute(text(f'DROP TABLE IF EXISTS {FTS_TABLE}'))
+    db.create_all()
+    db.session.execute(text(CREATE_FTS_SQL))
+    db.session.add(User(id=1, username='bench', email='bench@example.com'))
+    db.session.commit()
+
+    rng = random.Random(42)
+    fts_insert = text(f"INSERT INTO {FTS_TABLE} (rowid, {', '.join(FTS_COLUMNS)}) "
+                      f"VALUES (:id, {', '.join(':' + c for c in FTS_COLUMNS)})")
+    for start in range(1, size + 1, BATCH):
+        rows = []
+        for song_id in range(start, min(start + BATCH, size + 1)):
+            rows.append({
+                'id': song_id,
+                'title': ' '.join(rng.sample(WORDS, 2)),
+                'artist': rng.choice(ARTISTS),
+                'album': rng.choice(WORDS),
+                'genre': rng.choice(GENRES),
+                'file_path': 'uploads/audio/bench.mp3',
+                'user_id': 1,
+                'visibility': 'public',
+            })
+        db.session.execute(Song.__table__.insert(), rows)
+        db.session.execute(fts_insert, [dict({c: segment(r[c]) for c in FTS_COLUMNS}, id=r['id'])
+                                        for r in rows])
+        db.session.commit()
+
+
+def ilike_query(query):
+    from app.models import Song
+    pattern = f'%{query}%'
+    return Song.query.filter(
+        Song.visibility == 'public',
+        Song.title.ilike(pattern) | Song.artist.ilike(pattern) |
+        Song.album.ilike(pattern) | Song.genre.ilike(pattern)
+    ).order_by(Song.title)
+
+
+def measure(build_query):
+    """返回每个查询词第一页（含总数）的中位耗时，单位毫秒"""
+    timings = []
+    for query in QUERIES:
+        samples = []
+        for _ in range(REPEAT):
+            started = time.perf_counter()
+            build_query(query).paginate(page=1, per_page=12, error_out=False)
+            samples.append((time.perf_counter() - started) * 1000)
+        timings.append(statistics.median(samples))
+    return timings
+
+
+def main():
+    print(f"{'songs':>9} | {'query':<12} | {'ILIKE ms':>9} | {'FTS5 ms':>9} | speedup")
+    print('-' * 60)
+    create_bench_app()
+    from app.search import search_songs
+    for size in SIZES:
+        build_database(size)
+        ilike = measure(ilike_query)
+        fts = measure(search_songs)
+        for query, slow, fast in zip(QUERIES, ilike, fts):
+            print(f"{size:>9} | {query:<12} | {slow:>9.2f} | {fast:>9.2f} | {slow / fast:>6.1f}x")
+        print('-' * 60)
+
+
+if __name__ == '__main__':
+    main()
@@ -14,14 +14,102 @@ class Config:
     
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # 数据库引擎配置：sqlite 或 server，留空时按连接串自动选择
+    DATABASE_ENGINE_PROFILE = os.environ.get('DATABASE_ENGINE_PROFILE')
+    # SQLite：WAL 允许读写并发，busy_timeout 让写入排队等待而不是直接报 "database is locked"
+    SQLITE_PRAGMAS = {
+        'busy_timeout': 15000,  # 毫秒
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -64000,  # 负数单位为 KB，即 64MB
+    }
+    # MySQL / PostgreSQL 等服务端数据库的连接池
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE') or 10)
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW') or 20)
+    DB_POOL_TIMEOUT = 30
+    DB_POOL_RECYCLE = 1800
+    DB_POOL_PRE_PING = True
+    
     # 上传配置
     UPLOAD_FOLDER = os.path.join(basedir, 'app', 'static', 'uploads')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
+    # 分块上传：单个请求只携带一个分块，不受 MAX_CONTENT_LENGTH 限制整个文件
+    UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+    UPLOAD_MAX_AUDIO_BYTES = 500 * 1024 * 1024
+    UPLOAD_PARTIAL_DIR = os.path.join(basedir, 'instance', 'uploads')
+    UPLOAD_SESSION_TTL = 24 * 3600  # 秒，超过后未完成的上传可被清理
+    # 音频发送方式：sendfile（本进程）、x-accel（nginx）、x-sendfile（Apache/lighttpd）
+    # x-accel 需要在 nginx 中把 AUDIO_ACCEL_PREFIX 配成指向音频目录的 internal location
+    AUDIO_SEND_MODE = os.environ.get('AUDIO_SEND_MODE', 'sendfile')
+    AUDIO_ACCEL_PREFIX = '/_protected/audio/'
+    AUDIO_CACHE_MAX_AGE = 365 * 24 * 3600  # 带内容版本的音频和波形 URL
+    WAVEFORM_PEAKS = 1000  # 播放器进度条波形的 (最小值, 最大值) 组数
+    # static/uploads 内存清单的轮询间隔（秒），用于发现其他进程删除的文件；0 表示不轮询
+    UPLOAD_MANIFEST_POLL_INTERVAL = int(os.environ.get('UPLOAD_MANIFEST_POLL_INTERVAL') or 60)
+    # 静态资源：启动时按内容哈希改名并预压缩（gzip，装有 brotli 时另生成 br），通过 /assets/ 永久缓存
+    ASSET_FINGERPRINT = os.environ.get('ASSET_FINGERPRINT', '1') != '0'
+    ASSET_BUILD_DIR = os.path.join(basedir, 'instance', 'assets')
+    ASSET_CACHE_MAX_AGE = 365 * 24 * 3600  # 秒
     
     # 允许的文件扩展名
     ALLOWED_AUDIO_EXTENSIONS = {'mp3', 'wav', 'ogg', 'flac', 'm4a'}
     ALLOWED_IMAGE_EXTENSIONS = {'jpg', 'jpeg', 'png', 'gif'}
     
+    # 游标分页：列表总数缓存秒数
+    KEYSET_COUNT_TTL = 60
+    
+    # 播放次数缓冲：memory 为单进程内存聚合，sqlite 为多进程共享的本地旁路表，direct 为每次立即写库
+    PLAY_COUNT_MODE = os.environ.get('PLAY_COUNT_MODE') or 'memory'
+    PLAY_COUNT_FLUSH_INTERVAL = 5  # 秒
+    PLAY_COUNT_SPOOL_PATH = os.path.join(basedir, 'instance', 'play_counts.db')
+    
+    # 页面数据缓存：memory 为进程内 LRU，sqlite 为多进程共享的本地缓存，也可填 "模块:类" 接入 Redis 等后端
+    CACHE_BACKEND = os.environ.get('CACHE_BACKEND') or 'memory'
+    CACHE_DEFAULT_TTL = 60  # 秒
+    CACHE_MAX_ENTRIES = 256
+    CACHE_SQLITE_PATH = os.path.join(basedir, 'instance', 'cache.db')
+    CACHE_PURGE_EVERY = 500  # sqlite 后端每写入多少次清理一次过期行
+    HOME_CACHE_TTL = 60  # 首页热门/最新区块，上传、删除、改可见性时主动失效
+    
+    # 相似歌曲推荐：每首歌保留的相似歌曲数量
+    RECOMMENDATION_NEIGHBORS = 20
+    
+    # 封面搜索：并发查询各来源，任一来源精确匹配或超过总截止时间即返回
+    COVER_PROVIDER_URLS = {
+        'netease': 'https://music.163.com/api/search/get/web',
+        'qq': 'https://c.y.qq.com/soso/fcgi-bin/client_search_cp',
+        'itunes': 'https://itunes.apple.com/search',
+        'lastfm': 'https://ws.audioscrobbler.com/2.0/',
+    }
+    LASTFM_API_KEY = os.environ.get('LASTFM_API_KEY') or 'b25b959554ed76058ac220b7b2e0a026'
+    COVER_SEARCH_DEADLINE = 6  # 秒，整次搜索
+    COVER_PROVIDER_TIMEOUT = 5  # 秒，单个请求的连接/读取超时
+    COVER_SEARCH_WORKERS = 4  # 每个来源的查询线程数
+    # 外部来源客户端：连接池、重试退避（秒）和熔断器
+    PROVIDER_POOL_CONNECTIONS = 10  # 每个来源缓存的主机连接池数量
+    PROVIDER_POOL_MAXSIZE = 10  # 每个主机的保持连接数
+    PROVIDER_RETRIES = 2
+    PROVIDER_BACKOFF = 0.2
+    PROVIDER_BACKOFF_MAX = 2
+    PROVIDER_BREAKER_THRESHOLD = 5  # 连续失败次数
+    PROVIDER_BREAKER_RESET = 30  # 打开后的冷却秒数
+    # 封面搜索结果的持久缓存（秒）：找到的封面、歌手候选列表、“未找到”
+    COVER_CACHE_TTL = 30 * 24 * 3600
+    COVER_ARTIST_CACHE_TTL = 7 * 24 * 3600
+    COVER_CACHE_NEGATIVE_TTL = 24 * 3600
+    COVER_MAX_BYTES = 5 * 1024 * 1024  # 下载封面的大小上限
+    # 封面和头像的缩略图变体（正方形边长，像素），各生成 WebP 和 JPEG
+    IMAGE_VARIANT_SIZES = (64, 200, 600)
+    IMAGE_WEBP_QUALITY = 80
+    IMAGE_JPEG_QUALITY = 82
+    # 后台任务队列：Web 进程内的 worker 线程数（0 表示只由 `flask jobs work` 处理）
+    JOB_INPROCESS_WORKERS = int(os.environ.get('JOB_INPROCESS_WORKERS') or 1)
+    JOB_POLL_INTERVAL = 2  # 秒，队列为空时的轮询间隔
+    JOB_MAX_ATTEMPTS = 5
+    JOB_RETRY_BACKOFF = 30  # 秒，第 n 次失败后等待 JOB_RETRY_BACKOFF * 2^(n-1)
+    JOB_LOCK_TIMEOUT = 300  # 秒，超过后视为 worker 已退出，任务可被重新领取
+    
     # 国际化配置
     LANGUAGES = ['en', 'zh']
     BABEL_DEFAULT_LOCALE = 'en'
@@ -0,0 +1,108 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app import create_app, db
+from app.models import User
+from app.search import rebuild_index
+from config import Config
+
+
+class TestConfig(Config):
+    TESTING = True
+    WTF_CSRF_ENABLED = False
+    # 测试中显式调用 flush，避免后台线程干扰断言
+    PLAY_COUNT_FLUSH_INTERVAL = 3600
+    # 测试中显式调用 run_pending 处理后台任务
+    JOB_INPROCESS_WORKERS = 0
+    # 测试中显式调用 poll 刷新上传文件清单
+    UPLOAD_MANIFEST_POLL_INTERVAL = 0
+
+
+@pytest.fixture
+def app(tmp_path):
+    class _Config(TestConfig):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + str(tmp_path / 'test.db')
+        ASSET_BUILD_DIR = str(tmp_path / 'assets')
+
+    app = create_app(_Config)
+    with app.app_context():
+        db.create_all()
+        rebuild_index()
+        yield app
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def static_root(app, tmp_path, monkeypatch):
+    """把上传文件的 static 根目录切到临时目录，避免测试写入 app/static"""
+    # 模板加载器按原路径创建后再切换
+    app.jinja_loader
+    monkeypatch.setattr(app, 'root_path', str(tmp_path))
+    for folder in ('audio', 'covers', 'avatars'):
+        (tmp_path / 'static' / 'uploads' / folder).mkdir(parents=True)
+    return tmp_path / 'static'
+
+
+def make_user(username, password='password123'):
+    user = User(username=username, email=f'{username}@example.com')
+    user.set_password(password)
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def login(client, username, password='password123'):
+    return client.post('/auth/login', data={'username': username, 'password': password})
+
+
+class StubProvider:
+    """可设置延迟、状态码和响应体的本地 HTTP 服务器"""
+
+    def __init__(self):
+        self.delay = 0
+        self.status = 200
+        self.statuses = []  # 依次使用的状态码，用完后回到 status
+        self.body = {}  # dict 按 JSON 返回，bytes 原样返回
+        self.content_type = 'application/json'
+        self.requests = 0
+        self.client_ports = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # 支持 keep-alive，便于验证连接复用
+
+            def do_GET(self):
+                stub.requests += 1
+                stub.client_ports.append(self.client_address[1])
+                time.sleep(stub.delay)
+                status = stub.statuses.pop(0) if stub.statuses else stub.status
+                payload = stub.body if isinstance(stub.body, bytes) else json.dumps(stub.body).encode()
+                try:
+                    self.send_response(status)
+                    self.send_header('Content-Type', stub.content_type)
+                    self.send_header('Content-Length', str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.server.server_port}/search'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
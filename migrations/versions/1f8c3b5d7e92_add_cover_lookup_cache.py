@@ -0,0 +1,35 @@
+"""Add persistent cover lookup cache
+
+Revision ID: 1f8c3b5d7e92
+Revises: e7b21f4c9a60
+Create Date: 2026-10-18 15:22:40.913527
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1f8c3b5d7e92'
+down_revision = 'e7b21f4c9a60'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('cover_lookup',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(length=20), nullable=False),
+    sa.Column('lookup_key', sa.String(length=400), nullable=False),
+    sa.Column('payload', sa.Text(), nullable=True),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.Column('hits', sa.Integer(), nullable=False),
+    sa.Column('misses', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('kind', 'lookup_key', name='uq_cover_lookup_kind_lookup_key')
+    )
+
+
+def downgrade():
+    op.drop_table('cover_lookup')
@@ -0,0 +1,49 @@
+"""Add denormalized comment, follower and following counters
+
+Revision ID: 5b7e2c9d4a31
+Revises: 3141af29e82b
+Create Date: 2026-10-18 10:12:40.118532
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b7e2c9d4a31'
+down_revision = '3141af29e82b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('song', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('comments_count', sa.Integer(), nullable=True))
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('followers_count', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('following_count', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('public_songs_count', sa.Integer(), nullable=True))
+
+    # 回填现有数据
+    op.execute(
+        'UPDATE song SET comments_count = '
+        '(SELECT COUNT(*) FROM comment WHERE comment.song_id = song.id)'
+    )
+    op.execute(
+        'UPDATE "user" SET '
+        'followers_count = (SELECT COUNT(*) FROM follows WHERE follows.followed_id = "user".id), '
+        'following_count = (SELECT COUNT(*) FROM follows WHERE follows.follower_id = "user".id), '
+        'public_songs_count = (SELECT COUNT(*) FROM song '
+        "WHERE song.user_id = \"user\".id AND song.visibility = 'public')"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('public_songs_count')
+        batch_op.drop_column('following_count')
+        batch_op.drop_column('followers_count')
+
+    with op.batch_alter_table('song', schema=None) as batch_op:
+        batch_op.drop_column('comments_count')
@@ -0,0 +1,43 @@
+"""Add SQLite FTS5 full-text index for song search
+
+Revision ID: 8d3f6a1e2b07
+Revises: 5b7e2c9d4a31
+Create Date: 2026-10-18 11:02:15.402871
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from app.search import FTS_TABLE, FTS_COLUMNS, CREATE_FTS_SQL, segment
+
+
+# revision identifiers, used by Alembic.
+revision = '8d3f6a1e2b07'
+down_revision = '5b7e2c9d4a31'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    # 其他数据库使用 ILIKE 回退，不建 FTS 表
+    if bind.dialect.name != 'sqlite':
+        return
+
+    op.execute(CREATE_FTS_SQL)
+    songs = bind.execute(sa.text(
+        "SELECT id, title, artist, album, genre FROM song WHERE visibility = 'public'"
+    )).mappings().all()
+    if songs:
+        rows = [dict({c: segment(song[c]) for c in FTS_COLUMNS}, id=song['id']) for song in songs]
+        bind.execute(
+            sa.text(f"INSERT INTO {FTS_TABLE} (rowid, {', '.join(FTS_COLUMNS)}) "
+                    f"VALUES (:id, {', '.join(':' + c for c in FTS_COLUMNS)})"),
+            rows
+        )
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
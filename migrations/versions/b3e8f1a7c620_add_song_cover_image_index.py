@@ -0,0 +1,26 @@
+"""Add song cover_image index for shared cover files
+
+Revision ID: b3e8f1a7c620
+Revises: 9a2d6c4e8f15
+Create Date: 2026-10-18 18:12:47.105329
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3e8f1a7c620'
+down_revision = '9a2d6c4e8f15'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('song', schema=None) as batch_op:
+        batch_op.create_index('ix_song_cover_image', ['cover_image'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('song', schema=None) as batch_op:
+        batch_op.drop_index('ix_song_cover_image')
@@ -0,0 +1,66 @@
+"""Add composite indexes for hot queries and unique favorites
+
+Revision ID: c4a9e7f31d52
+Revises: 8d3f6a1e2b07
+Create Date: 2026-10-18 11:48:53.270914
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4a9e7f31d52'
+down_revision = '8d3f6a1e2b07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 添加唯一约束前先清理重复收藏（保留最早的一条），并修正受影响歌曲的收藏数
+    op.execute(
+        'UPDATE song SET likes_count = (SELECT COUNT(DISTINCT user_id) FROM favorite '
+        'WHERE favorite.song_id = song.id) '
+        'WHERE id IN (SELECT song_id FROM favorite GROUP BY user_id, song_id HAVING COUNT(*) > 1)'
+    )
+    op.execute(
+        'DELETE FROM favorite WHERE id NOT IN '
+        '(SELECT MIN(id) FROM favorite GROUP BY user_id, song_id)'
+    )
+
+    with op.batch_alter_table('song', schema=None) as batch_op:
+        batch_op.create_index('ix_song_visibility_play_count', ['visibility', 'play_count'], unique=False)
+        batch_op.create_index('ix_song_visibility_upload_date', ['visibility', 'upload_date'], unique=False)
+        batch_op.create_index('ix_song_user_id_upload_date', ['user_id', 'upload_date'], unique=False)
+
+    with op.batch_alter_table('favorite', schema=None) as batch_op:
+        batch_op.create_unique_constraint('uq_favorite_user_id_song_id', ['user_id', 'song_id'])
+
+    with op.batch_alter_table('comment', schema=None) as batch_op:
+        batch_op.create_index('ix_comment_song_id_created_at', ['song_id', 'created_at'], unique=False)
+
+    with op.batch_alter_table('playlist_item', schema=None) as batch_op:
+        batch_op.create_index('ix_playlist_item_playlist_id_order', ['playlist_id', 'order'], unique=False)
+
+    # 每个列表页的“添加到播放列表”弹窗都会按用户查询播放列表
+    with op.batch_alter_table('playlist', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_playlist_user_id'), ['user_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('playlist', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_playlist_user_id'))
+
+    with op.batch_alter_table('playlist_item', schema=None) as batch_op:
+        batch_op.drop_index('ix_playlist_item_playlist_id_order')
+
+    with op.batch_alter_table('comment', schema=None) as batch_op:
+        batch_op.drop_index('ix_comment_song_id_created_at')
+
+    with op.batch_alter_table('favorite', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_favorite_user_id_song_id', type_='unique')
+
+    with op.batch_alter_table('song', schema=None) as batch_op:
+        batch_op.drop_index('ix_song_user_id_upload_date')
+        batch_op.drop_index('ix_song_visibility_upload_date')
+        batch_op.drop_index('ix_song_visibility_play_count')
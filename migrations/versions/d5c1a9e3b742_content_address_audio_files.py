@@ -0,0 +1,88 @@
+"""Content-address audio files and index song file_path
+
+Revision ID: d5c1a9e3b742
+Revises: b3e8f1a7c620
+Create Date: 2026-10-18 19:40:03.572916
+
+"""
+import hashlib
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+from alembic import op
+import sqlalchemy as sa
+from flask import current_app
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5c1a9e3b742'
+down_revision = 'b3e8f1a7c620'
+branch_labels = None
+depends_on = None
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _dedupe_audio_files(connection):
+    """
+    把 static/uploads/audio 下的文件改为按 SHA-256 命名，内容相同的文件合并为一份
+
+    并行计算哈希；建立新文件（硬链接，不支持时复制）并更新 song.file_path。
+    旧文件不在迁移中删除：事务回滚后 song.file_path 仍指向它们。提交后用
+    `flask uploads purge-orphans` 删除不再被引用的旧文件。
+    """
+    audio_dir = os.path.join(current_app.root_path, 'static', 'uploads', 'audio')
+    if not os.path.isdir(audio_dir):
+        return
+    filenames = [name for name in sorted(os.listdir(audio_dir))
+                 if not name.startswith('.') and '.' in name and os.path.isfile(os.path.join(audio_dir, name))]
+
+    workers = min(32, (os.cpu_count() or 1) * 2)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        digests = list(executor.map(lambda name: _sha256(os.path.join(audio_dir, name)), filenames))
+
+    renamed = {}
+    for name, digest in zip(filenames, digests):
+        target = f"{digest}.{name.rsplit('.', 1)[1].lower()}"
+        if target == name:
+            continue
+        target_path = os.path.join(audio_dir, target)
+        if not os.path.exists(target_path):
+            try:
+                os.link(os.path.join(audio_dir, name), target_path)
+            except OSError:
+                shutil.copy2(os.path.join(audio_dir, name), target_path)
+        renamed[name] = target
+
+    song = sa.table('song', sa.column('file_path', sa.String))
+    for old, new in renamed.items():
+        connection.execute(
+            song.update().where(song.c.file_path == f'uploads/audio/{old}').values(file_path=f'uploads/audio/{new}')
+        )
+
+    blobs = len(set(renamed.values()) | (set(filenames) - set(renamed)))
+    print(f"Content-addressed {len(filenames)} audio files into {blobs} blobs")
+    if renamed:
+        print(f"Run `flask uploads purge-orphans --min-age 0` to remove the {len(renamed)} old files")
+
+
+def upgrade():
+    with op.batch_alter_table('song', schema=None) as batch_op:
+        batch_op.create_index('ix_song_file_path', ['file_path'], unique=False)
+
+    _dedupe_audio_files(op.get_bind())
+
+
+def downgrade():
+    # 文件改名不可逆，只撤销索引
+    with op.batch_alter_table('song', schema=None) as batch_op:
+        batch_op.drop_index('ix_song_file_path')
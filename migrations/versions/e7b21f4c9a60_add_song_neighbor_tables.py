@@ -0,0 +1,42 @@
+"""Add song neighbor tables for item-item recommendations
+
+Revision ID: e7b21f4c9a60
+Revises: c4a9e7f31d52
+Create Date: 2026-10-18 14:05:12.481306
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7b21f4c9a60'
+down_revision = 'c4a9e7f31d52'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('song_neighbor',
+    sa.Column('song_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('neighbor_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('song_id', 'neighbor_id')
+    )
+    with op.batch_alter_table('song_neighbor', schema=None) as batch_op:
+        batch_op.create_index('ix_song_neighbor_neighbor_id', ['neighbor_id'], unique=False)
+
+    op.create_table('song_neighbor_stale',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('song_id', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    # 相似表为空时 flask recommendations refresh 会自动全量构建，无需回填
+
+
+def downgrade():
+    op.drop_table('song_neighbor_stale')
+    with op.batch_alter_table('song_neighbor', schema=None) as batch_op:
+        batch_op.drop_index('ix_song_neighbor_neighbor_id')
+
+    op.drop_table('song_neighbor')
@@ -0,0 +1,124 @@
+"""
+音频元数据：上传后在后台读取时长和标签，留空的字段用标签填充，已有歌曲可批量回填
+"""
+
+import io
+import json
+import wave
+
+from mutagen.easyid3 import EasyID3
+from mutagen.id3 import TIT2, TPE1
+from mutagen.wave import WAVE
+
+from app import db
+from app.audio_metadata import read_metadata
+from app.jobs import run_pending
+from app.models import Song, Job, Playlist, PlaylistItem
+from conftest import make_user, login
+
+# MPEG-1 Layer III 128kbps 44.1kHz 的静音帧，每帧 1152 个采样
+MP3_FRAME = b'\xff\xfb\x90\x00' + b'\x00' * 413
+
+
+def make_mp3(path, frames=1000, **tags):
+    path.write_bytes(MP3_FRAME * frames)
+    id3 = EasyID3()
+    for key, value in tags.items():
+        id3[key] = value
+    id3.save(str(path))
+    return path.read_bytes()
+
+
+def make_wav(path, seconds):
+    with wave.open(str(path), 'wb') as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(8000)
+        w.writeframes(b'\x00\x00' * 8000 * seconds)
+    return path
+
+
+def upload(client, data, filename='track.mp3', **fields):
+    form = {'title': '', 'artist': '', 'visibility': 'public', 'audio_file': (io.BytesIO(data), filename)}
+    form.update(fields)
+    return client.post('/upload', data=form, content_type='multipart/form-data')
+
+
+def test_blank_fields_are_filled_from_tags(app, client, static_root, tmp_path):
+    data = make_mp3(tmp_path / 'a.mp3', title='Tagged', artist='Tag Artist', album='Tag Album', genre='Rock')
+    make_user('alice')
+    login(client, 'alice')
+    assert upload(client, data, filename='My Track.mp3', genre='Jazz').status_code == 302
+
+    song = Song.query.one()
+    # 提取完成前用文件名占位
+    assert (song.title, song.artist, song.duration) == ('My Track', '', None)
+    job = Job.query.filter_by(kind='extract_metadata').one()
+    assert json.loads(job.payload)['fill'] == ['title', 'artist', 'album']
+
+    run_pending()
+    db.session.expire_all()
+    assert (song.title, song.artist, song.album, song.genre) == ('Tagged', 'Tag Artist', 'Tag Album', 'Jazz')
+    assert song.duration == 26
+
+
+def test_typed_fields_are_kept(app, client, static_root, tmp_path):
+    data = make_mp3(tmp_path / 'a.mp3', title='Tagged', artist='Tag Artist')
+    make_user('alice')
+    login(client, 'alice')
+    upload(client, data, title='Typed', artist='Typed Artist', album='Typed Album', genre='Pop')
+
+    run_pending()
+    song = Song.query.one()
+    assert (song.title, song.artist, song.album, song.duration) == ('Typed', 'Typed Artist', 'Typed Album', 26)
+
+
+def test_reads_wav_with_id3_tags(tmp_path):
+    path = make_wav(tmp_path / 'a.wav', 3)
+    assert read_metadata(str(path)) == {'duration': 3}
+
+    audio = WAVE(str(path))
+    audio.add_tags()
+    audio.tags.add(TIT2(encoding=3, text='Wave Title'))
+    audio.tags.add(TPE1(encoding=3, text='Wave Artist'))
+    audio.save()
+    assert read_metadata(str(path)) == {
+        'duration': 3, 'title': 'Wave Title', 'artist': 'Wave Artist', 'album': None, 'genre': None,
+    }
+    assert read_metadata(str(tmp_path / 'missing.mp3')) is None
+
+
+def test_unreadable_file_does_not_retry(app, client, static_root):
+    make_user('alice')
+    login(client, 'alice')
+    upload(client, b'ID3 not really audio', title='Broken', artist='Artist')
+
+    run_pending()
+    assert Job.query.filter_by(kind='extract_metadata').one().status == 'done'
+    assert Song.query.one().duration is None
+
+
+def test_backfill_and_playlist_duration(app, client, static_root):
+    user = make_user('alice')
+    make_mp3(static_root / 'uploads' / 'audio' / 'a.mp3', album='Backfilled')
+    make_wav(static_root / 'uploads' / 'audio' / 'b.wav', 95)
+    playlist = Playlist(name='Mix', user_id=user.id)
+    db.session.add(playlist)
+    for order, name in enumerate(['a.mp3', 'b.wav', 'missing.mp3']):
+        song = Song(title=name, artist='Artist', album='', file_path=f'uploads/audio/{name}', user_id=user.id)
+        db.session.add(song)
+        db.session.flush()
+        db.session.add(PlaylistItem(playlist_id=playlist.id, song_id=song.id, order=order))
+    db.session.commit()
+
+    result = app.test_cli_runner().invoke(args=['metadata', 'backfill', '--batch-size', '2', '--workers', '2'])
+    assert result.exit_code == 0, result.output
+    assert '已检查 3 首歌曲，更新 2 首' in result.output
+    a, b, missing = Song.query.order_by(Song.id).all()
+    assert (a.duration, a.album, a.title) == (26, 'Backfilled', 'a.mp3')
+    assert (b.duration, missing.duration) == (95, None)
+
+    login(client, 'alice')
+    html = client.get(f'/playlist/{playlist.id}').get_data(as_text=True)
+    assert '3 songs, 2:01' in html
+    assert '1:35' in html and '--:--' in html
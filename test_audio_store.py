@@ -0,0 +1,138 @@
+"""
+音频按内容哈希存储：重复上传共用一份文件，删除最后一首引用的歌曲时才删除文件
+"""
+
+import hashlib
+import io
+import os
+
+import pytest
+
+from app import db
+from app.audio_store import store_audio_stream, release_audio, stored_audio_path
+from app.models import Song
+from conftest import make_user, login
+
+AUDIO = b'ID3' + bytes(range(256)) * 64
+
+
+def upload(client, data, title='Song', filename='song.mp3'):
+    return client.post('/upload', data={
+        'title': title, 'artist': 'Artist', 'visibility': 'public',
+        'audio_file': (io.BytesIO(data), filename),
+    }, content_type='multipart/form-data')
+
+
+def audio_files(static_root):
+    return sorted(os.listdir(static_root / 'uploads' / 'audio'))
+
+
+def test_identical_uploads_share_one_blob(app, client, static_root):
+    make_user('alice')
+    make_user('bob')
+    login(client, 'alice')
+    upload(client, AUDIO, title='First')
+    upload(client, AUDIO, title='Again', filename='copy.MP3')
+    client.get('/auth/logout')
+    login(client, 'bob')
+    upload(client, AUDIO, title='Bob')
+    upload(client, AUDIO + b'different', title='Other')
+
+    blob = f"{hashlib.sha256(AUDIO).hexdigest()}.mp3"
+    paths = {song.title: song.file_path for song in Song.query}
+    assert paths['First'] == paths['Again'] == paths['Bob'] == f'uploads/audio/{blob}'
+    assert paths['Other'] != paths['First']
+    assert audio_files(static_root) == sorted([blob, os.path.basename(paths['Other'])])
+    with open(static_root / paths['First'], 'rb') as f:
+        assert f.read() == AUDIO
+
+
+def test_blob_is_deleted_with_last_reference(app, client, static_root):
+    make_user('alice')
+    login(client, 'alice')
+    upload(client, AUDIO, title='First')
+    upload(client, AUDIO, title='Second')
+    first, second = Song.query.order_by(Song.id).all()
+    blob_path = static_root / first.file_path
+
+    client.post(f'/delete_song/{first.id}')
+    assert db.session.get(Song, first.id) is None
+    assert os.path.exists(blob_path)
+
+    client.post(f'/delete_song/{second.id}')
+    assert db.session.get(Song, second.id) is None
+    assert audio_files(static_root) == []
+
+
+def test_interrupted_stream_leaves_no_files(app, static_root):
+    class BrokenStream:
+        def __init__(self):
+            self.reads = 0
+
+        def read(self, size):
+            self.reads += 1
+            if self.reads > 2:
+                raise IOError('connection reset')
+            return b'x' * size
+
+    with pytest.raises(IOError):
+        store_audio_stream(BrokenStream(), 'mp3', str(static_root / 'uploads' / 'audio'))
+    assert audio_files(static_root) == []
+
+
+def test_purge_orphaned_audio(app, static_root):
+    user = make_user('alice')
+    audio = static_root / 'uploads' / 'audio'
+    for name in ('used.mp3', 'old.mp3', 'fresh.mp3', '.upload-abc'):
+        (audio / name).write_bytes(AUDIO)
+    os.utime(audio / 'used.mp3', (0, 0))
+    os.utime(audio / 'old.mp3', (0, 0))
+    db.session.add(Song(title='Song', artist='Artist', file_path='uploads/audio/used.mp3', user_id=user.id))
+    db.session.commit()
+
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=['uploads', 'purge-orphans', '--dry-run'])
+    assert result.exit_code == 0, result.output
+    assert 'old.mp3' in result.output and '找到 1 个' in result.output
+    assert os.path.exists(audio / 'old.mp3')
+
+    # 刚写入的文件可能属于尚未提交的上传，默认不删除
+    result = runner.invoke(args=['uploads', 'purge-orphans'])
+    assert '已删除 1 个' in result.output
+    assert audio_files(static_root) == ['.upload-abc', 'fresh.mp3', 'used.mp3']
+
+    result = runner.invoke(args=['uploads', 'purge-orphans', '--min-age', '0'])
+    assert audio_files(static_root) == ['.upload-abc', 'used.mp3']
+
+
+def test_release_races_with_deduplicated_upload(app, static_root, monkeypatch):
+    user = make_user('alice')
+    path = stored_audio_path(store_audio_stream(io.BytesIO(AUDIO), 'mp3'))
+    blob = static_root / path
+
+    def new_song(title):
+        db.session.add(Song(title=title, artist='Artist', file_path=path, user_id=user.id))
+
+    # 重复上传发现文件已存在，提交之前另一请求释放了文件：提交后用保留的临时文件放回
+    assert store_audio_stream(io.BytesIO(AUDIO), 'mp3') == os.path.basename(path)
+    assert release_audio(path) and not blob.exists()
+    new_song('First')
+    db.session.commit()
+    assert blob.read_bytes() == AUDIO
+    assert audio_files(static_root) == [os.path.basename(path)]
+
+    # 释放时文件已移开、复查引用之前重复上传提交：复查后恢复原位
+    Song.query.delete()
+    db.session.commit()
+    rename = os.rename
+
+    def rename_then_commit_upload(src, dst):
+        rename(src, dst)
+        store_audio_stream(io.BytesIO(AUDIO), 'mp3')
+        new_song('Second')
+        db.session.commit()
+
+    monkeypatch.setattr(os, 'rename', rename_then_commit_upload)
+    assert release_audio(path) is False
+    assert blob.read_bytes() == AUDIO
+    assert audio_files(static_root) == [os.path.basename(path)]
@@ -0,0 +1,100 @@
+"""
+音频流接口：Range 请求、强 ETag 和只允许浏览器缓存的缓存头，私有歌曲按可见性拦截，可交给前端代理发送
+"""
+
+import hashlib
+
+from app import db
+from app.models import Song
+from conftest import make_user, login
+
+AUDIO = b'ID3' + bytes(range(256)) * 40
+BLOB = f'{hashlib.sha256(AUDIO).hexdigest()}.mp3'
+
+
+def add_song(static_root, user, visibility='public'):
+    (static_root / 'uploads' / 'audio' / BLOB).write_bytes(AUDIO)
+    song = Song(title='Song', artist='Artist', file_path=f'uploads/audio/{BLOB}',
+                user_id=user.id, visibility=visibility)
+    db.session.add(song)
+    db.session.commit()
+    return song
+
+
+def test_full_and_range_requests(app, client, static_root):
+    song = add_song(static_root, make_user('alice'))
+
+    res = client.get(f'/song/{song.id}/audio')
+    assert res.status_code == 200 and res.data == AUDIO
+    assert res.mimetype == 'audio/mpeg'
+    assert res.headers['ETag'] == f'"{BLOB[:-4]}"'
+    assert res.headers['Accept-Ranges'] == 'bytes'
+    assert 'Last-Modified' in res.headers
+    # 不带内容版本的 URL 只允许浏览器按 ETag 确认后复用
+    assert res.cache_control.private and res.cache_control.no_cache
+    assert not res.cache_control.public and not res.cache_control.immutable
+
+    # 带当前内容版本的 URL 可以长期缓存；版本过期时退回按 ETag 确认
+    url = client.get(f'/api/song/{song.id}').get_json()['file_path']
+    assert url == f'/song/{song.id}/audio?v={BLOB[:-4]}'
+    res = client.get(url)
+    assert res.data == AUDIO
+    assert res.cache_control.private and res.cache_control.immutable and not res.cache_control.no_cache
+    assert res.cache_control.max_age == app.config['AUDIO_CACHE_MAX_AGE']
+    assert not res.cache_control.public
+    res = client.get(f'/song/{song.id}/audio?v={"0" * 64}')
+    assert res.cache_control.no_cache and not res.cache_control.immutable
+
+    res = client.get(f'/song/{song.id}/audio', headers={'Range': 'bytes=100-199'})
+    assert res.status_code == 206
+    assert res.headers['Content-Range'] == f'bytes 100-199/{len(AUDIO)}'
+    assert res.data == AUDIO[100:200]
+
+    res = client.get(f'/song/{song.id}/audio', headers={'If-None-Match': f'"{BLOB[:-4]}"'})
+    assert res.status_code == 304
+
+
+def test_private_songs_and_static_paths(app, client, static_root):
+    alice = make_user('alice')
+    make_user('bob')
+    song = add_song(static_root, alice, visibility='private')
+
+    assert client.get(f'/song/{song.id}/audio').status_code == 404
+    assert client.get(f'/api/song/{song.id}').status_code == 404
+    # 音频目录不能通过 static 直接访问
+    assert client.get(f'/static/uploads/audio/{BLOB}').status_code == 404
+    assert client.get(f'/static/uploads/covers/../audio/{BLOB}').status_code == 404
+
+    login(client, 'bob')
+    assert client.get(f'/song/{song.id}/audio').status_code == 404
+    client.get('/auth/logout')
+
+    login(client, 'alice')
+    res = client.get(f'/song/{song.id}/audio')
+    assert res.status_code == 200
+    assert res.cache_control.private and not res.cache_control.public
+    assert client.get(f'/api/song/{song.id}').get_json()['file_path'] == f'/song/{song.id}/audio?v={BLOB[:-4]}'
+    client.get('/auth/logout')
+    # 带版本的 URL 同样每次检查可见性
+    assert client.get(f'/song/{song.id}/audio?v={BLOB[:-4]}').status_code == 404
+
+
+def test_missing_file_is_404(app, client, static_root):
+    song = add_song(static_root, make_user('alice'))
+    (static_root / 'uploads' / 'audio' / BLOB).unlink()
+    assert client.get(f'/song/{song.id}/audio').status_code == 404
+
+
+def test_proxy_send_modes(app, client, static_root):
+    song = add_song(static_root, make_user('alice'))
+
+    app.config['AUDIO_SEND_MODE'] = 'x-accel'
+    res = client.get(f'/song/{song.id}/audio')
+    assert res.headers['X-Accel-Redirect'] == f'/_protected/audio/{BLOB}'
+    assert res.data == b'' and res.mimetype == 'audio/mpeg'
+    assert res.cache_control.private and res.cache_control.no_cache
+
+    app.config['AUDIO_SEND_MODE'] = 'x-sendfile'
+    res = client.get(f'/song/{song.id}/audio')
+    assert res.headers['X-Sendfile'] == str(static_root / 'uploads' / 'audio' / BLOB)
+    assert res.data == b''
@@ -0,0 +1,206 @@
+"""
+分块上传：按顺序接收分块，可断点续传，完成后按内容哈希存储并创建歌曲
+"""
+
+import hashlib
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db, chunked_uploads
+from app.models import Song, UploadSession
+from conftest import make_user, login
+
+CHUNK = 1000
+AUDIO = b'ID3' + bytes(range(256)) * 10  # 2563 字节，3 个分块
+
+
+@pytest.fixture
+def uploads(app, static_root, tmp_path):
+    app.config['UPLOAD_CHUNK_SIZE'] = CHUNK
+    app.config['UPLOAD_PARTIAL_DIR'] = str(tmp_path / 'partial')
+    make_user('alice')
+    return tmp_path / 'partial'
+
+
+def start(client, data=AUDIO, filename='song.mp3', **extra):
+    return client.post('/api/uploads', json=dict({'filename': filename, 'size': len(data)}, **extra))
+
+
+def put_chunk(client, upload_id, index, data=AUDIO, headers=None):
+    return client.put(f'/api/uploads/{upload_id}/chunks/{index}',
+                      data=data[index * CHUNK:(index + 1) * CHUNK], headers=headers)
+
+
+def complete(client, upload_id, title='Song'):
+    return client.post(f'/api/uploads/{upload_id}/complete', data={
+        'title': title, 'artist': 'Artist', 'visibility': 'public',
+    }, content_type='multipart/form-data')
+
+
+def test_chunked_upload_creates_song(client, uploads, static_root):
+    login(client, 'alice')
+    res = start(client, sha256=hashlib.sha256(AUDIO).hexdigest())
+    assert res.status_code == 201
+    upload_id = res.get_json()['upload_id']
+    assert res.get_json()['chunks'] == 3
+
+    for index in range(3):
+        assert put_chunk(client, upload_id, index).status_code == 200
+    status = client.get(f'/api/uploads/{upload_id}').get_json()
+    assert (status['received_bytes'], status['next_chunk']) == (len(AUDIO), 3)
+
+    res = complete(client, upload_id)
+    assert res.get_json()['success'] is True
+    song = Song.query.one()
+    assert song.file_path == f'uploads/audio/{hashlib.sha256(AUDIO).hexdigest()}.mp3'
+    with open(static_root / song.file_path, 'rb') as f:
+        assert f.read() == AUDIO
+    assert UploadSession.query.count() == 0
+    assert os.listdir(uploads) == []
+
+
+def test_resend_and_out_of_order_chunks(client, uploads):
+    login(client, 'alice')
+    upload_id = start(client).get_json()['upload_id']
+    assert put_chunk(client, upload_id, 0).status_code == 200
+    # 客户端没收到响应后重发已接收的分块，直接忽略
+    assert put_chunk(client, upload_id, 0).get_json()['received_bytes'] == CHUNK
+    # 跳过分块返回 409，并告知应上传的分块
+    res = put_chunk(client, upload_id, 2)
+    assert res.status_code == 409
+    assert res.get_json()['next_chunk'] == 1
+    # 大小不对的分块不写入
+    res = client.put(f'/api/uploads/{upload_id}/chunks/1', data=b'short')
+    assert res.status_code == 400
+    assert db.session.get(UploadSession, upload_id).received_bytes == CHUNK
+
+
+def test_rejects_bad_content_and_checksums(client, uploads):
+    login(client, 'alice')
+    assert start(client, filename='notes.txt').status_code == 400
+
+    upload_id = start(client).get_json()['upload_id']
+    res = put_chunk(client, upload_id, 0, data=b'X' * len(AUDIO))
+    assert res.status_code == 400 and 'MP3' in res.get_json()['error']
+
+    res = put_chunk(client, upload_id, 0, headers={'X-Chunk-SHA256': '0' * 64})
+    assert res.status_code == 400
+    assert os.path.getsize(uploads / f'{upload_id}.part') == 0
+
+    # 整体哈希不符时拒绝完成
+    upload_id = start(client, sha256='0' * 64).get_json()['upload_id']
+    for index in range(3):
+        put_chunk(client, upload_id, index)
+    assert complete(client, upload_id).status_code == 422
+    assert Song.query.count() == 0
+
+
+def test_failed_song_creation_can_be_retried(client, uploads, static_root, monkeypatch):
+    login(client, 'alice')
+    upload_id = start(client).get_json()['upload_id']
+    for index in range(3):
+        put_chunk(client, upload_id, index)
+
+    failures = [RuntimeError('secret internal detail')]
+
+    def enqueue_waveform(path):
+        if failures:
+            raise failures.pop()
+
+    monkeypatch.setattr('app.routes.enqueue_waveform', enqueue_waveform)
+    res = complete(client, upload_id)
+    assert res.status_code == 500
+    assert 'secret' not in res.get_json()['error']
+    # 回滚后会话和部分文件仍在，音频存储中不留下文件
+    assert db.session.get(UploadSession, upload_id) is not None
+    assert os.path.getsize(uploads / f'{upload_id}.part') == len(AUDIO)
+    assert os.listdir(static_root / 'uploads' / 'audio') == []
+    assert Song.query.count() == 0
+
+    assert complete(client, upload_id).get_json()['success'] is True
+    assert Song.query.count() == 1
+    assert os.listdir(uploads) == []
+
+
+def test_chunks_never_reread_the_partial_file(client, uploads, monkeypatch):
+    login(client, 'alice')
+    upload_id = start(client, sha256=hashlib.sha256(AUDIO).hexdigest()).get_json()['upload_id']
+    reads = []
+
+    def tracking_open(path, mode='r', *args, **kwargs):
+        f = open(path, mode, *args, **kwargs)
+        if str(path).endswith('.part'):
+            f = _CountingFile(f, reads)
+        return f
+
+    monkeypatch.setattr(chunked_uploads, 'open', tracking_open, raising=False)
+    # 写分块不读取已接收的数据，与由哪个进程处理无关；完成时顺序读一遍
+    for index in range(3):
+        assert put_chunk(client, upload_id, index).status_code == 200
+    assert sum(reads) == 0
+    assert complete(client, upload_id).status_code == 200
+    assert sum(reads) == len(AUDIO)
+
+
+class _CountingFile:
+    def __init__(self, f, reads):
+        self._f, self._reads = f, reads
+
+    def read(self, *args):
+        data = self._f.read(*args)
+        self._reads.append(len(data))
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self._f, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._f.close()
+
+
+def test_resume_after_restart_and_dedup(client, uploads, static_root):
+    login(client, 'alice')
+    upload_id = start(client, sha256=hashlib.sha256(AUDIO).hexdigest()).get_json()['upload_id']
+    put_chunk(client, upload_id, 0)
+    put_chunk(client, upload_id, 1)
+    # 部分文件丢失数据（如换了机器）时要求重新上传，不写出空洞
+    with open(uploads / f'{upload_id}.part', 'r+b') as f:
+        f.truncate(CHUNK)
+    assert put_chunk(client, upload_id, 2).status_code == 409
+    with open(uploads / f'{upload_id}.part', 'ab') as f:
+        f.write(AUDIO[CHUNK:2 * CHUNK])
+    put_chunk(client, upload_id, 2)
+    assert complete(client, upload_id, title='First').status_code == 200
+
+    upload_id = start(client).get_json()['upload_id']
+    for index in range(3):
+        put_chunk(client, upload_id, index)
+    assert complete(client, upload_id, title='Second').status_code == 200
+    first, second = Song.query.order_by(Song.id).all()
+    assert first.file_path == second.file_path
+    assert len(os.listdir(static_root / 'uploads' / 'audio')) == 1
+
+
+def test_sessions_are_private_and_purged(app, client, uploads):
+    make_user('bob')
+    login(client, 'alice')
+    upload_id = start(client).get_json()['upload_id']
+    put_chunk(client, upload_id, 0)
+    assert complete(client, upload_id).status_code == 409
+    client.get('/auth/logout')
+
+    login(client, 'bob')
+    assert client.get(f'/api/uploads/{upload_id}').status_code == 404
+    assert put_chunk(client, upload_id, 1).status_code == 404
+
+    db.session.get(UploadSession, upload_id).updated_at = datetime.utcnow() - timedelta(days=2)
+    db.session.commit()
+    result = app.test_cli_runner().invoke(args=['uploads', 'purge'])
+    assert '已清理 1 个未完成的上传' in result.output
+    assert UploadSession.query.count() == 0
+    assert os.listdir(uploads) == []
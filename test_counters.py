@@ -0,0 +1,118 @@
+"""
+冗余计数：关注、收藏、评论和公开歌曲数随操作增减，偏差可由 `flask counters reconcile` 修正
+"""
+
+from app import db
+from app.models import Song, User, Comment
+from conftest import make_user, login
+
+
+def add_song(user, visibility='public'):
+    song = Song(title='Song', artist='Artist', file_path='uploads/audio/x.mp3',
+                user_id=user.id, visibility=visibility)
+    db.session.add(song)
+    db.session.commit()
+    return song
+
+
+def refresh(*objects):
+    db.session.expire_all()
+    return [db.session.get(type(obj), obj.id) for obj in objects]
+
+
+def test_follow_and_unfollow(app, client):
+    alice = make_user('alice')
+    bob = make_user('bob')
+    login(client, 'alice')
+
+    client.post('/follow/bob')
+    alice, bob = refresh(alice, bob)
+    assert (alice.following_count, bob.followers_count) == (1, 1)
+    # 重复关注不重复计数
+    client.post('/follow/bob')
+    alice, bob = refresh(alice, bob)
+    assert (alice.following_count, bob.followers_count) == (1, 1)
+
+    client.post('/unfollow/bob')
+    client.post('/unfollow/bob')
+    alice, bob = refresh(alice, bob)
+    assert (alice.following_count, bob.followers_count) == (0, 0)
+
+
+def test_favorite_and_unfavorite(app, client):
+    song = add_song(make_user('alice'))
+    make_user('bob')
+    login(client, 'bob')
+
+    res = client.post(f'/song/{song.id}/favorite', json={})
+    assert res.get_json()['likes_count'] == 1
+    assert refresh(song)[0].likes_count == 1
+
+    res = client.post(f'/song/{song.id}/favorite', json={})
+    assert res.get_json()['is_favorited'] is False
+    assert refresh(song)[0].likes_count == 0
+
+
+def test_comment_create_and_delete(app, client):
+    alice = make_user('alice')
+    make_user('bob')
+    make_user('carol')
+    song = add_song(alice)
+    ajax = {'X-Requested-With': 'XMLHttpRequest'}
+
+    login(client, 'bob')
+    res = client.post(f'/song/{song.id}/comment', data={'content': 'first'}, headers=ajax)
+    assert res.get_json()['comments_count'] == 1
+    client.post(f'/song/{song.id}/comment', data={'content': 'second'}, headers=ajax)
+    assert refresh(song)[0].comments_count == 2
+    first, second = Comment.query.order_by(Comment.id).all()
+    client.get('/auth/logout')
+
+    # 只有评论作者和歌曲上传者可以删除
+    login(client, 'carol')
+    assert client.post(f'/comment/{first.id}/delete').status_code == 403
+    client.get('/auth/logout')
+
+    login(client, 'bob')
+    res = client.post(f'/comment/{first.id}/delete', headers=ajax)
+    assert res.get_json()['comments_count'] == 1
+    client.get('/auth/logout')
+
+    login(client, 'alice')
+    assert client.post(f'/comment/{second.id}/delete').status_code == 302
+    assert refresh(song)[0].comments_count == 0
+    assert Comment.query.count() == 0
+
+
+def test_reconcile_reports_and_fixes_drift(app, client):
+    alice = make_user('alice')
+    bob = make_user('bob')
+    song = add_song(alice)
+    add_song(alice, visibility='private')
+    login(client, 'bob')
+    client.post('/follow/alice')
+    client.post(f'/song/{song.id}/comment', data={'content': 'hi'})
+
+    # 故意破坏计数
+    db.session.expire_all()
+    db.session.get(Song, song.id).comments_count = 7
+    db.session.get(User, alice.id).followers_count = 0
+    db.session.get(User, alice.id).public_songs_count = 5
+    db.session.get(User, bob.id).following_count = 3
+    db.session.commit()
+
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=['counters', 'reconcile', '--dry-run'])
+    assert result.exit_code == 0, result.output
+    assert f'song#{song.id} comments_count: 7 -> 1' in result.output
+    assert f'user#{alice.id} followers_count: 0 -> 1' in result.output
+    assert f'user#{alice.id} public_songs_count: 5 -> 1' in result.output
+    assert f'user#{bob.id} following_count: 3 -> 1' in result.output
+    assert '发现 4 处计数偏差' in result.output
+    assert refresh(song)[0].comments_count == 7
+
+    result = runner.invoke(args=['counters', 'reconcile', '--batch-size', '1'])
+    assert '已修正 4 处计数偏差' in result.output
+    song, alice, bob = refresh(song, alice, bob)
+    assert (song.comments_count, alice.followers_count, alice.public_songs_count, bob.following_count) == (1, 1, 1, 1)
+    assert '已修正 0 处计数偏差' in runner.invoke(args=['counters', 'reconcile']).output
@@ -0,0 +1,194 @@
+"""
+封面并发搜索：用本地桩服务器模拟慢速和故障的封面来源；搜索结果持久缓存
+"""
+
+import time
+
+import pytest
+from sqlalchemy import event
+
+from app import db, cover_cache
+from app.covers import PROVIDERS, resolve_cover, artist_cover_candidates
+from conftest import StubProvider
+
+
+def netease_body(title, album='NE Album'):
+    return {'result': {'songs': [{'name': title, 'artists': [{'name': 'Artist'}],
+                                  'album': {'name': album, 'picUrl': 'http://img/netease.jpg'}}]}}
+
+
+def qq_body(title, album='QQ Album'):
+    return {'data': {'song': {'list': [{'name': title, 'singer': [{'name': 'Artist'}],
+                                        'album': {'name': album, 'mid': 'qqmid'}}]}}}
+
+
+def itunes_body(title, album='iTunes Album'):
+    return {'results': [{'trackName': title, 'collectionName': album,
+                         'artworkUrl100': 'http://img/itunes/100x100bb.jpg'}]}
+
+
+@pytest.fixture
+def providers(app):
+    stubs = {name: StubProvider() for name in ('netease', 'qq', 'itunes', 'lastfm')}
+    stubs['netease'].body = netease_body('Other Song')
+    stubs['qq'].body = qq_body('Other Song')
+    stubs['itunes'].body = itunes_body('Other Song')
+    stubs['lastfm'].body = {'topalbums': {'album': []}}
+    app.config['COVER_PROVIDER_URLS'] = {name: stub.url for name, stub in stubs.items()}
+    app.config['COVER_SEARCH_DEADLINE'] = 1.5
+    app.config['COVER_PROVIDER_TIMEOUT'] = 1.5
+    for client in app.extensions['provider_clients'].values():
+        client.backoff = 0.01
+    yield stubs
+    for stub in stubs.values():
+        stub.close()
+
+
+def timed_resolve():
+    started = time.monotonic()
+    match = resolve_cover('Artist', 'Target')
+    return match, time.monotonic() - started
+
+
+def test_confident_match_returns_without_waiting_for_slow_providers(app, providers):
+    providers['netease'].delay = 3
+    providers['qq'].delay = 3
+    providers['itunes'].body = itunes_body('Target')
+
+    match, elapsed = timed_resolve()
+    assert match.provider.name == 'itunes' and match.match_score == 100
+    assert match.url == 'http://img/itunes/600x600bb.jpg'
+    assert elapsed < 1
+
+
+def test_waits_for_better_match_until_deadline(app, providers):
+    # 网易云先返回部分匹配，QQ 稍后返回精确匹配
+    providers['qq'].delay = 0.3
+    providers['qq'].body = qq_body('Target')
+
+    match, elapsed = timed_resolve()
+    assert match.provider.name == 'qq' and match.match_score == 100
+    assert 0.3 <= elapsed < 1
+
+
+def test_failing_and_hanging_providers_are_bounded_by_deadline(app, providers):
+    providers['netease'].status = 500
+    providers['qq'].delay = 5
+    providers['itunes'].status = 503
+
+    match, elapsed = timed_resolve()
+    assert match is None
+    assert elapsed < 2
+
+
+def test_back_to_back_searches_are_not_starved_by_a_hanging_provider(app, providers):
+    app.config['COVER_SEARCH_WORKERS'] = 2
+    providers['qq'].delay = 5
+    providers['itunes'].body = itunes_body('Target')
+
+    # 不走缓存，每次都查询；挂起的 QQ 查询占满自己的线程后，后续搜索仍能及时拿到 iTunes 的结果
+    for _ in range(4):
+        started = time.monotonic()
+        match = resolve_cover('Artist', 'Target', providers=PROVIDERS)
+        assert match.provider.name == 'itunes'
+        assert time.monotonic() - started < 1
+
+    # 排队中被放弃的查询不再发出请求
+    time.sleep(1.6)
+    assert providers['qq'].requests == 2
+
+
+def test_partial_matches_ranked_by_provider_priority(app, providers):
+    match, _ = timed_resolve()
+    assert match.provider.name == 'netease' and match.match_score == 50
+
+
+def test_search_cover_api(app, client, providers):
+    providers['netease'].body = netease_body('Target')
+    data = client.get('/api/search_cover', query_string={'artist': 'Artist', 'title': 'Target'}).get_json()
+    assert data == {'success': True, 'cover_url': 'http://img/netease.jpg?param=600y600',
+                    'source': 'NetEase Cloud Music'}
+
+
+def request_counts(providers):
+    return {name: stub.requests for name, stub in providers.items()}
+
+
+def test_cover_lookups_are_cached_by_normalized_key(app, providers):
+    providers['netease'].body = netease_body('Target')
+    first, _ = timed_resolve()
+    # 网易云精确匹配后立即返回，等其他来源已发出的查询到达桩服务器再计数
+    time.sleep(0.2)
+    before = request_counts(providers)
+
+    # 大小写、全角和多余空白不同的写法命中同一条缓存，且不再请求外部接口
+    second = resolve_cover('  ＡRTIST ', 'target')
+    with app.test_request_context():
+        assert second.url == first.url and second.source == 'NetEase Cloud Music'
+    assert request_counts(providers) == before
+
+    item = cover_cache.stats()['cover']
+    assert (item['entries'], item['hits'], item['misses']) == (1, 1, 1)
+    assert item['hit_rate'] == 0.5
+
+
+def test_not_found_is_cached_only_when_every_provider_answered(app, providers):
+    for name in ('netease', 'qq', 'itunes'):
+        providers[name].body = {}
+    providers['qq'].status = 500
+    assert resolve_cover('Artist', 'Missing') is None
+    assert 'cover' not in cover_cache.stats()
+
+    providers['qq'].status = 200
+    assert resolve_cover('Artist', 'Missing') is None
+    assert cover_cache.stats()['cover']['negative'] == 1
+
+    before = request_counts(providers)
+    assert resolve_cover('Artist', 'Missing') is None
+    assert request_counts(providers) == before
+
+
+def test_expired_entries_are_refreshed(app, providers):
+    app.config['COVER_CACHE_TTL'] = -1
+    providers['netease'].body = netease_body('Target')
+    timed_resolve()
+    timed_resolve()
+    assert providers['netease'].requests == 2
+    assert cover_cache.purge_expired() == 1
+
+
+def test_artist_candidates_cached_for_update_cover(app, providers):
+    providers['itunes'].status = 500
+    providers['lastfm'].body = {'topalbums': {'album': [
+        {'image': [{'size': 'small', '#text': 'http://img/s.jpg'},
+                   {'size': 'extralarge', '#text': 'http://img/a.jpg'}]},
+        {'image': [{'size': 'extralarge', '#text': 'http://img/b.jpg'}]},
+    ]}}
+
+    assert artist_cover_candidates('Artist') == ['http://img/a.jpg', 'http://img/b.jpg']
+    providers['lastfm'].status = 500
+    assert artist_cover_candidates('artist') == ['http://img/a.jpg', 'http://img/b.jpg']
+    assert providers['lastfm'].requests == 1
+
+
+def test_hits_are_buffered_off_the_read_path(app, monkeypatch):
+    monkeypatch.setattr(cover_cache, 'HIT_FLUSH_THRESHOLD', 3)
+    cover_cache.store('cover', 'k', {'url': 'http://img/a.jpg'}, 60)
+    writes = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('UPDATE'):
+            writes.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        assert cover_cache.lookup('cover', 'k') == (True, {'url': 'http://img/a.jpg'})
+        cover_cache.lookup('cover', 'k')
+        assert writes == []
+        # 攒够阈值后合并为一次 UPDATE
+        cover_cache.lookup('cover', 'k')
+        assert len(writes) == 1
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    cover_cache.lookup('cover', 'k')
+    assert cover_cache.stats()['cover']['hits'] == 4
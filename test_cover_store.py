@@ -0,0 +1,169 @@
+"""
+封面存储：流式下载、大小和类型校验、按内容哈希去重，删除时按引用计数
+"""
+
+import hashlib
+import os
+
+import pytest
+
+from app import db
+from app.cover_store import download_cover_image, store_cover_stream, release_cover, InvalidCover
+from app.models import Song
+from conftest import StubProvider, make_user, login
+
+PNG = b'\x89PNG\r\n\x1a\n' + b'\x01' * 200
+JPEG = b'\xff\xd8\xff\xe0' + b'\x02' * 200
+
+
+@pytest.fixture
+def covers_dir(tmp_path):
+    path = tmp_path / 'covers'
+    path.mkdir()
+    return path
+
+
+@pytest.fixture
+def image_server(app):
+    stub = StubProvider()
+    stub.body = PNG
+    stub.content_type = 'image/png'
+    yield stub
+    stub.close()
+
+
+def stored_files(directory):
+    return sorted(os.listdir(directory))
+
+
+def test_identical_covers_share_one_file(app, image_server, covers_dir):
+    first = download_cover_image(image_server.url + '?a', str(covers_dir))
+    second = download_cover_image(image_server.url + '?b', str(covers_dir))
+
+    assert first == second == f"{hashlib.sha256(PNG).hexdigest()}.png"
+    # 重复内容的临时文件保留到事务结束，期间文件被释放时用它放回
+    assert len(stored_files(covers_dir)) == 2
+    db.session.commit()
+    assert stored_files(covers_dir) == [first]
+    with open(covers_dir / first, 'rb') as f:
+        assert f.read() == PNG
+
+    image_server.body = JPEG
+    image_server.content_type = 'image/jpeg; charset=binary'
+    third = download_cover_image(image_server.url, str(covers_dir))
+    assert third.endswith('.jpg') and third != first
+    assert len(stored_files(covers_dir)) == 2
+
+
+@pytest.mark.parametrize('content_type, body', [
+    ('application/json', PNG),
+    ('text/html', b'<html></html>'),
+    ('image/png', b'<html>not an image</html>'),
+])
+def test_rejects_non_image_content(app, image_server, covers_dir, content_type, body):
+    image_server.content_type = content_type
+    image_server.body = body
+    assert download_cover_image(image_server.url, str(covers_dir)) is None
+    assert stored_files(covers_dir) == []
+
+
+def test_size_limit(app, image_server, covers_dir):
+    app.config['COVER_MAX_BYTES'] = 100
+    # 声明的长度超限，直接拒绝
+    assert download_cover_image(image_server.url, str(covers_dir)) is None
+    assert stored_files(covers_dir) == []
+
+    # 没有声明长度时，写入过程中超限即中止并删除临时文件
+    chunks = (PNG[i:i + 32] for i in range(0, len(PNG), 32))
+    with pytest.raises(InvalidCover):
+        store_cover_stream(chunks, str(covers_dir), max_bytes=100)
+    assert stored_files(covers_dir) == []
+
+
+def test_shared_cover_is_deleted_with_last_reference(app, client, image_server):
+    covers_dir = os.path.join(app.root_path, 'static', 'uploads', 'covers')
+    os.makedirs(covers_dir, exist_ok=True)
+    filename = download_cover_image(image_server.url, covers_dir)
+    cover_path = os.path.join(covers_dir, filename)
+
+    user = make_user('alice')
+    songs = [Song(title=f'Song {i}', artist='Artist', file_path='uploads/audio/missing.mp3',
+                  cover_image=f'uploads/covers/{filename}', user_id=user.id) for i in range(2)]
+    db.session.add_all(songs)
+    db.session.commit()
+    first_id, second_id = songs[0].id, songs[1].id
+    login(client, 'alice')
+
+    try:
+        client.post(f'/delete_song/{first_id}')
+        assert db.session.get(Song, first_id) is None
+        assert os.path.exists(cover_path)
+
+        client.post(f'/delete_song/{second_id}')
+        assert db.session.get(Song, second_id) is None
+        assert not os.path.exists(cover_path)
+    finally:
+        if os.path.exists(cover_path):
+            os.remove(cover_path)
+
+
+def test_replacing_cover_keeps_file_used_by_other_songs(app, client, image_server):
+    covers_dir = os.path.join(app.root_path, 'static', 'uploads', 'covers')
+    os.makedirs(covers_dir, exist_ok=True)
+    old_filename = download_cover_image(image_server.url, covers_dir)
+    image_server.body = JPEG
+    image_server.content_type = 'image/jpeg'
+    new_path = None
+
+    itunes = StubProvider()
+    itunes.body = {'results': [{'artistName': 'Artist', 'artworkUrl100': image_server.url}]}
+    app.config['COVER_PROVIDER_URLS'] = dict(app.config['COVER_PROVIDER_URLS'], itunes=itunes.url)
+
+    user = make_user('alice')
+    songs = [Song(title=f'Song {i}', artist='Artist', file_path='uploads/audio/missing.mp3',
+                  cover_image=f'uploads/covers/{old_filename}', user_id=user.id) for i in range(2)]
+    db.session.add_all(songs)
+    db.session.commit()
+    login(client, 'alice')
+
+    try:
+        data = client.post(f'/api/update_cover/{songs[0].id}').get_json()
+        assert data['success'], data
+        db.session.expire_all()
+        new_path = os.path.join(app.root_path, 'static', songs[0].cover_image)
+        assert songs[0].cover_image.endswith('.jpg')
+        # 另一首歌仍在使用旧封面
+        assert os.path.exists(os.path.join(covers_dir, old_filename))
+
+        data = client.post(f'/api/update_cover/{songs[1].id}').get_json()
+        assert data['success'], data
+        db.session.expire_all()
+        assert songs[1].cover_image == songs[0].cover_image
+        assert not os.path.exists(os.path.join(covers_dir, old_filename))
+        assert os.path.exists(new_path)
+    finally:
+        itunes.close()
+        for path in (os.path.join(covers_dir, old_filename), new_path):
+            if path and os.path.exists(path):
+                os.remove(path)
+
+
+def test_release_races_with_deduplicated_download(app, image_server, static_root):
+    covers_dir = static_root / 'uploads' / 'covers'
+    user = make_user('alice')
+    filename = download_cover_image(image_server.url, str(covers_dir))
+    cover_image = f'uploads/covers/{filename}'
+
+    # 下载到相同内容时文件已存在；提交前文件因没有引用被释放，提交后放回
+    assert download_cover_image(image_server.url, str(covers_dir)) == filename
+    assert release_cover(cover_image) and not (covers_dir / filename).exists()
+    db.session.add(Song(title='Song', artist='Artist', file_path='uploads/audio/x.mp3',
+                        cover_image=cover_image, user_id=user.id))
+    db.session.commit()
+    assert (covers_dir / filename).read_bytes() == PNG
+    assert stored_files(covers_dir) == [filename]
+
+    # 回滚时丢弃保留的临时文件
+    download_cover_image(image_server.url, str(covers_dir))
+    db.session.rollback()
+    assert stored_files(covers_dir) == [filename]
@@ -0,0 +1,98 @@
+"""
+首页缓存：匿名访问命中缓存时不查询数据库，公开歌曲变化后立即失效
+"""
+
+from sqlalchemy import event
+
+from app import db
+from app.cache import LRUCache, SQLiteCache
+from app.models import Song
+from conftest import make_user, login
+
+
+def count_queries(client, url):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        response = client.get(url)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    assert response.status_code == 200
+    return len(statements), response.get_data(as_text=True)
+
+
+def add_song(owner, title, visibility='public'):
+    song = Song(title=title, artist='Artist', file_path='uploads/audio/x.mp3',
+                user_id=owner.id, visibility=visibility)
+    db.session.add(song)
+    db.session.commit()
+    return song
+
+
+def test_anonymous_home_hit_skips_database(app, client):
+    owner = make_user('owner')
+    add_song(owner, 'Cached Song')
+
+    misses, body = count_queries(client, '/')
+    assert misses > 0 and 'Cached Song' in body
+
+    hits, body = count_queries(client, '/')
+    assert hits == 0 and 'Cached Song' in body
+
+
+def test_visibility_change_invalidates_home(app, client):
+    owner = make_user('owner')
+    song = add_song(owner, 'Secret Song', visibility='private')
+    login(client, 'owner')
+
+    assert 'Secret Song' not in client.get('/').get_data(as_text=True)
+    client.post(f'/song/{song.id}/visibility', data={'visibility': 'public'})
+    assert 'Secret Song' in client.get('/').get_data(as_text=True)
+
+    client.post(f'/delete_song/{song.id}')
+    assert 'Secret Song' not in client.get('/').get_data(as_text=True)
+
+
+def test_home_lists_songs_without_uploader(app, client):
+    song = Song(title='Orphan Song', artist='Artist', file_path='uploads/audio/x.mp3', visibility='public')
+    db.session.add(song)
+    db.session.commit()
+
+    # 缓存的区块中 uploader 为 None 时不生成个人主页链接
+    for _ in range(2):
+        _, body = count_queries(client, '/')
+        assert 'Orphan Song' in body
+
+
+def test_lru_cache_evicts_and_expires(app):
+    app.config['CACHE_MAX_ENTRIES'] = 2
+    lru = LRUCache(app)
+    lru.set('a', 1, 60)
+    lru.set('b', 2, 60)
+    lru.get('a')
+    lru.set('c', 3, 60)
+    assert lru.get('b') is None and lru.get('a') == 1 and lru.get('c') == 3
+
+    lru.set('d', 4, -1)
+    assert lru.get('d') is None
+
+
+def test_sqlite_cache_purges_expired_rows(app, tmp_path):
+    app.config['CACHE_SQLITE_PATH'] = str(tmp_path / 'cache.db')
+    app.config['CACHE_PURGE_EVERY'] = 3
+    sqlite_cache = SQLiteCache(app)
+
+    def rows():
+        return [row[0] for row in sqlite_cache._connect().execute('SELECT key FROM cache_entries ORDER BY key')]
+
+    sqlite_cache.set('old', 1, -1)
+    sqlite_cache.set('live', 2, 60)
+    assert rows() == ['live', 'old'] and sqlite_cache.get('old') is None
+    # 每写入 3 次顺带删除过期行
+    sqlite_cache.set('new', 3, 60)
+    assert rows() == ['live', 'new']
+    assert sqlite_cache.get('live') == 2
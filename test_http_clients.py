@@ -0,0 +1,148 @@
+"""
+外部来源客户端：连接复用、抖动退避重试、熔断器打开后直接跳过
+"""
+
+import threading
+import time
+
+import pytest
+import requests
+
+from app import http_clients
+from app.covers import resolve_cover
+from app.http_clients import ProviderClient, ProviderUnavailable, ProviderCancelled, CircuitBreaker
+from conftest import StubProvider, login, make_user
+
+
+@pytest.fixture
+def stub():
+    server = StubProvider()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def client_config(app):
+    app.config.update(PROVIDER_BACKOFF=0.01, PROVIDER_BREAKER_THRESHOLD=3, PROVIDER_BREAKER_RESET=0.3)
+    return app.config
+
+
+def test_session_reuses_connections(client_config, stub):
+    provider = ProviderClient('itunes', client_config)
+    for _ in range(3):
+        assert provider.get(stub.url, timeout=2).status_code == 200
+    assert len(set(stub.client_ports)) == 1
+
+
+def test_retries_server_errors_then_succeeds(client_config, stub):
+    stub.statuses = [503, 502]
+    provider = ProviderClient('itunes', client_config)
+    assert provider.get(stub.url, timeout=2).status_code == 200
+    assert stub.requests == 3
+    assert provider.breaker.state == CircuitBreaker.CLOSED
+    assert provider.stats()['errors'] == 2
+
+
+def test_client_errors_are_not_retried(client_config, stub):
+    stub.status = 404
+    provider = ProviderClient('itunes', client_config)
+    assert provider.get(stub.url, timeout=2).status_code == 404
+    assert stub.requests == 1 and provider.breaker.failures == 0
+
+
+def test_breaker_opens_then_probes_after_cooldown(client_config, stub):
+    stub.status = 500
+    provider = ProviderClient('qq', client_config)
+    assert provider.get(stub.url, timeout=2).status_code == 500
+    assert provider.breaker.state == CircuitBreaker.OPEN and stub.requests == 3
+
+    with pytest.raises(ProviderUnavailable):
+        provider.get(stub.url, timeout=2)
+    assert stub.requests == 3 and not provider.available()
+
+    # 冷却后放行一次试探请求，成功即关闭
+    time.sleep(0.35)
+    stub.status = 200
+    assert provider.available()
+    assert provider.get(stub.url, timeout=2).status_code == 200
+    assert provider.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_timeouts_count_as_failures_without_retry(client_config, stub):
+    stub.delay = 0.5
+    provider = ProviderClient('netease', client_config)
+    with pytest.raises(requests.Timeout):
+        provider.get(stub.url, timeout=0.1)
+    assert stub.requests == 1 and provider.breaker.failures == 1
+
+
+def test_bound_client_caps_timeout_and_stops_after_cancel(client_config, stub, monkeypatch):
+    stub.delay = 0.5
+    provider = ProviderClient('qq', client_config)
+    cancel = threading.Event()
+
+    # 每次请求的超时不超过距截止时间的剩余时间
+    started = time.monotonic()
+    with pytest.raises(requests.Timeout):
+        provider.bound(time.monotonic() + 0.1, cancel).get(stub.url, timeout=2)
+    assert time.monotonic() - started < 0.4
+
+    # 调用方已放弃：不再发出请求，也不计入熔断器
+    stub.delay = 0
+    stub.status = 503
+    cancel.set()
+    with pytest.raises(ProviderCancelled):
+        provider.bound(time.monotonic() + 2, cancel).get(stub.url, timeout=2)
+    assert stub.requests == 1 and provider.breaker.failures == 1
+
+    # 重试等待期间被取消则不再重试
+    cancel = threading.Event()
+    monkeypatch.setattr(http_clients.random, 'uniform', lambda low, high: high)
+    provider = ProviderClient('qq', client_config)
+    provider.backoff = 0.3
+    threading.Timer(0.05, cancel.set).start()
+    with pytest.raises(ProviderCancelled):
+        provider.bound(time.monotonic() + 2, cancel).get(stub.url, timeout=2)
+    assert stub.requests == 2
+
+
+def test_probe_failing_with_other_request_errors_reopens(client_config, stub, monkeypatch):
+    stub.status = 500
+    provider = ProviderClient('itunes', client_config)
+    provider.get(stub.url, timeout=2)
+    assert provider.breaker.state == CircuitBreaker.OPEN
+
+    # 试探请求抛出非连接类的异常：计为失败并重新打开，冷却后可以再次试探
+    time.sleep(0.35)
+
+    def broken(url, **kwargs):
+        raise requests.exceptions.ChunkedEncodingError('truncated body')
+
+    monkeypatch.setattr(provider.session, 'get', broken)
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        provider.get(stub.url, timeout=2)
+    assert provider.breaker.state == CircuitBreaker.OPEN and not provider.available()
+
+    monkeypatch.undo()
+    stub.status = 200
+    time.sleep(0.35)
+    assert provider.get(stub.url, timeout=2).status_code == 200
+    assert provider.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_resolver_skips_open_breaker_and_reports_status(app, client, client_config, stub):
+    stub.delay = 3
+    app.config['COVER_PROVIDER_URLS'] = dict.fromkeys(('netease', 'qq', 'itunes'), stub.url)
+    for name in ('netease', 'qq', 'itunes'):
+        breaker = app.extensions['provider_clients'][name].breaker
+        breaker.state, breaker.opened_at = CircuitBreaker.OPEN, time.monotonic()
+
+    started = time.monotonic()
+    assert resolve_cover('Artist', 'Title') is None
+    assert time.monotonic() - started < 0.5 and stub.requests == 0
+
+    make_user('alice')
+    login(client, 'alice')
+    status = client.get('/api/providers/status').get_json()
+    assert status['netease']['state'] == 'open'
+    assert set(status['itunes']['latency_ms']) == {'p50', 'p95', 'samples'}
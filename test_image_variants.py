@@ -0,0 +1,109 @@
+"""
+缩略图变体：多尺寸 WebP/JPEG 在后台生成，模板输出 srcset，删除封面时一并清理
+"""
+
+import io
+import os
+
+from PIL import Image
+
+from app import db
+from app.cover_store import release_cover
+from app.image_variants import generate_variants, image_variants, variant_path, manifest_path
+from app.jobs import run_pending
+from app.models import Song, Job
+from conftest import make_user, login
+
+
+def save_image(static_root, path, size, mode='RGB', color=(200, 30, 30)):
+    Image.new(mode, size, color).save(static_root / path)
+    return path
+
+
+def test_generates_square_webp_and_jpeg_variants(app, static_root):
+    path = save_image(static_root, 'uploads/covers/wide.png', (900, 700), mode='RGBA', color=(0, 0, 255, 0))
+
+    assert generate_variants(path) == [64, 200, 600]
+    for size in (64, 200, 600):
+        with Image.open(static_root / variant_path(path, size, 'webp')) as img:
+            assert (img.format, img.size) == ('WEBP', (size, size))
+        with Image.open(static_root / variant_path(path, size, 'jpg')) as img:
+            assert (img.format, img.size, img.mode) == ('JPEG', (size, size), 'RGB')
+            # 透明区域铺白
+            assert img.getpixel((size // 2, size // 2)) > (240, 240, 240)
+    assert os.path.exists(static_root / manifest_path(path))
+
+
+def test_small_images_are_not_upscaled(app, static_root):
+    medium = save_image(static_root, 'uploads/avatars/medium.jpg', (250, 300))
+    tiny = save_image(static_root, 'uploads/avatars/tiny.jpg', (40, 40))
+
+    assert generate_variants(medium) == [64, 200]
+    assert not os.path.exists(static_root / variant_path(medium, 600, 'jpg'))
+    assert generate_variants(tiny) == [64]
+
+
+def test_srcset_and_cleanup(app, client, static_root):
+    path = save_image(static_root, 'uploads/covers/cover.png', (640, 640))
+    user = make_user('alice')
+    song = Song(title='Song', artist='Artist', file_path='uploads/audio/x.mp3',
+                cover_image=path, user_id=user.id, visibility='public')
+    db.session.add(song)
+    db.session.commit()
+
+    # 变体生成之前输出原图
+    html = client.get('/library').get_data(as_text=True)
+    assert 'srcset' not in html and '/static/uploads/covers/cover.png' in html
+
+    generate_variants(path)
+    with app.test_request_context():
+        assert image_variants(path)['jpg'] == ', '.join(
+            f'/static/uploads/covers/variants/cover-{size}.jpg {size}w' for size in (64, 200, 600))
+    html = client.get('/library').get_data(as_text=True)
+    assert '<source type="image/webp" srcset="/static/uploads/covers/variants/cover-64.webp 64w' in html
+    assert 'sizes="200px"' in html
+
+    db.session.delete(song)
+    db.session.commit()
+    assert release_cover(path)
+    assert os.listdir(static_root / 'uploads' / 'covers' / 'variants') == []
+    with app.test_request_context():
+        assert image_variants(path) is None
+
+
+def test_uploaded_cover_is_processed_in_background(app, client, static_root):
+    make_user('alice')
+    login(client, 'alice')
+    cover = io.BytesIO()
+    Image.new('RGB', (300, 300), (0, 128, 0)).save(cover, 'JPEG')
+    cover.seek(0)
+
+    client.post('/upload', data={
+        'title': 'Song', 'artist': 'Artist', 'visibility': 'public',
+        'audio_file': (io.BytesIO(b'ID3 audio'), 'song.mp3'),
+        'cover_image': (cover, 'cover.jpg'),
+    }, content_type='multipart/form-data')
+
+    song = Song.query.one()
+    job = Job.query.filter_by(kind='image_variants').one()
+    assert job.status == 'pending'
+    assert not os.path.exists(static_root / manifest_path(song.cover_image))
+
+    run_pending()
+    assert os.path.exists(static_root / variant_path(song.cover_image, 200, 'webp'))
+
+
+def test_backfill_command(app, static_root):
+    cover = save_image(static_root, 'uploads/covers/a.jpg', (700, 700))
+    avatar = save_image(static_root, 'uploads/avatars/b.png', (128, 128))
+    (static_root / 'uploads' / 'covers' / 'broken.jpg').write_bytes(b'not an image')
+
+    result = app.test_cli_runner().invoke(args=['images', 'backfill'])
+    assert result.exit_code == 0, result.output
+    assert '已处理 2 张图片，失败 1 张' in result.output
+    assert os.path.exists(static_root / variant_path(cover, 600, 'webp'))
+    assert os.path.exists(static_root / variant_path(avatar, 64, 'jpg'))
+
+    # 再次运行跳过已有变体的图片，也不会把 variants 目录当作源图
+    result = app.test_cli_runner().invoke(args=['images', 'backfill'])
+    assert '已处理 2 张图片，失败 1 张' in result.output
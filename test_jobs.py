@@ -0,0 +1,230 @@
+"""
+后台任务队列：上传后立即提交歌曲，封面由任务异步获取；失败按退避重试，重复执行无副作用
+"""
+
+import io
+import os
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from PIL import Image
+from sqlalchemy import event
+
+from app import db
+from app.covers import cover_job_key
+from app.image_variants import image_variants
+from app.jobs import enqueue, claim, run_pending
+from app.models import Song, Job
+from conftest import StubProvider, make_user, login
+
+
+
+def png_bytes(size=300):
+    buffer = io.BytesIO()
+    Image.new('RGB', (size, size), (200, 30, 30)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+PNG = png_bytes()
+
+
+@pytest.fixture
+def providers(app):
+    stubs = {name: StubProvider() for name in ('netease', 'qq', 'itunes', 'lastfm', 'image')}
+    stubs['qq'].body = {}
+    stubs['itunes'].body = {}
+    app.config['COVER_PROVIDER_URLS'] = {name: stub.url for name, stub in stubs.items()}
+    app.config['COVER_SEARCH_DEADLINE'] = 1.5
+    app.config['COVER_PROVIDER_TIMEOUT'] = 1.5
+    for client in app.extensions['provider_clients'].values():
+        client.backoff = 0.01
+    # 封面图片也从桩服务器下载
+    stubs['image'].body = PNG
+    stubs['image'].content_type = 'image/png'
+    stubs['netease'].body = {'result': {'songs': [{
+        'name': 'Target', 'artists': [{'name': 'Artist'}],
+        'album': {'name': 'Album', 'picUrl': stubs['image'].url}
+    }]}}
+    yield stubs
+    for stub in stubs.values():
+        stub.close()
+
+
+def add_song(title='Target', cover_image=None):
+    user = make_user(f'uploader{Song.query.count()}')
+    song = Song(title=title, artist='Artist', file_path='uploads/audio/x.mp3',
+                cover_image=cover_image, user_id=user.id, visibility='public')
+    db.session.add(song)
+    db.session.commit()
+    return song
+
+
+def test_upload_commits_immediately_and_fetches_cover_in_background(app, client, providers, static_root):
+    for stub in providers.values():
+        stub.delay = 1
+    make_user('alice')
+    login(client, 'alice')
+
+    started = time.monotonic()
+    response = client.post('/upload', data={
+        'title': 'Target', 'artist': 'Artist', 'visibility': 'public', 'auto_search_cover': 'y',
+        'audio_file': (io.BytesIO(b'ID3 audio'), 'song.mp3'),
+    }, content_type='multipart/form-data')
+    assert response.status_code == 302
+    assert time.monotonic() - started < 0.5
+    assert sum(stub.requests for stub in providers.values()) == 0
+
+    song = Song.query.one()
+    assert song.cover_image is None
+    job = Job.query.filter_by(kind='fetch_cover').one()
+    assert (job.status, job.dedup_key) == ('pending', cover_job_key(song.id))
+    assert b'data-cover-pending="true"' in client.get(f'/song/{song.id}').data
+
+    for stub in providers.values():
+        stub.delay = 0
+    # 元数据、波形、封面任务完成后接着生成缩略图
+    assert run_pending() == 4
+    db.session.expire_all()
+    assert song.cover_image.startswith('uploads/covers/')
+    assert os.path.exists(os.path.join(app.root_path, 'static', song.cover_image))
+    assert [job.status for job in Job.query.order_by(Job.id)] == ['done'] * 4
+    with app.test_request_context():
+        assert '-200.webp 200w' in image_variants(song.cover_image)['webp']
+    assert client.get(f'/api/song/{song.id}').get_json()['cover_image'].endswith(song.cover_image)
+    assert b'data-cover-pending' not in client.get(f'/song/{song.id}').data
+
+
+def test_cover_job_is_idempotent(app, providers, static_root):
+    song = add_song()
+    enqueue('fetch_cover', {'song_id': song.id}, dedup_key=cover_job_key(song.id))
+    # 已在排队的任务不会重复加入
+    enqueue('fetch_cover', {'song_id': song.id}, dedup_key=cover_job_key(song.id))
+    db.session.commit()
+    assert Job.query.count() == 1
+
+    run_pending()
+    db.session.expire_all()
+    cover = song.cover_image
+    requests = sum(stub.requests for stub in providers.values())
+
+    # 再次执行：已有封面，不访问外部接口也不改写
+    enqueue('fetch_cover', {'song_id': song.id}, dedup_key=cover_job_key(song.id))
+    db.session.commit()
+    assert run_pending() == 1
+    db.session.expire_all()
+    assert song.cover_image == cover
+    assert sum(stub.requests for stub in providers.values()) == requests
+    assert Job.query.filter_by(kind='fetch_cover').one().status == 'done'
+
+
+def test_manual_cover_is_not_overwritten(app, providers):
+    song = add_song()
+    enqueue('fetch_cover', {'song_id': song.id}, dedup_key=cover_job_key(song.id))
+    song.cover_image = 'uploads/covers/manual.jpg'
+    db.session.commit()
+
+    run_pending()
+    db.session.expire_all()
+    assert song.cover_image == 'uploads/covers/manual.jpg'
+    assert providers['netease'].requests == 0
+
+
+def test_failed_search_retries_with_backoff_then_gives_up(app, providers, caplog):
+    for stub in providers.values():
+        stub.status = 500
+    song = add_song()
+    enqueue('fetch_cover', {'song_id': song.id}, dedup_key=cover_job_key(song.id), max_attempts=2)
+    db.session.commit()
+
+    assert run_pending() == 1
+    job = Job.query.one()
+    assert (job.status, job.attempts) == ('pending', 1)
+    assert f'Job {job.id} (fetch_cover) attempt 1 failed' in caplog.text
+    assert 'CoverSearchIncomplete' in job.last_error
+    assert job.run_at > datetime.utcnow() + timedelta(seconds=20)
+    # 未到重试时间，不会被领取
+    assert run_pending() == 0
+
+    job.run_at = datetime.utcnow()
+    db.session.commit()
+    assert run_pending() == 1
+    job = Job.query.one()
+    assert (job.status, job.attempts) == ('failed', 2)
+    assert song.cover_image is None
+
+
+def test_claim_is_exclusive_and_stale_jobs_are_reclaimed(app):
+    enqueue('fetch_cover', {'song_id': 1})
+    db.session.commit()
+
+    job = claim('worker-a')
+    assert job.locked_by == 'worker-a'
+    assert claim('worker-b') is None
+
+    # worker-a 退出后锁超时，任务可被重新领取
+    job.locked_at = datetime.utcnow() - timedelta(seconds=app.config['JOB_LOCK_TIMEOUT'] + 1)
+    db.session.commit()
+    job = claim('worker-b')
+    assert (job.locked_by, job.attempts) == ('worker-b', 2)
+
+
+def test_concurrent_enqueue_of_same_key_does_not_fail_commit(app):
+    # 本次 INSERT 执行前，另一个请求抢先提交了相同 dedup_key 的任务
+    state = {'raced': False}
+
+    def other_request_commits_first(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith('INSERT INTO job') and not state['raced']:
+            state['raced'] = True
+            with db.engine.begin() as other:
+                other.execute(Job.__table__.insert().values(
+                    kind='waveform', dedup_key='waveform:uploads/audio/a.mp3', payload='{}', status='pending',
+                    attempts=0, max_attempts=5, run_at=datetime.utcnow()))
+
+    event.listen(db.engine, 'before_cursor_execute', other_request_commits_first)
+    try:
+        user = make_user('alice')
+        job = enqueue('waveform', {'path': 'uploads/audio/a.mp3'}, dedup_key='waveform:uploads/audio/a.mp3')
+        db.session.add(Song(title='Song', artist='Artist', file_path='uploads/audio/a.mp3', user_id=user.id))
+        db.session.commit()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', other_request_commits_first)
+
+    assert state['raced']
+    assert job.status == 'pending'
+    assert Song.query.count() == 1
+    assert Job.query.filter_by(dedup_key='waveform:uploads/audio/a.mp3').count() == 1
+
+
+def test_worker_state_is_kept_per_app(app, tmp_path):
+    from app import create_app
+    from conftest import TestConfig
+
+    class OtherConfig(TestConfig):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + str(tmp_path / 'other.db')
+        JOB_INPROCESS_WORKERS = 1
+
+    other = create_app(OtherConfig)
+    assert app.extensions['job_queue'] is not other.extensions['job_queue']
+    assert app.extensions['job_queue'].app is app
+    # 另一个应用的进程内 worker 不会处理本应用的任务
+    with other.test_request_context():
+        other.preprocess_request()
+    assert app.extensions['job_queue']._worker is None
+    assert other.extensions['job_queue']._worker.app is other
+    other.extensions['job_queue']._worker.stop(timeout=5)
+
+
+def test_enqueue_missing_covers_command(app):
+    missing = [add_song(title=f'Song {i}') for i in range(3)]
+    add_song(title='Covered', cover_image='uploads/covers/x.jpg')
+    done = Job(kind='fetch_cover', dedup_key=cover_job_key(missing[0].id), status='done',
+               payload='{}', max_attempts=5)
+    db.session.add(done)
+    db.session.commit()
+
+    result = app.test_cli_runner().invoke(args=['jobs', 'enqueue-missing-covers', '--batch-size', '2'])
+    assert result.exit_code == 0, result.output
+    jobs = Job.query.order_by(Job.id).all()
+    assert sorted(job.dedup_key for job in jobs) == sorted(cover_job_key(song.id) for song in missing)
+    assert all(job.status == 'pending' for job in jobs)
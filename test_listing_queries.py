@@ -0,0 +1,66 @@
+"""
+列表页查询数量：上传者预加载、评论数读冗余字段，每页的 SQL 条数不随歌曲数量增加
+"""
+
+from sqlalchemy import event
+
+from app import db
+from app.models import Song, Comment, Favorite
+from conftest import make_user, login
+
+PAGES = ['/library', '/my_music', '/favorites', '/search?q=song']
+
+
+def add_songs(owner, fan, count):
+    # 每首歌由不同的用户上传，逐条懒加载上传者时查询数会随之增加
+    for _ in range(count):
+        n = Song.query.count()
+        uploader = make_user(f'uploader{n}')
+        for user in (owner, uploader):
+            song = Song(title=f'Song {n}', artist='Artist', file_path='uploads/audio/x.mp3',
+                        user_id=user.id, visibility='public')
+            db.session.add(song)
+            db.session.flush()
+            db.session.add(Comment(content='nice', user_id=fan.id, song_id=song.id))
+            db.session.add(Favorite(user_id=fan.id, song_id=song.id))
+            song.comments_count = 1
+            song.likes_count = 1
+    db.session.commit()
+
+
+def count_statements(client, url):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        response = client.get(url)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    assert response.status_code == 200, url
+    return len(statements)
+
+
+def test_listing_pages_issue_constant_queries(app, client):
+    owner = make_user('owner')
+    fan = make_user('fan')
+    add_songs(owner, fan, 1)
+
+    counts = {}
+    for username in ('owner', 'fan'):
+        login(client, username)
+        for url in PAGES:
+            # 先访问一次，缓存的总数在两次计数时状态相同
+            client.get(url)
+            counts[username, url] = count_statements(client, url)
+        client.get('/auth/logout')
+
+    # 每页最多 12 或 20 首，增加的歌曲仍在第一页内
+    add_songs(owner, fan, 5)
+    for username in ('owner', 'fan'):
+        login(client, username)
+        for url in PAGES:
+            assert count_statements(client, url) == counts[username, url], (username, url)
+        client.get('/auth/logout')
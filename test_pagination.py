@@ -0,0 +1,152 @@
+"""
+游标分页：逐页前进、后退不重不漏，非法游标回到第一页
+"""
+
+from datetime import datetime, timedelta
+
+from app import db
+from app.models import Song
+from conftest import make_user
+
+
+def seed(count=45):
+    owner = make_user('owner')
+    base = datetime(2025, 1, 1)
+    for i in range(count):
+        # 每三首共享同一上传时间，验证 id 作为第二排序键
+        db.session.add(Song(title=f'Track {i}', artist='Artist', file_path='uploads/audio/x.mp3',
+                            user_id=owner.id, visibility='public',
+                            upload_date=base + timedelta(minutes=i // 3)))
+    db.session.commit()
+    return [song.id for song in Song.query.order_by(Song.upload_date.desc(), Song.id.desc())]
+
+
+def walk(client, url, params=None):
+    pages = []
+    cursor = None
+    while True:
+        query_string = dict(params or {}, **({'cursor': cursor} if cursor else {}))
+        data = client.get(url, query_string=query_string).get_json()
+        pages.append(data)
+        cursor = data['next_cursor']
+        if not cursor:
+            return pages
+
+
+def test_library_cursor_walks_forward_and_back(app, client):
+    expected = seed()
+
+    pages = walk(client, '/api/library')
+    assert [len(p['songs']) for p in pages] == [20, 20, 5]
+    assert [s['id'] for p in pages for s in p['songs']] == expected
+    assert pages[0]['prev_cursor'] is None
+
+    # 从最后一页沿 prev_cursor 退回，页面内容应与前进时一致
+    data = pages[-1]
+    for page in reversed(pages[:-1]):
+        data = client.get('/api/library', query_string={'cursor': data['prev_cursor']}).get_json()
+        assert [s['id'] for s in data['songs']] == [s['id'] for s in page['songs']]
+    assert data['prev_cursor'] is None
+
+
+def test_invalid_cursor_falls_back_to_first_page(app, client):
+    expected = seed(5)
+    data = client.get('/api/library', query_string={'cursor': 'not-a-cursor'}).get_json()
+    assert [s['id'] for s in data['songs']] == expected
+
+
+def test_search_cursor_reports_cached_total(app, client):
+    seed()
+    pages = walk(client, '/api/search', {'q': 'track'})
+    ids = [s['id'] for p in pages for s in p['songs']]
+    assert len(ids) == len(set(ids)) == 45
+    assert all(p['total'] == 45 for p in pages)
+
+    response = client.get('/library')
+    assert response.status_code == 200
+    assert b'cursor=' in response.data
+
+
+def test_song_comments_first_page_and_cursor(app, client):
+    from conftest import login
+    from app.models import Comment
+
+    seed(1)
+    fan = make_user('fan')
+    song_id = Song.query.first().id
+    base = datetime(2025, 1, 1)
+    for i in range(25):
+        db.session.add(Comment(content=f'comment {i}', user_id=fan.id, song_id=song_id,
+                               created_at=base + timedelta(minutes=i)))
+    db.session.get(Song, song_id).comments_count = 25
+    db.session.commit()
+
+    html = client.get(f'/song/{song_id}').get_data(as_text=True)
+    assert html.count('class="comment mb-3"') == 20
+    assert 'comment 24' in html and 'comment 4<' not in html
+
+    url = f'/song/{song_id}/comments'
+    cursor = client.get(url).get_json()['next_cursor']
+    older = client.get(url, query_string={'cursor': cursor}).get_json()
+    assert [c['content'] for c in older['comments']] == [f'comment {i}' for i in range(4, -1, -1)]
+    assert older['next_cursor'] is None
+
+    login(client, 'fan')
+    response = client.post(f'/song/{song_id}/comment', data={'content': 'newest'},
+                           headers={'X-Requested-With': 'XMLHttpRequest'})
+    data = response.get_json()
+    assert data['comment']['author'] == 'fan'
+    assert data['comments_count'] == 26
+
+    # 私有歌曲的评论只有上传者能读取
+    db.session.get(Song, song_id).visibility = 'private'
+    db.session.commit()
+    assert client.get(url).status_code == 404
+    client.get('/auth/logout')
+    login(client, 'owner')
+    assert client.get(url).get_json()['success'] is True
+
+
+def test_library_and_my_music_show_cached_totals(app, client):
+    from conftest import login
+
+    seed(3)
+    private = Song(title='Private', artist='Artist', file_path='uploads/audio/x.mp3',
+                   user_id=Song.query.first().user_id, visibility='private')
+    db.session.add(private)
+    db.session.commit()
+    login(client, 'owner')
+    assert client.get('/api/library').get_json()['total'] == 3
+    assert client.get('/api/my_music').get_json()['total'] == 4
+    assert '3 songs' in client.get('/library').get_data(as_text=True)
+
+    # 缓存期内直接插入的歌曲不计入，经由页面操作的变化立即生效
+    client.post(f'/song/{private.id}/visibility', data={'visibility': 'public'})
+    assert client.get('/api/library').get_json()['total'] == 4
+    client.post(f'/delete_song/{private.id}')
+    assert client.get('/api/library').get_json()['total'] == 3
+    assert client.get('/api/my_music').get_json()['total'] == 3
+
+
+def test_count_invalidation_reaches_other_workers(app, tmp_path):
+    from app.cache import SQLiteCache
+    from app.pagination import cached_count, forget_count
+
+    # 两个 worker 各自连接同一个共享缓存文件
+    app.config['CACHE_SQLITE_PATH'] = str(tmp_path / 'cache.db')
+    workers = [SQLiteCache(app), SQLiteCache(app)]
+    seed(2)
+    query = Song.query.filter_by(visibility='public')
+
+    app.extensions['cache'] = workers[0]
+    assert cached_count(('library',), query) == 2
+    db.session.add(Song(title='New', artist='Artist', file_path='uploads/audio/x.mp3',
+                        user_id=Song.query.first().user_id, visibility='public'))
+    db.session.commit()
+
+    app.extensions['cache'] = workers[1]
+    assert cached_count(('library',), query) == 2
+    forget_count(('library',))
+
+    app.extensions['cache'] = workers[0]
+    assert cached_count(('library',), query) == 3
@@ -0,0 +1,67 @@
+"""
+播放次数缓冲：浏览详情页只进入缓冲，flush 时合并写库
+"""
+
+from app import db
+from app.models import Song
+from app.play_counts import play_counter, SpoolPlayCountBuffer
+from conftest import make_user
+
+
+def add_song(owner):
+    song = Song(title='Song', artist='Artist', file_path='uploads/audio/x.mp3',
+                user_id=owner.id, visibility='public', play_count=3)
+    db.session.add(song)
+    db.session.commit()
+    return song.id
+
+
+def test_song_detail_buffers_play_counts(app, client):
+    song_id = add_song(make_user('owner'))
+
+    for _ in range(5):
+        assert client.get(f'/song/{song_id}').status_code == 200
+
+    db.session.expire_all()
+    assert db.session.get(Song, song_id).play_count == 3
+
+    assert play_counter.flush() == 1
+    db.session.expire_all()
+    assert db.session.get(Song, song_id).play_count == 8
+    assert play_counter.flush() == 0
+
+
+def test_sqlite_spool_is_shared_between_buffers(app, tmp_path):
+    song_id = add_song(make_user('owner'))
+    app.config['PLAY_COUNT_SPOOL_PATH'] = str(tmp_path / 'spool.db')
+
+    # 两个缓冲实例模拟两个 worker 进程共享同一张旁路表
+    worker_a = SpoolPlayCountBuffer(app)
+    worker_b = SpoolPlayCountBuffer(app)
+    worker_a._add({song_id: 2})
+    worker_b._add({song_id: 5})
+
+    assert worker_a.flush() == 1
+    assert worker_b.flush() == 0
+    db.session.expire_all()
+    assert db.session.get(Song, song_id).play_count == 10
+
+
+def test_flush_command_requires_shared_spool(app, tmp_path):
+    song_id = add_song(make_user('owner'))
+    runner = app.test_cli_runner()
+
+    # memory 模式下命令进程取不到 worker 内存中的增量，明确报错
+    result = runner.invoke(args=['play-counts', 'flush'])
+    assert result.exit_code == 1
+    assert 'sqlite' in result.output
+
+    app.config['PLAY_COUNT_SPOOL_PATH'] = str(tmp_path / 'spool.db')
+    app.config['PLAY_COUNT_MODE'] = 'sqlite'
+    SpoolPlayCountBuffer(app)._add({song_id: 4})
+    app.extensions['play_counter'] = SpoolPlayCountBuffer(app)
+    result = runner.invoke(args=['play-counts', 'flush'])
+    assert result.exit_code == 0, result.output
+    assert '已写入 1 首歌曲' in result.output
+    db.session.expire_all()
+    assert db.session.get(Song, song_id).play_count == 7
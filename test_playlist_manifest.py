@@ -0,0 +1,77 @@
+"""
+播放列表播放清单：按顺序返回可播放曲目的音频地址和时长，带 ETag，按可见性过滤
+"""
+
+from app import db
+from app.models import Song, Playlist, PlaylistItem
+from conftest import make_user, login
+
+
+def seed():
+    alice = make_user('alice')
+    bob = make_user('bob')
+    songs = [
+        Song(title='First', artist='A', file_path='uploads/audio/1.mp3', user_id=alice.id, duration=200),
+        Song(title='Bob private', artist='B', file_path='uploads/audio/2.mp3', user_id=bob.id,
+             visibility='private', duration=100),
+        Song(title='Unknown length', artist='A', file_path='uploads/audio/3.mp3', user_id=alice.id),
+        Song(title='Second', artist='A', file_path='uploads/audio/4.mp3', user_id=alice.id, duration=61),
+    ]
+    db.session.add_all(songs)
+    playlist = Playlist(name='Mix', user_id=alice.id)
+    db.session.add(playlist)
+    db.session.flush()
+    # 按 order 而不是插入顺序排列
+    for order, song in zip([2, 3, 4, 1], songs):
+        db.session.add(PlaylistItem(playlist_id=playlist.id, song_id=song.id, order=order))
+    db.session.commit()
+    return playlist, songs
+
+
+def test_manifest_lists_playable_tracks_in_order(app, client):
+    playlist, songs = seed()
+    url = f'/api/playlist/{playlist.id}/manifest'
+
+    manifest = client.get(url).get_json()
+    assert [track['title'] for track in manifest['tracks']] == ['Second', 'First', 'Unknown length']
+    assert manifest['tracks'][0]['file_path'] == f'/song/{songs[3].id}/audio?v=4'
+    assert [track['duration'] for track in manifest['tracks']] == [61, 200, None]
+    assert manifest['total_duration'] == 261
+
+    # 自己的私有歌曲对自己可见
+    login(client, 'bob')
+    titles = [track['title'] for track in client.get(url).get_json()['tracks']]
+    assert titles == ['Second', 'First', 'Bob private', 'Unknown length']
+
+
+def test_manifest_etag_and_private_playlists(app, client):
+    playlist, songs = seed()
+    url = f'/api/playlist/{playlist.id}/manifest'
+    res = client.get(url)
+    etag = res.headers['ETag']
+    assert res.cache_control.no_cache
+    assert client.get(url, headers={'If-None-Match': etag}).status_code == 304
+
+    song = Song(title='Added', artist='A', file_path='uploads/audio/5.mp3', user_id=songs[0].user_id)
+    db.session.add(song)
+    db.session.flush()
+    db.session.add(PlaylistItem(playlist_id=playlist.id, song_id=song.id, order=5))
+    db.session.commit()
+    assert client.get(url, headers={'If-None-Match': etag}).status_code == 200
+
+    playlist.visibility = 'private'
+    db.session.commit()
+    assert client.get(url).status_code == 404
+    login(client, 'bob')
+    assert client.get(url).status_code == 404
+    client.get('/auth/logout')
+    login(client, 'alice')
+    assert client.get(url).status_code == 200
+
+
+def test_playlist_page_links_manifest(app, client):
+    playlist, _ = seed()
+    login(client, 'alice')
+    html = client.get(f'/playlist/{playlist.id}').get_data(as_text=True)
+    assert f'data-manifest-url="/api/playlist/{playlist.id}/manifest"' in html
+    assert 'play-all-btn' in html
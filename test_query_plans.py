@@ -0,0 +1,90 @@
+"""
+热点页面查询计划检查：任何一条查询退化为全表扫描即失败
+"""
+
+import re
+
+from sqlalchemy import event
+
+from app import db
+from app.models import Song, Comment, Favorite, Playlist, PlaylistItem
+from conftest import make_user, login
+
+# "SCAN song" 是全表扫描；"SCAN song USING INDEX ..." 和虚拟表扫描不算；
+# sqlite_master 是只有几十行的系统表，检查 FTS 表是否存在时扫描它不算退化
+FULL_SCAN = re.compile(r'\bSCAN (?!sqlite_master\b)(\w+)(?! USING)(?! VIRTUAL TABLE)\s*$')
+
+
+def seed():
+    owner = make_user('owner')
+    fan = make_user('fan')
+    for i in range(30):
+        db.session.add(Song(title=f'Song {i}', artist='Artist', file_path='uploads/audio/x.mp3',
+                            user_id=owner.id, visibility='public' if i % 3 else 'private',
+                            play_count=i))
+    db.session.commit()
+    for song_id in range(1, 11):
+        db.session.add(Comment(content='nice', user_id=fan.id, song_id=song_id))
+        db.session.add(Favorite(user_id=fan.id, song_id=song_id))
+    playlist = Playlist(name='Mix', user_id=fan.id)
+    db.session.add(playlist)
+    db.session.commit()
+    for order, song_id in enumerate(range(1, 6), start=1):
+        db.session.add(PlaylistItem(playlist_id=playlist.id, song_id=song_id, order=order))
+    db.session.commit()
+    return playlist
+
+
+def capture_queries(client, requests):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        for method, url in requests:
+            response = getattr(client, method)(url)
+            assert response.status_code < 400, url
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    return statements
+
+
+def full_scans(statement, parameters):
+    connection = db.engine.raw_connection()
+    try:
+        plan = connection.cursor().execute('EXPLAIN QUERY PLAN ' + statement, parameters).fetchall()
+    finally:
+        connection.close()
+    return [row[-1] for row in plan if FULL_SCAN.search(row[-1])]
+
+
+def test_hot_queries_use_indexes(app, client):
+    playlist = seed()
+    login(client, 'fan')
+
+    next_cursor = client.get('/api/library').get_json()['next_cursor']
+    statements = capture_queries(client, [
+        ('get', '/'),
+        ('get', '/library'),
+        ('get', f'/library?cursor={next_cursor}'),
+        ('get', '/favorites'),
+        ('get', '/song/2'),
+        ('post', '/song/2/favorite'),
+        ('get', f'/playlist/{playlist.id}'),
+        ('get', '/search?q=song'),
+        ('get', '/api/songs?ids=1,2,3'),
+        ('get', f'/api/playlist/{playlist.id}/manifest'),
+    ])
+    login(client, 'owner')
+    statements += capture_queries(client, [('get', '/my_music')])
+
+    assert statements
+    offenders = {}
+    for statement, parameters in statements:
+        scans = full_scans(statement, parameters)
+        if scans:
+            offenders[statement] = scans
+    assert not offenders, offenders
@@ -0,0 +1,101 @@
+"""
+相似歌曲推荐：向量化计算与逐对暴力计算一致，增量刷新与全量重建结果一致
+"""
+
+import math
+import random
+from itertools import combinations
+
+from app import db
+from app.models import Song, Favorite, SongNeighbor
+from app.recommendations import refresh_neighbors
+from conftest import make_user, login
+
+
+def seed(users=12, songs=15, seed=7):
+    rng = random.Random(seed)
+    owner = make_user('owner')
+    song_ids = []
+    for i in range(songs):
+        song = Song(title=f'Song {i}', artist='Artist', file_path='uploads/audio/x.mp3',
+                    user_id=owner.id, visibility='public')
+        db.session.add(song)
+        db.session.flush()
+        song_ids.append(song.id)
+    fans = [make_user(f'fan{i}') for i in range(users)]
+    for fan in fans:
+        for song_id in rng.sample(song_ids, rng.randint(1, 6)):
+            db.session.add(Favorite(user_id=fan.id, song_id=song_id))
+    db.session.commit()
+    return fans, song_ids
+
+
+def neighbor_table():
+    return {(n.song_id, n.neighbor_id): n.score for n in SongNeighbor.query.all()}
+
+
+def brute_force(limit):
+    fans = {}
+    for favorite in Favorite.query.all():
+        fans.setdefault(favorite.song_id, set()).add(favorite.user_id)
+    scores = {}
+    for a, b in combinations(fans, 2):
+        common = len(fans[a] & fans[b])
+        if common:
+            score = common / math.sqrt(len(fans[a]) * len(fans[b]))
+            scores.setdefault(a, []).append((score, b))
+            scores.setdefault(b, []).append((score, a))
+    return {song_id: sorted(s for s, _ in pairs)[-limit:] for song_id, pairs in scores.items()}
+
+
+def test_neighbors_match_brute_force(app):
+    seed()
+    stats = refresh_neighbors(full=True, limit=4)
+    assert stats['full'] and stats['favorites'] == Favorite.query.count()
+
+    table = neighbor_table()
+    for song_id, expected in brute_force(4).items():
+        got = sorted(score for (a, _), score in table.items() if a == song_id)
+        assert len(got) == len(expected)
+        assert all(math.isclose(g, e, rel_tol=1e-5) for g, e in zip(got, expected))
+
+
+def test_incremental_refresh_matches_full_rebuild(app):
+    fans, song_ids = seed()
+    refresh_neighbors(full=True)
+
+    # 新增收藏、取消收藏（包括让一首歌失去全部收藏）
+    db.session.add(Favorite(user_id=fans[0].id, song_id=song_ids[-1]))
+    db.session.add(Favorite(user_id=fans[1].id, song_id=song_ids[-1]))
+    for favorite in Favorite.query.filter_by(song_id=song_ids[0]).all():
+        db.session.delete(favorite)
+    db.session.commit()
+
+    stats = refresh_neighbors()
+    assert not stats['full'] and stats['songs'] < len(song_ids)
+    incremental = neighbor_table()
+
+    refresh_neighbors(full=True)
+    full = neighbor_table()
+    assert incremental.keys() == full.keys()
+    assert all(math.isclose(incremental[k], full[k], rel_tol=1e-5) for k in full)
+    assert not any(song_ids[0] in pair for pair in full)
+
+
+def test_recommendations_use_neighbors(app, client):
+    owner = make_user('owner')
+    songs = [Song(title=title, artist='Artist', file_path='uploads/audio/x.mp3',
+                  user_id=owner.id, visibility='public', play_count=plays)
+             for title, plays in [('Seed', 0), ('Neighbor', 0), ('Popular', 1000)]]
+    db.session.add_all(songs)
+    db.session.commit()
+    alice, bob = make_user('alice'), make_user('bob')
+    db.session.add_all([Favorite(user_id=alice.id, song_id=songs[0].id),
+                        Favorite(user_id=alice.id, song_id=songs[1].id),
+                        Favorite(user_id=bob.id, song_id=songs[0].id)])
+    db.session.commit()
+    refresh_neighbors()
+
+    login(client, 'bob')
+    body = client.get('/recommendations').get_data(as_text=True)
+    assert 'Neighbor' in body and 'Popular' not in body
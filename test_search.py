@@ -0,0 +1,119 @@
+"""
+全文搜索：FTS5 索引随歌曲增删改同步，中文按单字短语匹配，拉丁词前缀匹配，没有索引时退化为 ILIKE
+"""
+
+import pytest
+from sqlalchemy import event, text
+from sqlalchemy.exc import OperationalError
+
+from app import db, search
+from app.models import Song
+from app.search import search_songs, rebuild_index, fts_enabled
+from conftest import make_user
+
+
+def add_song(user, title, artist='Artist', visibility='public'):
+    song = Song(title=title, artist=artist, album='', genre='', file_path='uploads/audio/x.mp3',
+                user_id=user.id, visibility=visibility)
+    db.session.add(song)
+    db.session.commit()
+    return song
+
+
+def titles(query):
+    return sorted(song.title for song in search_songs(query))
+
+
+def indexed_ids():
+    return {row[0] for row in db.session.execute(text('SELECT rowid FROM song_fts'))}
+
+
+def test_index_follows_song_changes(app):
+    user = make_user('alice')
+    song = add_song(user, 'Bohemian Rhapsody')
+    hidden = add_song(user, 'Bohemian Private', visibility='private')
+    assert indexed_ids() == {song.id}
+    assert titles('bohemian') == ['Bohemian Rhapsody']
+
+    song.title = 'Killer Queen'
+    db.session.commit()
+    assert titles('bohemian') == []
+    assert titles('queen') == ['Killer Queen']
+
+    # 改为私有时移出索引，改回公开时重新加入
+    song.visibility = 'private'
+    hidden.visibility = 'public'
+    db.session.commit()
+    assert indexed_ids() == {hidden.id}
+    assert titles('queen') == [] and titles('private') == ['Bohemian Private']
+
+    db.session.delete(hidden)
+    db.session.commit()
+    assert indexed_ids() == set()
+    assert titles('bohemian') == []
+
+
+def test_cjk_and_prefix_matching(app):
+    user = make_user('alice')
+    add_song(user, '晴天', artist='周杰伦')
+    add_song(user, '天晴了')
+    add_song(user, 'Bohemian Rhapsody', artist='Queen')
+
+    # 单字匹配，多字按顺序连续匹配
+    assert titles('晴') == ['天晴了', '晴天']
+    assert titles('晴天') == ['晴天']
+    assert titles('杰') == ['晴天']
+    # 拉丁词前缀匹配，不区分大小写，多个词同时满足
+    assert titles('bohem') == ['Bohemian Rhapsody']
+    assert titles('Que Rhap') == ['Bohemian Rhapsody']
+    assert titles('hemian') == []
+    assert titles('!!!') == []
+
+
+def test_ilike_fallback_without_index(app):
+    user = make_user('alice')
+    add_song(user, 'Bohemian Rhapsody')
+    add_song(user, 'Hidden', visibility='private')
+    db.session.execute(text('DROP TABLE song_fts'))
+    db.session.commit()
+
+    # 模拟其他进程删除索引：缓存的检查结果仍认为存在，首次查询失败后清除缓存
+    assert fts_enabled(db.session.connection())
+    with pytest.raises(OperationalError):
+        titles('bohemian')
+    db.session.rollback()
+    assert not fts_enabled(db.session.connection())
+    assert titles('hemian') == ['Bohemian Rhapsody']
+    assert titles('hidden') == []
+    add_song(user, 'Another Rhapsody')
+    assert titles('rhapsody') == ['Another Rhapsody', 'Bohemian Rhapsody']
+
+    # 重建后重新使用索引
+    assert rebuild_index() == 2
+    assert fts_enabled(db.session.connection())
+    assert titles('hemian') == []
+    assert titles('rhap') == ['Another Rhapsody', 'Bohemian Rhapsody']
+
+
+def test_counter_updates_skip_index_checks(app):
+    song = add_song(make_user('alice'), 'Bohemian Rhapsody')
+    search._set_fts_state(db.engine, None)
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        song.play_count = 5
+        db.session.commit()
+        assert not any('sqlite_master' in statement for statement in statements)
+        # 索引列变化时检查一次，结果按 engine 缓存
+        song.title = 'Killer Queen'
+        db.session.commit()
+        song.title = 'Somebody to Love'
+        db.session.commit()
+        assert sum('sqlite_master' in statement for statement in statements) == 1
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    assert titles('somebody') == ['Somebody to Love']
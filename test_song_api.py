@@ -0,0 +1,75 @@
+"""
+批量歌曲信息接口：一次查询返回多首歌曲，支持 ETag；页面内嵌已渲染歌曲的播放信息
+"""
+
+import json
+import re
+
+from sqlalchemy import event
+
+from app import db
+from app.models import Song
+from conftest import make_user, login
+
+
+def add_songs(user, visibilities):
+    songs = [Song(title=f'Song {i}', artist='Artist', file_path=f'uploads/audio/{i}.mp3',
+                  user_id=user.id, visibility=visibility)
+             for i, visibility in enumerate(visibilities)]
+    db.session.add_all(songs)
+    db.session.commit()
+    return [song.id for song in songs]
+
+
+def test_batch_returns_visible_songs_in_order(app, client):
+    alice = make_user('alice')
+    make_user('bob')
+    public_a, private, public_b = add_songs(alice, ['public', 'private', 'public'])
+    url = f'/api/songs?ids={public_b},{private},999,{public_a},{public_b}'
+
+    statements = []
+    record = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        songs = client.get(url).get_json()['songs']
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    assert [song['id'] for song in songs] == [public_b, public_a]
+    # 地址带音频的内容版本，可以长期缓存
+    assert songs[0]['file_path'].startswith(f'/song/{public_b}/audio?v=')
+    assert songs[0]['waveform'].startswith(f'/song/{public_b}/waveform?v=')
+    assert len([s for s in statements if 'FROM song' in s]) == 1
+
+    login(client, 'bob')
+    assert [song['id'] for song in client.get(url).get_json()['songs']] == [public_b, public_a]
+    client.get('/auth/logout')
+    login(client, 'alice')
+    assert [song['id'] for song in client.get(url).get_json()['songs']] == [public_b, private, public_a]
+
+    assert client.get('/api/songs?ids=1,abc').status_code == 400
+    assert client.get('/api/songs').get_json()['songs'] == []
+
+
+def test_batch_etag(app, client):
+    song_id, = add_songs(make_user('alice'), ['public'])
+    res = client.get(f'/api/songs?ids={song_id}')
+    etag = res.headers['ETag']
+    assert res.cache_control.private and res.cache_control.no_cache
+
+    assert client.get(f'/api/songs?ids={song_id}', headers={'If-None-Match': etag}).status_code == 304
+    db.session.get(Song, song_id).title = 'Renamed'
+    db.session.commit()
+    res = client.get(f'/api/songs?ids={song_id}', headers={'If-None-Match': etag})
+    assert res.status_code == 200 and res.get_json()['songs'][0]['title'] == 'Renamed'
+
+
+def test_pages_embed_player_metadata(app, client):
+    ids = add_songs(make_user('alice'), ['public', 'public'])
+    html = client.get('/library').get_data(as_text=True)
+    blocks = re.findall(r'<script type="application/json" class="player-songs">(.*?)</script>', html)
+    embedded = [song for block in blocks for song in json.loads(block)]
+    assert sorted(song['id'] for song in embedded) == sorted(ids)
+    assert '/audio?v=' in embedded[0]['file_path']
+
+    html = client.get(f'/song/{ids[0]}').get_data(as_text=True)
+    assert 'class="player-songs"' in html
@@ -0,0 +1,114 @@
+"""
+静态资源：启动时按内容哈希改名并预压缩，模板中的 url_for 指向带哈希的地址，响应可永久缓存
+"""
+
+import gzip
+import hashlib
+import json
+import os
+
+import brotli
+
+from app.static_assets import fingerprint_name, build_asset, static_assets
+
+
+def player_js(app):
+    with open(os.path.join(app.static_folder, 'js', 'player.js'), 'rb') as f:
+        return f.read()
+
+
+def test_templates_use_fingerprinted_urls(app, client):
+    data = player_js(app)
+    name = fingerprint_name('js/player.js', hashlib.sha256(data).hexdigest()[:12])
+    html = client.get('/').get_data(as_text=True)
+    assert f'src="/assets/{name}"' in html
+    assert '/static/js/player.js' not in html
+
+    manifest = json.loads(open(os.path.join(app.config['ASSET_BUILD_DIR'], 'manifest.json')).read())
+    assert manifest['js/player.js']['name'] == name
+    assert 'gzip' in manifest['js/player.js']['encodings']
+    # 上传目录不参与构建，仍走 static
+    assert not any(path.startswith('uploads/') for path in manifest)
+    with app.test_request_context():
+        url_for = app.jinja_env.globals['url_for']
+        assert url_for('static', filename='uploads/covers/a.png') == '/static/uploads/covers/a.png'
+        assert url_for('main.index') == '/'
+
+
+def test_serves_precompressed_and_immutable(app, client):
+    data = player_js(app)
+    name = fingerprint_name('js/player.js', hashlib.sha256(data).hexdigest()[:12])
+
+    res = client.get(f'/assets/{name}', headers={'Accept-Encoding': 'gzip, deflate'})
+    assert res.status_code == 200
+    assert res.content_encoding == 'gzip' and gzip.decompress(res.data) == data
+    assert res.mimetype == 'text/javascript'
+    assert 'Accept-Encoding' in res.vary
+    assert res.cache_control.public and res.cache_control.immutable
+    assert res.cache_control.max_age == app.config['ASSET_CACHE_MAX_AGE']
+
+    res = client.get(f'/assets/{name}', headers={'Accept-Encoding': 'identity'})
+    assert res.content_encoding is None and res.data == data
+    etag = res.headers['ETag']
+    assert client.get(f'/assets/{name}', headers={'If-None-Match': etag}).status_code == 304
+
+    # 只提供清单中的文件
+    assert client.get('/assets/js/player.js').status_code == 404
+    assert client.get('/assets/manifest.json').status_code == 404
+
+
+def test_build_asset_reuses_outputs(tmp_path):
+    static_dir, build_dir = tmp_path / 'static', tmp_path / 'build'
+    (static_dir / 'css').mkdir(parents=True)
+    (static_dir / 'css' / 'site.css').write_text('body { color: red; }\n' * 50)
+    (static_dir / 'logo.png').write_bytes(b'\x89PNG' + os.urandom(100))
+
+    entry = build_asset(str(static_dir), str(build_dir), 'css/site.css')
+    assert entry['name'].startswith('css/site.') and entry['name'].endswith('.css')
+    assert 'gzip' in entry['encodings']
+    target = build_dir / entry['name']
+    assert gzip.decompress((build_dir / (entry['name'] + '.gz')).read_bytes()) == target.read_bytes()
+    assert build_asset(str(static_dir), str(build_dir), 'css/site.css') == entry
+
+    # 内容变化后改用新文件名
+    (static_dir / 'css' / 'site.css').write_text('body { color: blue; }\n')
+    assert build_asset(str(static_dir), str(build_dir), 'css/site.css')['name'] != entry['name']
+    # 图片不压缩
+    assert build_asset(str(static_dir), str(build_dir), 'logo.png')['encodings'] == []
+
+
+def test_build_command(app):
+    result = app.test_cli_runner().invoke(args=['assets', 'build'])
+    assert result.exit_code == 0, result.output
+    assert 'js/player.js -> js/player.' in result.output
+    assert '已构建' in result.output
+
+
+def test_prefers_brotli(app, client):
+    data = player_js(app)
+    name = fingerprint_name('js/player.js', hashlib.sha256(data).hexdigest()[:12])
+    assert os.path.exists(os.path.join(app.config['ASSET_BUILD_DIR'], name + '.br'))
+
+    res = client.get(f'/assets/{name}', headers={'Accept-Encoding': 'gzip, deflate, br'})
+    assert res.content_encoding == 'br' and brotli.decompress(res.data) == data
+    assert res.headers['ETag'] != client.get(f'/assets/{name}', headers={'Accept-Encoding': 'gzip'}).headers['ETag']
+    res = client.get(f'/assets/{name}', headers={'Accept-Encoding': 'gzip, br;q=0'})
+    assert res.content_encoding == 'gzip'
+
+
+def test_manifest_is_kept_per_app(app, tmp_path):
+    from app import create_app
+    from conftest import TestConfig
+
+    class OtherConfig(TestConfig):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + str(tmp_path / 'other.db')
+        ASSET_BUILD_DIR = str(tmp_path / 'other-assets')
+
+    other = create_app(OtherConfig)
+    # 后创建的应用不覆盖当前应用的清单和构建目录
+    assert app.extensions['static_assets'] is not other.extensions['static_assets']
+    assert app.extensions['static_assets'].app is app
+    assert static_assets.build()['js/player.js']
+    assert os.path.exists(os.path.join(app.config['ASSET_BUILD_DIR'], 'manifest.json'))
+    with other.app_context():
+        assert static_assets.assets.app is other
@@ -0,0 +1,130 @@
+"""
+上传文件清单：启动时遍历一次 static/uploads，上传和删除时同步更新，判断文件是否存在不访问文件系统
+"""
+
+import io
+import os
+
+from app import db
+from app.jobs import run_pending
+from app.models import Song
+from app.upload_manifest import upload_manifest
+from app.waveform import waveform_path
+from conftest import make_user, login
+from test_waveform import sine_wav
+
+
+def test_scan_and_lookups_without_stat(app, static_root, monkeypatch):
+    (static_root / 'uploads' / 'audio' / 'a.mp3').write_bytes(b'ID3')
+    (static_root / 'uploads' / 'audio' / '.upload-123').write_bytes(b'partial')
+    (static_root / 'uploads' / 'covers' / 'variants').mkdir()
+    (static_root / 'uploads' / 'covers' / 'variants' / 'c-200.webp').write_bytes(b'RIFF')
+
+    assert upload_manifest.files() == {'uploads/audio/a.mp3', 'uploads/covers/variants/c-200.webp'}
+
+    def no_stat(path):
+        raise AssertionError(f'unexpected stat of {path}')
+
+    monkeypatch.setattr(os.path, 'isfile', no_stat)
+    assert upload_manifest.exists('uploads/audio/a.mp3')
+    assert upload_manifest.exists('uploads/covers/variants/c-200.webp')
+    # 上传目录以外的路径直接返回 False
+    assert not upload_manifest.exists('../config.py')
+    assert not upload_manifest.exists('css/style.css')
+
+
+def test_new_files_are_picked_up_and_deletes_polled(app, static_root):
+    assert not upload_manifest.exists('uploads/audio/a.mp3')
+    # 其他进程写入的文件在查不到时确认一次后补记
+    (static_root / 'uploads' / 'audio' / 'a.mp3').write_bytes(b'ID3')
+    assert upload_manifest.exists('uploads/audio/a.mp3')
+    assert 'uploads/audio/a.mp3' in upload_manifest.files()
+
+    # 其他进程删除的文件由轮询按目录 mtime 发现
+    (static_root / 'uploads' / 'audio' / 'a.mp3').unlink()
+    (static_root / 'uploads' / 'covers' / 'new').mkdir()
+    (static_root / 'uploads' / 'covers' / 'new' / 'b.png').write_bytes(b'PNG')
+    assert upload_manifest.poll() == 3
+    assert upload_manifest.files() == {'uploads/covers/new/b.png'}
+    assert upload_manifest.poll() == 0
+
+
+def test_upload_and_delete_update_manifest(app, client, static_root):
+    make_user('alice')
+    login(client, 'alice')
+    client.post('/upload', data={
+        'title': 'Song', 'artist': 'Artist', 'visibility': 'public',
+        'audio_file': (io.BytesIO(sine_wav()), 'song.wav'),
+        'cover_image': (io.BytesIO(b'\x89PNG\r\n\x1a\n'), 'cover.png'),
+    }, content_type='multipart/form-data')
+    song = Song.query.one()
+    assert {song.file_path, song.cover_image} <= upload_manifest.files()
+
+    run_pending()
+    assert waveform_path(song.file_path) in upload_manifest.files()
+
+    client.post(f'/delete_song/{song.id}')
+    assert not upload_manifest.files() & {song.file_path, song.cover_image, waveform_path(song.file_path)}
+    assert client.get(f'/song/{song.id}/audio').status_code == 404
+
+
+
+def test_stale_entries_return_404(app, client, static_root):
+    user = make_user('alice')
+    song = Song(title='Song', artist='Artist', file_path='uploads/audio/a.wav', user_id=user.id, visibility='public')
+    db.session.add(song)
+    db.session.commit()
+    (static_root / 'uploads' / 'audio' / 'a.wav').write_bytes(sine_wav())
+    (static_root / 'uploads' / 'audio' / 'waveforms').mkdir()
+    peaks = static_root / waveform_path(song.file_path)
+    peaks.write_bytes(b'\x00\x01')
+    assert client.get(f'/song/{song.id}/waveform').status_code == 200
+
+    # 其他进程删除了文件，轮询尚未发现：返回 404 并更新清单
+    for path in (peaks, static_root / song.file_path):
+        path.unlink()
+    assert {song.file_path, waveform_path(song.file_path)} <= upload_manifest.files()
+    assert client.get(f'/song/{song.id}/waveform').status_code == 404
+    assert client.get(f'/song/{song.id}/audio').status_code == 404
+    assert not upload_manifest.files() & {song.file_path, waveform_path(song.file_path)}
+
+
+def test_missing_files_report(app, static_root):
+    user = make_user('alice')
+    (static_root / 'uploads' / 'audio' / 'a.mp3').write_bytes(b'ID3')
+    (static_root / 'uploads' / 'covers' / 'a.png').write_bytes(b'PNG')
+    db.session.add_all([
+        Song(title='Complete', artist='Artist', file_path='uploads/audio/a.mp3',
+             cover_image='uploads/covers/a.png', user_id=user.id),
+        Song(title='External cover', artist='Artist', file_path='uploads/audio/a.mp3',
+             cover_image='https://example.com/cover.jpg', user_id=user.id),
+        Song(title='No audio', artist='Artist', file_path='uploads/audio/gone.mp3', user_id=user.id),
+        Song(title='No cover', artist='Artist', file_path='uploads/audio/a.mp3',
+             cover_image='uploads/covers/gone.png', user_id=user.id),
+    ])
+    db.session.commit()
+
+    result = app.test_cli_runner().invoke(args=['uploads', 'missing'])
+    assert result.exit_code == 0, result.output
+    assert '#3 No audio: 缺少音频 uploads/audio/gone.mp3' in result.output
+    assert '#4 No cover: 缺少封面 uploads/covers/gone.png' in result.output
+    assert 'Complete' not in result.output and 'External' not in result.output
+    assert '已检查 4 首歌曲，2 首缺少文件' in result.output
+
+
+def test_manifest_is_kept_per_app(app, static_root, tmp_path):
+    from app import create_app
+    from conftest import TestConfig
+
+    (static_root / 'uploads' / 'audio' / 'a.mp3').write_bytes(b'ID3')
+    assert upload_manifest.files() == {'uploads/audio/a.mp3'}
+
+    class OtherConfig(TestConfig):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + str(tmp_path / 'other.db')
+        ASSET_BUILD_DIR = str(tmp_path / 'other-assets')
+
+    other = create_app(OtherConfig)
+    # 后创建的应用扫描自己的目录，不替换当前应用的清单
+    assert other.extensions['upload_manifest'] is not app.extensions['upload_manifest']
+    assert app.extensions['upload_manifest'].app is app
+    assert upload_manifest.files() == {'uploads/audio/a.mp3'}
@@ -0,0 +1,172 @@
+"""
+波形峰值：上传后在后台解码一次，降采样为 int8 最小/最大值对，通过可缓存的接口提供
+"""
+
+import io
+import os
+import wave
+
+import numpy as np
+
+from app import db
+from app.jobs import run_pending
+from app.models import Song
+from app.upload_manifest import upload_manifest
+from app.waveform import WAVEFORM_DECODERS, compute_peaks, build_waveform, waveform_path, decode_ffmpeg, UnsupportedAudio
+from conftest import make_user, login
+
+
+def sine_wav(seconds=2, rate=8000, channels=2, sampwidth=2, amplitude=0.5):
+    t = np.arange(seconds * rate) / rate
+    # 前半段静音，后半段正弦波
+    signal = np.where(t < seconds / 2, 0, amplitude * np.sin(2 * np.pi * 440 * t))
+    frames = np.repeat(signal, channels)
+    if sampwidth == 1:
+        data = (frames * 127 + 128).astype(np.uint8).tobytes()
+    elif sampwidth == 3:
+        ints = (frames * (2 ** 23 - 1)).astype('<i4')
+        data = ints.view(np.uint8).reshape(-1, 4)[:, :3].tobytes()
+    else:
+        data = (frames * 32767).astype('<i2').tobytes()
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as w:
+        w.setnchannels(channels)
+        w.setsampwidth(sampwidth)
+        w.setframerate(rate)
+        w.writeframes(data)
+    return buffer.getvalue()
+
+
+def test_compute_peaks_matches_naive_reduction():
+    rng = np.random.default_rng(0)
+    samples = rng.uniform(-1, 1, 2 * 10007).astype(np.float32)
+    chunks = [samples[i:i + 999] for i in range(0, len(samples), 999)]
+
+    peaks = compute_peaks(2, 10007, iter(chunks), 100)
+    per_bin = -(-10007 // 100) * 2
+    expected_min = [samples[i:i + per_bin].min() for i in range(0, len(samples), per_bin)]
+    expected_max = [samples[i:i + per_bin].max() for i in range(0, len(samples), per_bin)]
+    assert peaks.dtype == np.int8 and len(peaks) == 2 * len(expected_min) <= 200
+    assert np.array_equal(peaks[0::2], np.round(np.array(expected_min) * 127).astype(np.int8))
+    assert np.array_equal(peaks[1::2], np.round(np.array(expected_max) * 127).astype(np.int8))
+
+    # 总帧数未知时边读边归约，区间边界近似，整体最值不变
+    streamed = compute_peaks(2, None, iter(chunks), 100)
+    assert 90 <= len(streamed) // 2 <= 100
+    assert streamed[0::2].min() == peaks[0::2].min() and streamed[1::2].max() == peaks[1::2].max()
+    # 帧数少于区间数时每帧一组，与已知总帧数时相同
+    tiny = [np.array([0.5, -0.5, 0.25], np.float32)]
+    assert np.array_equal(compute_peaks(1, None, iter(tiny), 100), compute_peaks(1, 3, iter(tiny), 100))
+    assert len(compute_peaks(1, 3, iter([np.zeros(3, np.float32)]), 100)) == 6
+    assert len(compute_peaks(1, None, iter([]), 100)) == 0
+
+
+def test_decodes_wav_sample_widths(tmp_path):
+    for sampwidth in (1, 2, 3):
+        source = tmp_path / f'{sampwidth}.wav'
+        source.write_bytes(sine_wav(sampwidth=sampwidth))
+        target = tmp_path / 'waveforms' / f'{sampwidth}.peaks'
+
+        assert build_waveform(str(source), str(target), 200) == 200
+        peaks = np.frombuffer(target.read_bytes(), np.int8)
+        assert np.abs(peaks[:200]).max() <= 1
+        assert abs(peaks[200::2].min() + 64) <= 2 and abs(peaks[201::2].max() - 64) <= 2
+
+
+def test_uploaded_song_gets_waveform(app, client, static_root):
+    make_user('alice')
+    make_user('bob')
+    login(client, 'alice')
+    client.post('/upload', data={
+        'title': 'Song', 'artist': 'Artist', 'visibility': 'private',
+        'audio_file': (io.BytesIO(sine_wav()), 'song.wav'),
+    }, content_type='multipart/form-data')
+    song = Song.query.one()
+    assert client.get(f'/song/{song.id}/waveform').status_code == 404
+
+    run_pending()
+    res = client.get(f'/song/{song.id}/waveform')
+    assert res.status_code == 200 and len(res.data) == 2 * app.config['WAVEFORM_PEAKS']
+    assert res.headers['ETag'] == f'"{os.path.basename(song.file_path)[:-4]}"'
+    assert res.cache_control.private and res.cache_control.no_cache
+    url = client.get(f'/api/song/{song.id}').get_json()['waveform']
+    assert url == f'/song/{song.id}/waveform?v={os.path.basename(song.file_path)[:-4]}'
+    res = client.get(url)
+    assert res.cache_control.private and res.cache_control.immutable and not res.cache_control.no_cache
+
+    client.get('/auth/logout')
+    login(client, 'bob')
+    assert client.get(f'/song/{song.id}/waveform').status_code == 404
+    assert client.get(url).status_code == 404
+    client.get('/auth/logout')
+
+    # 删除歌曲时随音频一起删除
+    login(client, 'alice')
+    client.post(f'/delete_song/{song.id}')
+    assert not os.path.exists(static_root / waveform_path(song.file_path))
+
+
+def test_pluggable_decoders_and_backfill(app, client, static_root, monkeypatch):
+    def fake_mp3(path):
+        return 1, 4, iter([np.array([0, 1, -1, 0.5], np.float32)])
+
+    monkeypatch.setitem(WAVEFORM_DECODERS, 'mp3', fake_mp3)
+    monkeypatch.delitem(WAVEFORM_DECODERS, 'ogg')
+    user = make_user('alice')
+    for name, data in [('a.mp3', b'ID3'), ('b.wav', sine_wav()), ('c.ogg', b'OggS'), ('missing.wav', None)]:
+        if data is not None:
+            (static_root / 'uploads' / 'audio' / name).write_bytes(data)
+        db.session.add(Song(title=name, artist='Artist', file_path=f'uploads/audio/{name}', user_id=user.id))
+    db.session.commit()
+    assert not any(path.endswith('.peaks') for path in upload_manifest.files())
+
+    result = app.test_cli_runner().invoke(args=['waveforms', 'backfill', '--workers', '2'])
+    assert result.exit_code == 0, result.output
+    assert 'uploads/audio/c.ogg: No waveform decoder for .ogg' in result.output
+    assert '已处理 2 个音频，失败 1 个' in result.output
+    peaks = np.frombuffer((static_root / waveform_path('uploads/audio/a.mp3')).read_bytes(), np.int8)
+    assert peaks.tolist() == [0, 0, 127, 127, -127, -127, 64, 64]
+    # 写出的波形记入上传清单
+    assert {waveform_path('uploads/audio/a.mp3'), waveform_path('uploads/audio/b.wav')} <= upload_manifest.files()
+
+    result = app.test_cli_runner().invoke(args=['waveforms', 'backfill'])
+    assert '已处理 0 个音频，失败 1 个' in result.output
+
+
+FAKE_FFMPEG = """#!{python}
+import sys
+source = sys.argv[sys.argv.index('-i') + 1]
+data = open(source, 'rb').read()
+if not data.startswith(b'PCM'):
+    sys.stderr.write('Invalid data found when processing input')
+    sys.exit(1)
+for i in range(3, len(data), 1000):
+    sys.stdout.buffer.write(data[i:i + 1000])
+"""
+
+
+def test_ffmpeg_output_is_read_in_blocks(tmp_path, monkeypatch):
+    import sys
+    script = tmp_path / 'ffmpeg'
+    script.write_text(FAKE_FFMPEG.format(python=sys.executable))
+    script.chmod(0o755)
+    monkeypatch.setattr('app.waveform.shutil.which', lambda name: str(script))
+    monkeypatch.setattr('app.waveform.DECODE_FRAMES', 256)
+
+    samples = np.sin(np.arange(8000) / 10) * 0.5
+    source = tmp_path / 'a.mp3'
+    source.write_bytes(b'PCM' + (samples * 32767).astype('<i2').tobytes())
+    channels, total_frames, chunks = decode_ffmpeg(str(source))
+    assert (channels, total_frames) == (1, None)
+    blocks = list(chunks)
+    assert len(blocks) > 1 and max(len(block) for block in blocks) <= 256
+    assert np.allclose(np.concatenate(blocks), samples, atol=1e-4)
+    assert build_waveform(str(source), str(tmp_path / 'a.peaks'), 100) <= 100
+
+    (tmp_path / 'bad.mp3').write_bytes(b'garbage')
+    try:
+        build_waveform(str(tmp_path / 'bad.mp3'), str(tmp_path / 'bad.peaks'), 100)
+        assert False, 'expected UnsupportedAudio'
+    except UnsupportedAudio as e:
+        assert 'Invalid data' in str(e)
+    assert not (tmp_path / 'bad.peaks').exists()